@@ -0,0 +1,653 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, asyncio service module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.aioservice
+:synopsis: Provides asyncio counterparts of the d2lvalence_util.service functions.
+
+Every public route function in :py:mod:`d2lvalence_util.service` has a
+coroutine function of the same name and signature here, so that::
+
+    r = service.get_classlist(uc, org_unit_id)
+
+becomes::
+
+    r = await aioservice.get_classlist(uc, org_unit_id, d2lsession=s)
+
+where `s` is a :class:`D2LAsyncSession` (calls made without one, and with no
+default session installed, share one session per event loop, closed as
+`asyncio.run()` shuts the loop down). The coroutines build their requests
+with the very same route templates as the `service` module, and hand back the
+same `d2lvalence_util.data` structures: each call runs the `service` function
+once to capture the outgoing request, sends that request over the asynchronous
+transport, then runs the `service` function again to digest the response.
+
+Calls go through the rate limiter and retry policy installed for the process
+in the `service` module, waiting out limits, `Retry-After` pauses and backoff
+without blocking the event loop. A call given a `d2ldownload` streams the
+response body into the download a chunk at a time.
+
+This module depends on the `aiohttp` package.
+"""
+import asyncio
+import contextlib
+import functools
+import weakref
+import urllib.parse
+
+import aiohttp      # for making asynchronous HTTP requests of the back-end service
+import requests     # for preparing (and signing) requests, and carrying responses
+import requests.structures
+import yarl         # for passing signed URLs to aiohttp without re-quoting them
+
+import d2lvalence_util.data as d2ldata
+import d2lvalence_util.retry as d2lretry
+import d2lvalence_util.service as d2lservice
+import d2lvalence_util.session as d2lsession
+
+# keyword args the requests library takes when sending a request, rather than
+# when building one
+_SEND_KWARGS = ('verify', 'timeout', 'stream', 'proxies', 'cert', 'allow_redirects')
+
+# async session used for calls made without an explicit `d2lsession` keyword
+# arg; None means the calls on each event loop share a session of their own
+_default_session = None
+
+# event loop -> (session its calls share, async generator that closes it)
+_loop_sessions = weakref.WeakKeyDictionary()
+
+
+class _Captured(Exception):
+    """Carries an outgoing request back up out of a `service` function."""
+    def __init__(self,host,method=None,url=None,kwargs=None,prepared=None):
+        Exception.__init__(self,method,url)
+        self.host = host
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs or {}
+        self.prepared = prepared
+
+class _CaptureSession(d2lsession.D2LSession):
+    # Deliberately skips D2LSession.__init__: this session never opens a
+    # connection, it only intercepts the request the service layer builds.
+    transmits = False
+
+    def __init__(self,host):
+        self.host = host
+
+    def request(self,method,url,**kwargs):
+        raise _Captured(self.host,method=method,url=url,kwargs=kwargs)
+
+    def send(self,p,**kwargs):
+        raise _Captured(self.host,prepared=p,kwargs=kwargs)
+
+class _ReplaySession(d2lsession.D2LSession):
+    # Hands the response fetched by the async transport to the service layer.
+    transmits = False
+    replays = True
+
+    def __init__(self,host,response):
+        self.host = host
+        self.response = response
+
+    def request(self,method,url,**kwargs):
+        return self.response
+
+    def send(self,p,**kwargs):
+        return self.response
+
+
+class D2LAsyncSession(object):
+    """Asynchronous, connection-pooling transport for the `aioservice` functions.
+
+    At most `max_in_flight` requests made through one session are outstanding
+    at any time; further calls wait their turn without holding a connection or
+    a thread. Use the session as an async context manager, or `await close()`
+    when done with it.
+    """
+    def __init__(self,host=None,max_in_flight=100,limit_per_host=0):
+        """Construct a new async session.
+
+        :param host:
+            Host (and optional port) this session serves; if provided, calls
+            for other hosts get refused.
+        :param max_in_flight:
+            Maximum number of requests outstanding at once.
+        :param limit_per_host:
+            Maximum number of connections open to any one host (0 for no
+            limit beyond `max_in_flight`).
+        """
+        self.host = host
+        self.max_in_flight = max_in_flight
+        self.limit_per_host = limit_per_host
+        self._client = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self,*exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._client:
+            await self._client.close()
+            self._client = None
+
+    def check_host(self,uc):
+        if self.host and self.host != uc.host:
+            raise ValueError('Session serves host {0}, not {1}.'.format(self.host,uc.host))
+        return True
+
+    def _get_client(self):
+        if not self._client:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight,
+                                             limit_per_host=self.limit_per_host)
+            self._client = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._client
+
+    async def _open(self,captured,headers=None):
+        # send a captured request (with any extra `headers`), returning the
+        # aiohttp response with its body still to read
+        client = self._get_client()
+        p = captured.prepared
+        kw = dict(captured.kwargs)
+        send_kw = {}
+        for k in _SEND_KWARGS:
+            if k in kw:
+                send_kw[k] = kw.pop(k)
+        if not p:
+            # prepare as late as possible, so that the request signature's
+            # timestamp doesn't go stale while the call waits its turn
+            if headers:
+                kw['headers'] = dict(kw.get('headers') or {})
+                kw['headers'].update(headers)
+            p = requests.Request(captured.method, captured.url, **kw).prepare()
+        elif headers:
+            p = p.copy()
+            p.headers.update(headers)
+
+        headers = dict(p.headers)
+        body = p.body
+        if body is None or isinstance(body, (bytes, str)):
+            headers.pop('Content-Length', None)
+        else:
+            # a streaming body (see d2lvalence_util.multipart): keep its
+            # Content-Length, and hand it over a chunk at a time
+            body = _aiter_body(body)
+        ssl = None
+        if send_kw.get('verify', True) is False:
+            ssl = False
+        timeout = send_kw.get('timeout')
+        if isinstance(timeout, tuple):
+            timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        elif timeout is not None:
+            timeout = aiohttp.ClientTimeout(total=timeout)
+        opts = {}
+        if timeout is not None:
+            opts['timeout'] = timeout
+
+        resp = await client.request(p.method,
+                                    yarl.URL(p.url, encoded=True),
+                                    headers=headers,
+                                    data=body,
+                                    ssl=ssl,
+                                    allow_redirects=send_kw.get('allow_redirects', True),
+                                    **opts)
+        r = requests.Response()
+        r.status_code = resp.status
+        r.reason = resp.reason
+        r.url = str(resp.url)
+        r.headers = requests.structures.CaseInsensitiveDict(resp.headers)
+        r.encoding = resp.charset
+        r.request = p
+        return resp, r
+
+    @contextlib.asynccontextmanager
+    async def _exchange(self,captured,headers=None):
+        # send a captured request under the process-wide rate limiter and
+        # retry policy (see d2lvalence_util.service), yielding the aiohttp
+        # response, body unread, and its requests.Response counterpart
+        self._get_client()
+        limiter = d2lservice.get_rate_limiter()
+        policy = d2lservice.get_retry_policy()
+        method = captured.prepared.method if captured.prepared else captured.method
+        url = captured.prepared.url if captured.prepared else captured.url
+        route = urllib.parse.urlsplit(url).path
+        marks = d2lretry.mark_streams(captured.kwargs)
+        async with self._semaphore:
+            if policy:
+                policy.begin()
+            attempt = 0
+            while True:
+                resp = r = exc = None
+                slot = None
+                if limiter:
+                    slot = await limiter.acquire_async(captured.host,route)
+                try:
+                    resp, r = await self._open(captured,headers)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    exc = e
+                finally:
+                    if slot:
+                        limiter.release(slot,r)
+                delay = None
+                if policy:
+                    delay = policy.next_delay(method,route,attempt,r=r,exc=_requests_error(exc))
+                if delay is None:
+                    if exc is not None:
+                        raise exc
+                    break
+                if resp is not None:
+                    resp.release()
+                await asyncio.sleep(delay)
+                d2lretry.rewind_streams(marks)
+                attempt += 1
+            try:
+                yield resp, r
+            finally:
+                resp.release()
+
+    async def dispatch(self,captured):
+        """Send a captured request, returning the response as a
+        `requests.Response` for the service layer to digest."""
+        async with self._exchange(captured) as (resp, r):
+            r._content = await resp.read()
+            r._content_consumed = True
+        return r
+
+    async def download(self,captured,dl):
+        """Send a captured request, streaming the response body into a
+        `d2lvalence_util.data.D2LDownload` a chunk at a time; a transfer that
+        breaks off part way gets picked back up with a Range request, as the
+        `service` module does. Returns the download."""
+        offset = dl.begin()
+        try:
+            while True:
+                headers = None
+                if offset:
+                    headers = d2lservice._ranged_kwargs({},dl,offset)['headers']
+                r = None
+                try:
+                    async with self._exchange(captured,headers) as (resp, r):
+                        if offset and d2lservice._range_complete(r,offset):
+                            dl.Size = offset
+                            break
+                        if r.status_code >= 400:
+                            r._content = await resp.read()
+                            r.raise_for_status()
+                        if r.status_code == 206 and d2lservice._encoded(r):
+                            raise IOError('Server sent an encoded range of the file, which cannot be written into place.')
+                        if r.status_code == 206:
+                            offset = d2lservice._range_start(r)
+                        else:
+                            offset = 0
+                        dl.seek(offset)
+                        dl.accept(r,offset)
+                        async for chunk in resp.content.iter_chunked(dl.chunk_size):
+                            dl.write(chunk)
+                except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    # a transfer that never started, or whose encoded body
+                    # doesn't map onto a byte range, can't be picked back up
+                    if r is None or dl.Resumes >= dl.max_resumes or d2lservice._encoded(r):
+                        raise
+                else:
+                    if dl.Size is None or dl.Offset >= dl.Size:
+                        break
+                    if dl.Resumes >= dl.max_resumes:
+                        raise IOError('Download ended after {0} of {1} bytes.'.format(dl.Offset,dl.Size))
+                dl.resumed()
+                offset = dl.Offset
+            dl.finish()
+        finally:
+            dl.end()
+        return dl
+
+
+def _requests_error(e):
+    # the requests exception the retry policy would see for a transport error
+    if e is None:
+        return None
+    if isinstance(e, aiohttp.ConnectionTimeoutError):
+        return requests.exceptions.ConnectTimeout(str(e))
+    if isinstance(e, asyncio.TimeoutError):
+        return requests.exceptions.Timeout(str(e))
+    if isinstance(e, aiohttp.ClientConnectionError):
+        return requests.exceptions.ConnectionError(str(e))
+    return e
+
+
+async def _aiter_body(body):
+    # the transport may hang on to a chunk after write() returns, so copy out
+    # memoryview chunks that point into a file's memory map
+    for chunk in body:
+        yield bytes(chunk)
+
+
+def set_default_session(s=None):
+    """Install a :class:`D2LAsyncSession` for all calls made without an
+    explicit `d2lsession` keyword argument."""
+    global _default_session
+    if s and not isinstance(s, D2LAsyncSession):
+        raise TypeError('If not None, session object must implement d2lvalence_util.aioservice.D2LAsyncSession')
+    _default_session = s
+
+def get_default_session():
+    return _default_session
+
+async def _closing(loop,s):
+    try:
+        yield
+    finally:
+        del _loop_sessions[loop]
+        await s.close()
+
+async def _loop_session():
+    # the session calls on the running event loop share when given none; it
+    # gets closed as the loop shuts down, since asyncio.run() finalizes the
+    # async generators still suspended then
+    loop = asyncio.get_running_loop()
+    entry = _loop_sessions.get(loop)
+    if entry is None:
+        s = D2LAsyncSession()
+        closer = _closing(loop,s)
+        await closer.__anext__()
+        entry = _loop_sessions[loop] = (s, closer)
+    return entry[0]
+
+def _mirror(fn):
+    @functools.wraps(fn)
+    async def afn(uc,*args,**kwargs):
+        s = _default_session
+        if 'd2lsession' in kwargs:
+            s = kwargs['d2lsession']
+            del kwargs['d2lsession']
+        if s and not isinstance(s, D2LAsyncSession):
+            raise TypeError('If not None, session object must implement d2lvalence_util.aioservice.D2LAsyncSession')
+        if not s:
+            s = await _loop_session()
+        s.check_host(uc)
+        dl = kwargs.get('d2ldownload')
+        try:
+            return fn(uc,*args,d2lsession=_CaptureSession(uc.host),**kwargs)
+        except _Captured as c:
+            if dl is not None:
+                return await s.download(c,dl)
+            r = await s.dispatch(c)
+        return fn(uc,*args,d2lsession=_ReplaySession(uc.host,r),**kwargs)
+    return afn
+
+## API Properties functions
+get_versions_for_product_component = _mirror(d2lservice.get_versions_for_product_component)
+get_version_for_product_component = _mirror(d2lservice.get_version_for_product_component)
+get_all_versions = _mirror(d2lservice.get_all_versions)
+check_versions = _mirror(d2lservice.check_versions)
+
+## User functions
+delete_user = _mirror(d2lservice.delete_user)
+get_users = _mirror(d2lservice.get_users)
+get_user = _mirror(d2lservice.get_user)
+get_whoami = _mirror(d2lservice.get_whoami)
+create_user = _mirror(d2lservice.create_user)
+update_user = _mirror(d2lservice.update_user)
+get_user_activation = _mirror(d2lservice.get_user_activation)
+update_user_activation = _mirror(d2lservice.update_user_activation)
+delete_my_profile_image = _mirror(d2lservice.delete_my_profile_image)
+delete_profile_image_by_profile_id = _mirror(d2lservice.delete_profile_image_by_profile_id)
+delete_profile_image_by_user_id = _mirror(d2lservice.delete_profile_image_by_user_id)
+get_profile_by_profile_id = _mirror(d2lservice.get_profile_by_profile_id)
+get_profile_image_by_profile_id = _mirror(d2lservice.get_profile_image_by_profile_id)
+get_profile_by_user_id = _mirror(d2lservice.get_profile_by_user_id)
+get_profile_image_by_user_id = _mirror(d2lservice.get_profile_image_by_user_id)
+get_my_profile = _mirror(d2lservice.get_my_profile)
+get_my_profile_image = _mirror(d2lservice.get_my_profile_image)
+update_my_profile = _mirror(d2lservice.update_my_profile)
+update_profile_image_by_user_id = _mirror(d2lservice.update_profile_image_by_user_id)
+update_profile_image_by_profile_id = _mirror(d2lservice.update_profile_image_by_profile_id)
+update_my_profile_image = _mirror(d2lservice.update_my_profile_image)
+delete_password_for_user = _mirror(d2lservice.delete_password_for_user)
+send_password_reset_email_for_user = _mirror(d2lservice.send_password_reset_email_for_user)
+update_password_for_user = _mirror(d2lservice.update_password_for_user)
+get_all_roles = _mirror(d2lservice.get_all_roles)
+get_role = _mirror(d2lservice.get_role)
+
+## Org structure
+get_organization_info = _mirror(d2lservice.get_organization_info)
+get_orgunit_children = _mirror(d2lservice.get_orgunit_children)
+get_orgunit_descendants = _mirror(d2lservice.get_orgunit_descendants)
+get_orgunit_parents = _mirror(d2lservice.get_orgunit_parents)
+get_orgunit_properties = _mirror(d2lservice.get_orgunit_properties)
+create_custom_orgunit = _mirror(d2lservice.create_custom_orgunit)
+update_custom_orgunit = _mirror(d2lservice.update_custom_orgunit)
+get_all_outypes = _mirror(d2lservice.get_all_outypes)
+get_outype = _mirror(d2lservice.get_outype)
+
+## Enrollments
+get_classlist = _mirror(d2lservice.get_classlist)
+delete_user_enrollment_in_orgunit = _mirror(d2lservice.delete_user_enrollment_in_orgunit)
+get_my_enrollments = _mirror(d2lservice.get_my_enrollments)
+get_enrolled_users_for_orgunit = _mirror(d2lservice.get_enrolled_users_for_orgunit)
+get_enrolled_user_in_orgunit = _mirror(d2lservice.get_enrolled_user_in_orgunit)
+get_all_enrollments_for_user = _mirror(d2lservice.get_all_enrollments_for_user)
+create_enrollment_for_user = _mirror(d2lservice.create_enrollment_for_user)
+delete_group_category_from_orgunit = _mirror(d2lservice.delete_group_category_from_orgunit)
+delete_group_from_orgunit = _mirror(d2lservice.delete_group_from_orgunit)
+delete_user_from_group = _mirror(d2lservice.delete_user_from_group)
+get_group_categories_for_orgunit = _mirror(d2lservice.get_group_categories_for_orgunit)
+
+## Course offerings
+delete_course_offering = _mirror(d2lservice.delete_course_offering)
+get_course_schemas = _mirror(d2lservice.get_course_schemas)
+get_course_offering = _mirror(d2lservice.get_course_offering)
+create_course_offering = _mirror(d2lservice.create_course_offering)
+update_course_offering = _mirror(d2lservice.update_course_offering)
+delete_course_template = _mirror(d2lservice.delete_course_template)
+get_course_template = _mirror(d2lservice.get_course_template)
+get_course_templates_schema = _mirror(d2lservice.get_course_templates_schema)
+create_course_template = _mirror(d2lservice.create_course_template)
+update_course_template = _mirror(d2lservice.update_course_template)
+
+## Grades
+delete_grade_object_for_org = _mirror(d2lservice.delete_grade_object_for_org)
+get_all_grade_objects_for_org = _mirror(d2lservice.get_all_grade_objects_for_org)
+get_grade_object_for_org = _mirror(d2lservice.get_grade_object_for_org)
+create_grade_object_for_org = _mirror(d2lservice.create_grade_object_for_org)
+update_grade_object_for_org = _mirror(d2lservice.update_grade_object_for_org)
+delete_grade_category_for_orgunit = _mirror(d2lservice.delete_grade_category_for_orgunit)
+get_all_grade_categories_for_orgunit = _mirror(d2lservice.get_all_grade_categories_for_orgunit)
+get_grade_category_for_orgunit = _mirror(d2lservice.get_grade_category_for_orgunit)
+create_grade_category_for_orgunit = _mirror(d2lservice.create_grade_category_for_orgunit)
+get_all_grade_schemes_for_orgunit = _mirror(d2lservice.get_all_grade_schemes_for_orgunit)
+get_grade_scheme_for_orgunit = _mirror(d2lservice.get_grade_scheme_for_orgunit)
+get_my_final_grade_value_for_org = _mirror(d2lservice.get_my_final_grade_value_for_org)
+get_final_grade_value_for_user_in_org = _mirror(d2lservice.get_final_grade_value_for_user_in_org)
+get_grade_value_for_user_in_org = _mirror(d2lservice.get_grade_value_for_user_in_org)
+get_my_grade_value_for_org = _mirror(d2lservice.get_my_grade_value_for_org)
+get_all_my_grade_values_for_org = _mirror(d2lservice.get_all_my_grade_values_for_org)
+get_all_grade_values_for_user_in_org = _mirror(d2lservice.get_all_grade_values_for_user_in_org)
+recalculate_final_grade_value_for_user_in_org = _mirror(d2lservice.recalculate_final_grade_value_for_user_in_org)
+recalculate_all_final_grade_values_for_org = _mirror(d2lservice.recalculate_all_final_grade_values_for_org)
+update_final_adjusted_grade_value_for_user_in_org = _mirror(d2lservice.update_final_adjusted_grade_value_for_user_in_org)
+update_grade_value_for_user_in_org = _mirror(d2lservice.update_grade_value_for_user_in_org)
+delete_course_completion = _mirror(d2lservice.delete_course_completion)
+get_all_course_completions_for_org = _mirror(d2lservice.get_all_course_completions_for_org)
+get_all_course_completions_for_user = _mirror(d2lservice.get_all_course_completions_for_user)
+create_course_completion_for_org = _mirror(d2lservice.create_course_completion_for_org)
+update_course_completion_for_org = _mirror(d2lservice.update_course_completion_for_org)
+
+## Dropbox
+get_all_dropbox_folders_for_orgunit = _mirror(d2lservice.get_all_dropbox_folders_for_orgunit)
+get_dropbox_folder_for_orgunit = _mirror(d2lservice.get_dropbox_folder_for_orgunit)
+create_my_submission_for_dropbox = _mirror(d2lservice.create_my_submission_for_dropbox)
+create_submission_for_group_dropbox_folder = _mirror(d2lservice.create_submission_for_group_dropbox_folder)
+get_submissions_for_dropbox_folder = _mirror(d2lservice.get_submissions_for_dropbox_folder)
+
+## Lockers
+delete_my_locker_item = _mirror(d2lservice.delete_my_locker_item)
+delete_locker_item = _mirror(d2lservice.delete_locker_item)
+get_my_locker_item = _mirror(d2lservice.get_my_locker_item)
+get_locker_item = _mirror(d2lservice.get_locker_item)
+create_my_locker_folder = _mirror(d2lservice.create_my_locker_folder)
+create_locker_folder = _mirror(d2lservice.create_locker_folder)
+create_my_locker_file = _mirror(d2lservice.create_my_locker_file)
+create_locker_file = _mirror(d2lservice.create_locker_file)
+rename_my_locker_folder = _mirror(d2lservice.rename_my_locker_folder)
+rename_locker_folder = _mirror(d2lservice.rename_locker_folder)
+delete_group_locker_item = _mirror(d2lservice.delete_group_locker_item)
+get_group_locker_category = _mirror(d2lservice.get_group_locker_category)
+get_group_locker_item = _mirror(d2lservice.get_group_locker_item)
+setup_group_locker_category = _mirror(d2lservice.setup_group_locker_category)
+create_group_locker_folder = _mirror(d2lservice.create_group_locker_folder)
+create_group_locker_file = _mirror(d2lservice.create_group_locker_file)
+rename_group_locker_folder = _mirror(d2lservice.rename_group_locker_folder)
+
+## Discussion forum routes
+delete_discussion_forum = _mirror(d2lservice.delete_discussion_forum)
+get_discussion_forums = _mirror(d2lservice.get_discussion_forums)
+get_discussion_forum = _mirror(d2lservice.get_discussion_forum)
+create_discussion_forum = _mirror(d2lservice.create_discussion_forum)
+update_discussion_forum = _mirror(d2lservice.update_discussion_forum)
+delete_discussion_topic = _mirror(d2lservice.delete_discussion_topic)
+delete_discussion_topic_group_restriction = _mirror(d2lservice.delete_discussion_topic_group_restriction)
+get_discussion_topics = _mirror(d2lservice.get_discussion_topics)
+get_discussion_topic = _mirror(d2lservice.get_discussion_topic)
+get_discussion_topics_group_restrictions = _mirror(d2lservice.get_discussion_topics_group_restrictions)
+create_discussion_topic = _mirror(d2lservice.create_discussion_topic)
+update_discussion_topic = _mirror(d2lservice.update_discussion_topic)
+update_group_restrictions_list = _mirror(d2lservice.update_group_restrictions_list)
+delete_discussion_post = _mirror(d2lservice.delete_discussion_post)
+delete_my_rating_for_discussion_post = _mirror(d2lservice.delete_my_rating_for_discussion_post)
+get_discussion_posts = _mirror(d2lservice.get_discussion_posts)
+get_discussion_post = _mirror(d2lservice.get_discussion_post)
+get_discussion_post_approval_status = _mirror(d2lservice.get_discussion_post_approval_status)
+get_discussion_post_flag_status = _mirror(d2lservice.get_discussion_post_flag_status)
+get_discussion_post_rating = _mirror(d2lservice.get_discussion_post_rating)
+get_discussion_my_post_rating = _mirror(d2lservice.get_discussion_my_post_rating)
+get_discussion_post_read_status = _mirror(d2lservice.get_discussion_post_read_status)
+create_discussion_post = _mirror(d2lservice.create_discussion_post)
+update_discussion_post = _mirror(d2lservice.update_discussion_post)
+set_discussion_post_approval_status = _mirror(d2lservice.set_discussion_post_approval_status)
+set_discussion_post_flag_status = _mirror(d2lservice.set_discussion_post_flag_status)
+set_discussion_post_my_rating = _mirror(d2lservice.set_discussion_post_my_rating)
+set_discussion_post_read_status = _mirror(d2lservice.set_discussion_post_read_status)
+
+## News routes
+get_my_feed = _mirror(d2lservice.get_my_feed)
+delete_news_item_for_orgunit = _mirror(d2lservice.delete_news_item_for_orgunit)
+delete_attachment_for_news_item_in_orgunit = _mirror(d2lservice.delete_attachment_for_news_item_in_orgunit)
+get_news_for_orgunit = _mirror(d2lservice.get_news_for_orgunit)
+get_news_item_for_orgunit = _mirror(d2lservice.get_news_item_for_orgunit)
+get_news_item_attachment_for_orgunit = _mirror(d2lservice.get_news_item_attachment_for_orgunit)
+dismiss_news_item_for_orgunit = _mirror(d2lservice.dismiss_news_item_for_orgunit)
+restore_news_item_for_orgunit = _mirror(d2lservice.restore_news_item_for_orgunit)
+create_news_item_for_orgunit = _mirror(d2lservice.create_news_item_for_orgunit)
+create_attachment_for_newsitem = _mirror(d2lservice.create_attachment_for_newsitem)
+
+## Calendar routes
+delete_calender_event_for_org = _mirror(d2lservice.delete_calender_event_for_org)
+get_calendar_event_for_org = _mirror(d2lservice.get_calendar_event_for_org)
+get_all_calendar_events_for_org = _mirror(d2lservice.get_all_calendar_events_for_org)
+
+## Content routes
+delete_content_module = _mirror(d2lservice.delete_content_module)
+delete_content_topic = _mirror(d2lservice.delete_content_topic)
+get_content_module = _mirror(d2lservice.get_content_module)
+get_content_module_structure = _mirror(d2lservice.get_content_module_structure)
+get_content_root_modules = _mirror(d2lservice.get_content_root_modules)
+get_content_topic = _mirror(d2lservice.get_content_topic)
+create_content_new_module = _mirror(d2lservice.create_content_new_module)
+create_content_new_topic_link = _mirror(d2lservice.create_content_new_topic_link)
+create_content_new_topic_file = _mirror(d2lservice.create_content_new_topic_file)
+create_content_root_module = _mirror(d2lservice.create_content_root_module)
+update_content_module = _mirror(d2lservice.update_content_module)
+update_content_topic = _mirror(d2lservice.update_content_topic)
+get_learning_objects_by_search = _mirror(d2lservice.get_learning_objects_by_search)
+get_learning_object = _mirror(d2lservice.get_learning_object)
+get_learning_object_link = _mirror(d2lservice.get_learning_object_link)
+get_learning_object_properties = _mirror(d2lservice.get_learning_object_properties)
+get_learning_object_version = _mirror(d2lservice.get_learning_object_version)
+get_learning_object_link_version = _mirror(d2lservice.get_learning_object_link_version)
+get_learning_object_metadata_version = _mirror(d2lservice.get_learning_object_metadata_version)
+get_learning_object_properties_version = _mirror(d2lservice.get_learning_object_properties_version)
+delete_learning_object = _mirror(d2lservice.delete_learning_object)
+update_learning_object = _mirror(d2lservice.update_learning_object)
+update_learning_object_properties = _mirror(d2lservice.update_learning_object_properties)
+update_learning_object_properties_version = _mirror(d2lservice.update_learning_object_properties_version)
+create_new_learning_object = _mirror(d2lservice.create_new_learning_object)
+
+## ePortfolio routes
+get_ep_import_task_status = _mirror(d2lservice.get_ep_import_task_status)
+start_ep_import_task = _mirror(d2lservice.start_ep_import_task)
+start_ep_export_all_task = _mirror(d2lservice.start_ep_export_all_task)
+start_ep_export_task = _mirror(d2lservice.start_ep_export_task)
+get_ep_export_task_status = _mirror(d2lservice.get_ep_export_task_status)
+get_ep_export_task_package = _mirror(d2lservice.get_ep_export_task_package)
+
+## LTI routes
+get_lti_tool_providers_for_orgunit = _mirror(d2lservice.get_lti_tool_providers_for_orgunit)
+get_lti_tool_provider_info = _mirror(d2lservice.get_lti_tool_provider_info)
+
+
+## Paged result set iterators
+async def _iter_paged(fetch,wrap,read_ahead=False):
+    page = await fetch(None)
+    while page:
+        nxt = None
+        more = page.HasMoreItems and page.Bookmark
+        if more and read_ahead:
+            nxt = asyncio.ensure_future(fetch(more))
+        items = page.Items
+        page = None
+        for i in range(len(items)):
+            yield wrap(items[i])
+        if not more:
+            break
+        elif nxt:
+            page = await nxt
+        else:
+            page = await fetch(more)
+
+def iter_users(uc,read_ahead=False,ver='1.0',**kwargs):
+    async def fetch(bookmark):
+        return await get_users(uc,bookmark=bookmark,ver=ver,**d2lservice._paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.UserData.adopt,read_ahead=read_ahead)
+
+def iter_my_enrollments(uc,org_unit_type_id=None,read_ahead=False,ver='1.0',**kwargs):
+    async def fetch(bookmark):
+        return await get_my_enrollments(uc,org_unit_type_id=org_unit_type_id,bookmark=bookmark,ver=ver,**d2lservice._paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.MyOrgUnitInfo.adopt,read_ahead=read_ahead)
+
+def iter_enrolled_users_for_orgunit(uc,org_unit_id,role_id=None,read_ahead=False,ver='1.0',**kwargs):
+    async def fetch(bookmark):
+        return await get_enrolled_users_for_orgunit(uc,org_unit_id,role_id=role_id,bookmark=bookmark,ver=ver,**d2lservice._paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.OrgUnitUser.adopt,read_ahead=read_ahead)
+
+def iter_all_enrollments_for_user(uc,user_id,org_unit_type_id=None,role_id=None,read_ahead=False,ver='1.0',**kwargs):
+    async def fetch(bookmark):
+        return await get_all_enrollments_for_user(uc,user_id,org_unit_type_id=org_unit_type_id,role_id=role_id,bookmark=bookmark,ver=ver,**d2lservice._paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.UserOrgUnit.adopt,read_ahead=read_ahead)
+
+def iter_all_course_completions_for_org(uc,org_unit_id,user_id=None,start_expiry=None,end_expiry=None,read_ahead=False,ver='1.1',**kwargs):
+    async def fetch(bookmark):
+        return await get_all_course_completions_for_org(uc,org_unit_id,user_id=user_id,start_expiry=start_expiry,end_expiry=end_expiry,bookmark=bookmark,ver=ver,**d2lservice._paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.CourseCompletion.adopt,read_ahead=read_ahead)
+
+def iter_all_course_completions_for_user(uc,user_id,start_expiry=None,end_expiry=None,read_ahead=False,ver='1.1',**kwargs):
+    async def fetch(bookmark):
+        return await get_all_course_completions_for_user(uc,user_id,start_expiry=start_expiry,end_expiry=end_expiry,bookmark=bookmark,ver=ver,**d2lservice._paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.CourseCompletion.adopt,read_ahead=read_ahead)
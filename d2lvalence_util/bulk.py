@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, bulk module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.bulk
+:synopsis: Provides helpers for fanning many D2L Valence calls out over a thread pool.
+"""
+import concurrent.futures   # for running service calls on a bounded thread pool
+
+import d2lvalence_util.service as d2lservice
+import d2lvalence_util.session as d2lsession
+
+
+class BulkResult(object):
+    """Outcome of one call made by :func:`run_bulk`.
+
+    `Index` is the position of the call's arguments in the input, `Args` the
+    argument tuple itself; exactly one of `Value` (what the service function
+    returned) and `Error` (the exception it raised) is meaningful, as
+    indicated by `ok`.
+    """
+    def __init__(self,index,args,value=None,error=None):
+        self.Index = index
+        self.Args = args
+        self.Value = value
+        self.Error = error
+
+    @property
+    def ok(self):
+        return self.Error is None
+
+    def __repr__(self):
+        if self.ok:
+            return 'BulkResult({0}, {1!r}, value={2!r})'.format(self.Index,self.Args,self.Value)
+        return 'BulkResult({0}, {1!r}, error={2!r})'.format(self.Index,self.Args,self.Error)
+
+
+def pooled_kwargs(uc,kwargs,max_workers=8):
+    """Prepare keyword arguments for a batch of service calls.
+
+    Returns a copy of `kwargs` and the session the batch should close once
+    done: the calls go over the `d2lsession` among `kwargs` if there is one,
+    else over the process's default session (see
+    `service.set_default_session`), and only failing both over a new
+    `session.D2LSession` sized for `max_workers` connections, returned as
+    the session to close (otherwise, None).
+    """
+    kw = dict(kwargs)
+    own = None
+    if 'd2lsession' not in kw and not d2lservice.get_default_session():
+        own = kw['d2lsession'] = d2lsession.D2LSession.fashion_D2LSession(uc,pool_maxsize=max_workers)
+    return kw, own
+
+
+def run_bulk(fn,uc,arg_tuples,max_workers=8,ordered=False,**kwargs):
+    """Call a service function once per argument tuple, on a bounded thread pool.
+
+    For example, to fetch the classlist for many org units::
+
+        for res in bulk.run_bulk(service.get_classlist, uc, [(ou,) for ou in org_unit_ids]):
+            if res.ok:
+                handle(res.Args[0], res.Value)
+
+    :param fn: Service function to call, as `fn(uc, *args, **kwargs)`.
+    :param uc: User context to make the calls with.
+    :param arg_tuples:
+        Iterable of argument tuples (a non-tuple item gets treated as a single
+        argument); consumed lazily, so it can be a generator.
+    :param max_workers: Number of calls to have running at once.
+    :param ordered:
+        If true, yield results in input order; otherwise, yield them as the
+        calls complete.
+    :param kwargs:
+        Keyword arguments passed down into every call. Unless a `d2lsession`
+        is among them or a default session is installed, the calls share a
+        new `session.D2LSession` sized for `max_workers` connections, closed
+        once the generator finishes (see :func:`pooled_kwargs`).
+
+    :returns: Generator of :class:`BulkResult`, one per argument tuple; a call
+              that raises produces a result carrying the exception rather than
+              aborting the batch.
+    """
+    kwargs, own = pooled_kwargs(uc,kwargs,max_workers)
+
+    def call(args):
+        return fn(uc,*args,**kwargs)
+
+    # keep a bounded window of calls submitted but not yet yielded, so that we
+    # never pull the whole input (or buffer the whole output) into memory
+    window = max_workers * 2
+    pending = {}
+    finished = {}
+    next_index = 0
+    source = iter(enumerate(arg_tuples))
+    exhausted = False
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                while True:
+                    while not exhausted and len(pending) + len(finished) < window:
+                        try:
+                            i, args = next(source)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        if not isinstance(args, tuple):
+                            args = (args,)
+                        pending[executor.submit(call, args)] = (i, args)
+                    if not pending:
+                        break
+
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for f in done:
+                        i, args = pending.pop(f)
+                        try:
+                            res = BulkResult(i,args,value=f.result())
+                        except Exception as e:
+                            res = BulkResult(i,args,error=e)
+                        if ordered:
+                            finished[i] = res
+                        else:
+                            yield res
+                    while next_index in finished:
+                        yield finished.pop(next_index)
+                        next_index += 1
+            finally:
+                for f in pending:
+                    f.cancel()
+    finally:
+        if own:
+            own.close()
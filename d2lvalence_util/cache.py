@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, cache module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.cache
+:synopsis: Provides a client-side cache of D2L Valence GET responses.
+"""
+import re
+import time
+import zlib         # for compressing response bodies kept on disk
+import sqlite3      # for the on-disk cache backend
+import threading
+import collections
+import urllib.parse  # for putting query parameters into a canonical form
+
+# routes whose data hardly ever changes, with the number of seconds a response
+# from each stays fresh
+REFERENCE_DATA_ROUTES = ((r'^/d2l/api/lp/[^/]+/roles/', 3600),
+                         (r'^/d2l/api/lp/[^/]+/outypes/', 3600),
+                         (r'^/d2l/api/lp/[^/]+/courses/schema$', 3600),
+                         (r'^/d2l/api/lp/[^/]+/coursetemplates/schema$', 3600),
+                         (r'^/d2l/api/lp/[^/]+/organization/info$', 3600),
+                         (r'^/d2l/api/versions/$', 3600),
+                         (r'^/d2l/api/[^/]+/versions/$', 3600))
+
+# routes with large responses that change now and then, to revalidate with a
+# conditional request every time rather than download again
+REVALIDATED_ROUTES = ((r'^/d2l/api/le/[^/]+/[^/]+/content/modules/[^/]+/structure/$', 0),
+                      (r'^/d2l/api/le/[^/]+/[^/]+/discussions/forums/[^/]+/topics/[^/]+/posts/$', 0),
+                      (r'^/d2l/api/le/[^/]+/[^/]+/news/$', 0),
+                      (r'^/d2l/api/le/[^/]+/[^/]+/calendar/events/$', 0))
+
+# routes a reporting job reads over and over, with the number of seconds a
+# response from each stays fresh: classlists, grade objects, categories and
+# schemes, and content trees
+REPORTING_ROUTES = ((r'^/d2l/api/le/[^/]+/[^/]+/classlist/$', 3600),
+                    (r'^/d2l/api/le/[^/]+/[^/]+/grades/(?:[^/]+|categories/[^/]*|schemes/[^/]*)?$', 3600),
+                    (r'^/d2l/api/le/[^/]+/[^/]+/content/(?:root/|modules/[^/]+(?:/structure/)?|topics/[^/]+)$', 3600))
+
+# number of seconds fresh for a response that stays fresh until evicted
+FOREVER = float('inf')
+
+# every API route, cached until evicted: for recording a run to replay offline
+ALL_ROUTES = ((r'^/d2l/api/', FOREVER),)
+
+
+class CacheMiss(LookupError):
+    """Raised for a call an offline :class:`ResponseCache` has no response to."""
+
+
+def cache_key(uc,route,params=None):
+    """Build the key a response gets cached under: the scheme, host, app and
+    user the call was made for, the route, and the query parameters in
+    canonical order. (The user's key, a secret, stays out of it.)"""
+    query = ''
+    if params:
+        if hasattr(params, 'items'):
+            params = params.items()
+        query = urllib.parse.urlencode(sorted((str(k), str(v)) for k, v in params if v is not None))
+    return '{0}://{1} {2} {3} {4}?{5}'.format(uc.scheme,uc.host,uc.app_id,uc.user_id,route,query)
+
+def _key_route(key):
+    return key.split(' ')[3].partition('?')[0]
+
+
+class CachedResponse(object):
+    """A response body held in a :class:`ResponseCache`, with what the service
+    layer needs to decode it again, and the validators (`ETag`,
+    `LastModified`) to revalidate it with."""
+    __slots__ = ('Body', 'ContentType', 'Encoding', 'ETag', 'LastModified', 'Stored', 'Expires')
+
+    def __init__(self,body,content_type='',encoding=None,etag=None,last_modified=None,stored=None,expires=None):
+        self.Body = body
+        self.ContentType = content_type
+        self.Encoding = encoding
+        self.ETag = etag
+        self.LastModified = last_modified
+        self.Stored = stored
+        self.Expires = expires
+
+    def __repr__(self):
+        return 'CachedResponse({0!r}, {1} bytes)'.format(self.ContentType,len(self.Body))
+
+    @property
+    def fresh(self):
+        return self.Expires is None or time.time() < self.Expires
+
+    @property
+    def revalidatable(self):
+        return bool(self.ETag or self.LastModified)
+
+    def conditional_headers(self):
+        """Retrieve the headers asking the server to send this response's
+        body again only if it has changed."""
+        headers = {}
+        if self.ETag:
+            headers['If-None-Match'] = self.ETag
+        if self.LastModified:
+            headers['If-Modified-Since'] = self.LastModified
+        return headers
+
+
+class MemoryBackend(object):
+    """Thread-safe in-memory store for a :class:`ResponseCache`, evicting the
+    least recently used responses once it holds more than `max_entries`
+    responses or `max_bytes` bytes of response bodies."""
+    def __init__(self,max_entries=1024,max_bytes=16*1024*1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self,key):
+        with self._lock:
+            e = self._entries.get(key)
+            if e is not None:
+                self._entries.move_to_end(key)
+            return e
+
+    def put(self,key,e):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if len(e.Body) > self.max_bytes:
+                return
+            self._entries[key] = e
+            self._bytes += len(e.Body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self,key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def _drop(self,key):
+        e = self._entries.pop(key)
+        self._bytes -= len(e.Body)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'evictions': self.evictions}
+
+
+class SQLiteBackend(object):
+    """Thread-safe store for a :class:`ResponseCache` in an SQLite database
+    file, evicting the least recently used responses once it holds more than
+    `max_entries` responses or `max_bytes` bytes of (stored) response bodies.
+
+    The store outlives the process, so a job restarted with a cache over the
+    same file starts out with the responses (and their freshness) it had.
+    Bodies of at least `compress_min` bytes get stored zlib-compressed at
+    `compress_level` (0 to store every body as is).
+
+    :param path: Path of the database file (created if need be).
+    """
+    def __init__(self,path,max_entries=100000,max_bytes=1024*1024*1024,compress_level=6,compress_min=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self.compress_min = compress_min
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path,check_same_thread=False,isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                         'key TEXT PRIMARY KEY, body BLOB, content_type TEXT, encoding TEXT, '
+                         'etag TEXT, last_modified TEXT, stored REAL, expires REAL, '
+                         'used REAL, size INTEGER)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_used ON responses (used)')
+        if 'codec' not in [row[1] for row in self._db.execute('PRAGMA table_info(responses)')]:
+            self._db.execute('ALTER TABLE responses ADD COLUMN codec TEXT')
+        self._count, self._bytes = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get(self,key):
+        with self._lock:
+            row = self._db.execute('SELECT body, codec, content_type, encoding, etag, last_modified, stored, expires '
+                                   'FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE responses SET used = ? WHERE key = ?', (time.time(), key))
+        body = bytes(row[0])
+        if row[1] == 'zlib':
+            body = zlib.decompress(body)
+        return CachedResponse(body,*row[2:])
+
+    def put(self,key,e):
+        body, codec = e.Body, None
+        if self.compress_level and len(body) >= self.compress_min:
+            packed = zlib.compress(body, self.compress_level)
+            if len(packed) < len(body):
+                body, codec = packed, 'zlib'
+        size = len(body)
+        with self._lock:
+            self._delete(key)
+            if size > self.max_bytes:
+                return
+            self._db.execute('INSERT INTO responses (key, body, content_type, encoding, etag, last_modified, '
+                             'stored, expires, used, size, codec) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (key, body, e.ContentType, e.Encoding, e.ETag, e.LastModified,
+                              e.Stored, e.Expires, time.time(), size, codec))
+            self._count += 1
+            self._bytes += size
+            while self._count > self.max_entries or self._bytes > self.max_bytes:
+                row = self._db.execute('SELECT key FROM responses ORDER BY used LIMIT 1').fetchone()
+                if row is None:
+                    break
+                self._delete(row[0])
+                self.evictions += 1
+
+    def delete(self,key):
+        with self._lock:
+            self._delete(key)
+
+    def _delete(self,key):
+        row = self._db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._count -= 1
+            self._bytes -= row[0]
+
+    def keys(self):
+        with self._lock:
+            return [row[0] for row in self._db.execute('SELECT key FROM responses')]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+            self._count = self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': self._count, 'bytes': self._bytes, 'evictions': self.evictions}
+
+
+class ResponseCache(object):
+    """Thread-safe cache of successful GET responses.
+
+    Caching is opt-in, by route: only calls to routes matching one of
+    `routes` (or declared later with :meth:`declare_route`) get cached, each
+    for as many seconds as its first matching pattern gives. A response is
+    cached under the host, user context, route and query parameters of its
+    call, so one user's cached data never gets served to another.
+
+    Once a cached response is no longer fresh, the next call for it goes out
+    as a conditional request if the response carried an `ETag` or
+    `Last-Modified` validator; a 304 Not Modified answer makes the cached
+    response fresh again and returns it, so the body gets downloaded again
+    only when it has changed. Routes cached for 0 seconds (by default, those
+    in `REVALIDATED_ROUTES`) get revalidated on every call.
+
+    The responses live in a `backend`: by default, a :class:`MemoryBackend`
+    bounded by `max_entries` and `max_bytes`; pass an :class:`SQLiteBackend`
+    to keep them on disk, so that a restarted job picks up where it left off.
+
+    An `offline` cache never lets a call reach the LMS: it serves every GET
+    call from its stored responses, fresh or not, and raises
+    :class:`CacheMiss` for any call it can't serve. To replay a run offline
+    (for profiling, say), record it with a cache over an
+    :class:`SQLiteBackend` and `ALL_ROUTES`, then run it again with an
+    offline cache over the same file.
+
+    Install a cache for all service calls with
+    :func:`d2lvalence_util.service.set_response_cache`, or hand one to a
+    single call in a `d2lcache` keyword argument (False to skip the installed
+    cache for that call).
+
+    :param routes: Sequence of (route regex, seconds fresh) pairs.
+    :param backend: Store to hold the responses in.
+    :param max_entries: Maximum number of responses a default backend holds.
+    :param max_bytes: Maximum total size of the response bodies a default backend holds.
+    :param offline: Whether to serve calls from the cache alone.
+    """
+    def __init__(self,routes=REFERENCE_DATA_ROUTES + REVALIDATED_ROUTES,backend=None,
+                 max_entries=1024,max_bytes=16*1024*1024,offline=False):
+        self.routes = [(re.compile(p), ttl) for p, ttl in routes]
+        self.backend = backend or MemoryBackend(max_entries,max_bytes)
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+
+    def declare_route(self,pattern,ttl):
+        """Cache responses from routes matching a regex for `ttl` seconds
+        (`FOREVER` to keep them until evicted), in preference to any pattern
+        given before."""
+        self.routes.insert(0, (re.compile(pattern), ttl))
+
+    def ttl_for(self,route):
+        """Retrieve the number of seconds a response from `route` stays
+        fresh, or None if the route doesn't get cached."""
+        for p, ttl in self.routes:
+            if p.search(route):
+                return ttl
+        return None
+
+    def _count(self,counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def lookup(self,key,count=True):
+        """Retrieve the cached response for a key: a fresh one to use as is,
+        a stale one to revalidate, or None. (Offline, any stored response
+        counts as fresh.)"""
+        e = self.backend.get(key)
+        if e is not None and not e.fresh and not e.revalidatable and not self.offline:
+            self.backend.delete(key)
+            e = None
+        if count:
+            if e is not None and (e.fresh or self.offline):
+                self._count('hits')
+            else:
+                self._count('misses')
+        return e
+
+    def store(self,key,e,ttl=None):
+        """Cache a response under a key, fresh for `ttl` seconds (or until
+        evicted, if None or `FOREVER`)."""
+        e.Stored = time.time()
+        e.Expires = None
+        if ttl is not None and ttl != FOREVER:
+            e.Expires = e.Stored + ttl
+        self.backend.put(key,e)
+
+    def revalidated(self,key,e,ttl=None,r=None):
+        """Record a 304 Not Modified answer to revalidating a cached response,
+        taking up any new validators the answer carries."""
+        if r is not None:
+            e.ETag = r.headers.get('etag') or e.ETag
+            e.LastModified = r.headers.get('last-modified') or e.LastModified
+        self._count('revalidations')
+        self.store(key,e,ttl)
+
+    def invalidate(self,pattern=None):
+        """Drop the cached responses for routes matching a regex (by default,
+        every cached response)."""
+        if pattern is None:
+            self.backend.clear()
+            return
+        p = re.compile(pattern)
+        for key in self.backend.keys():
+            if p.search(_key_route(key)):
+                self.backend.delete(key)
+
+    def stats(self):
+        """Retrieve a dict of the cache's size and hit/miss counters."""
+        result = self.backend.stats()
+        with self._lock:
+            result.update({'hits': self.hits,
+                           'misses': self.misses,
+                           'revalidations': self.revalidations})
+        return result
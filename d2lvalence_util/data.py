@@ -22,9 +22,13 @@
 import sys
 import copy
 import io
+import os
+import mmap
+import threading
 import json
 import d2lvalence.auth as d2lauth
 import collections  # for testing if an item is iterable
+import collections.abc
 import requests
 
 ## Utility functions
@@ -58,6 +62,13 @@ def _set_boolean_prop(p):
     return func
 
 ## Base class
+class _D2LAdopted(object):
+    # carries a dict whose ownership passes to the structure built around it
+    __slots__ = ('props',)
+
+    def __init__(self,props_dict):
+        self.props = props_dict
+
 class D2LStructure():
     """Basic D2L data structure to encapsulate a JSON structure passed back and
     forth through the Valence API.
@@ -68,8 +79,22 @@ class D2LStructure():
         :param props_dict:
             Dictionary used to create the initial contents of the structure.
         """
-        self.props = {}
-        self.props.update(props_dict)
+        if isinstance(props_dict, _D2LAdopted):
+            self.props = props_dict.props
+        else:
+            self.props = {}
+            self.props.update(props_dict)
+
+    @classmethod
+    def adopt(cls,props_dict):
+        """Construct a new structure object that takes ownership of the provided
+        dictionary, rather than copying it.
+
+        Use this for freshly decoded data nothing else holds on to: the new
+        structure's properties *are* `props_dict`, so later changes to one show
+        up in the other.
+        """
+        return cls(_D2LAdopted(props_dict))
 
     def __repr__(self):
         """Retrieve this structure's properties as a string. """
@@ -80,9 +105,21 @@ class D2LStructure():
         passing where you'd need JSON data. """
         return json.dumps(self.props)
 
-    def as_dict(self):
-        """Retrieve a new dict that's a deep copy of this structure's properties. """
-        return copy.deepcopy(self.props)
+    def as_dict(self,deep=True):
+        """Retrieve a new dict that's a copy of this structure's properties.
+
+        :param deep:
+            If true (the default), make a deep copy; otherwise, make a shallow
+            copy that shares nested lists and dicts with this structure.
+        """
+        if deep:
+            return copy.deepcopy(self.props)
+        return dict(self.props)
+
+    def compact(self):
+        """Retrieve a compact, read-only record of this structure's property
+        values (see :func:`compact_type`)."""
+        return compact_type(type(self))(self.props)
 
 ## Utility classes
 class D2LDebugInfo(object):
@@ -112,6 +149,345 @@ class D2LDebugInfo(object):
         self._response = None
 
 
+class D2LDownload(object):
+    """Directs the service layer to stream a response body into a file, rather
+    than hand it back as bytes, when an instance is passed down in the
+    'd2ldownload=' keyword parameter; the service function then returns the
+    instance instead of the body.
+
+    The body gets written `chunk_size` bytes at a time, so a download needs
+    the same small amount of memory however large the file. If the transfer
+    breaks off part way, the service layer asks for the rest with an HTTP
+    Range request (up to `max_resumes` times), using the response's ETag or
+    Last-Modified date to make sure the rest is from the same file. Downloads
+    ask for the file unencoded, since Range offsets count the bytes the server
+    sends; a transfer the server compresses anyway can't be picked back up.
+
+    :param target:
+        Path of the file to write to, or a writable (and seekable) binary
+        stream.
+    :param chunk_size: Number of bytes to write at a time.
+    :param progress:
+        Callable invoked with `(bytes_done, total_bytes)` after each chunk;
+        `total_bytes` is None when the server doesn't say.
+    :param resume:
+        If true, keep what's already in the target and ask only for the rest
+        of the file; otherwise, overwrite the target. The validators of a
+        file being downloaded to a path get kept beside it (in the path plus
+        `.d2lresume`, removed once the download completes), so that a later
+        run can make sure the rest is from the same file; with no validator
+        to go by, the download starts over.
+    :param max_resumes:
+        Number of times to pick up a transfer that breaks off part way (for a
+        parallel download, per part).
+    :param connections:
+        Number of connections to fetch the file over at once. With more than
+        one, the first request asks for the first `part_size` bytes, learning
+        the file's size; the rest of the file then gets fetched in
+        `part_size` ranges in parallel, straight into place in the target
+        (which gets extended to the full size up front). A server that
+        ignores Range requests gets asked for the whole file in one stream.
+    :param part_size: Number of bytes to fetch per range request.
+
+    After the download, `Size` holds the file's full size (if the server said),
+    `BytesWritten` the number of bytes this download wrote, `Resumes` the
+    number of times it picked up a broken transfer, and `ContentType`, `ETag`
+    and `LastModified` the corresponding response headers.
+    """
+    def __init__(self,target,chunk_size=64*1024,progress=None,resume=False,max_resumes=3,
+                 connections=1,part_size=8*1024*1024):
+        self.target = target
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.resume = resume
+        self.max_resumes = max_resumes
+        self.connections = connections
+        self.part_size = part_size
+        self.Size = None
+        self.BytesWritten = 0
+        self.Resumes = 0
+        self.ContentType = None
+        self.ETag = None
+        self.LastModified = None
+        self._file = None
+        self._owned = False
+        self._offset = 0
+        self._begun_at = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'D2LDownload({0!r}, {1} of {2} bytes)'.format(self.target,self._offset,self.Size)
+
+    @property
+    def Offset(self):
+        """Number of bytes of the file in the target so far."""
+        return self._offset
+
+    def begin(self):
+        """Open the target, returning the offset to ask for the file from."""
+        if hasattr(self.target, 'write'):
+            self._file, self._owned = self.target, False
+        else:
+            path = os.fspath(self.target)
+            if self.resume and os.path.exists(path):
+                self._file = open(path, 'r+b')
+            else:
+                self._file = open(path, 'w+b')
+            self._owned = True
+        if self.resume:
+            self._offset = self._file.seek(0, io.SEEK_END)
+            if self._offset and not (self.ETag or self.LastModified):
+                self._load_validators()
+        if not self._offset or not (self.ETag or self.LastModified):
+            # nothing to check the rest of the file against: start over
+            self.seek(0)
+            self.ETag = self.LastModified = None
+            self._save_validators()
+        self._begun_at = self._offset
+        return self._offset
+
+    def _sidecar(self):
+        # where to keep the validators of a file being downloaded to a path
+        if hasattr(self.target, 'write'):
+            return None
+        return os.fspath(self.target) + '.d2lresume'
+
+    def _load_validators(self):
+        path = self._sidecar()
+        if path is None:
+            return
+        try:
+            with open(path, 'r') as f:
+                kept = json.load(f)
+            self.ETag = kept.get('ETag')
+            self.LastModified = kept.get('LastModified')
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def _save_validators(self):
+        path = self._sidecar()
+        if path is None:
+            return
+        if self.ETag or self.LastModified:
+            with open(path, 'w') as f:
+                json.dump({'ETag': self.ETag, 'LastModified': self.LastModified}, f)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def seek(self,offset):
+        """Discard anything in the target from `offset` on, and carry on
+        writing from there."""
+        self._file.seek(offset)
+        self._file.truncate()
+        self._offset = offset
+
+    def accept(self,r,offset=0):
+        """Note the details of a response that carries the file from `offset`
+        on."""
+        kept = (self.ETag, self.LastModified)
+        self.ContentType = r.headers.get('content-type')
+        self.ETag = r.headers.get('etag', self.ETag)
+        self.LastModified = r.headers.get('last-modified', self.LastModified)
+        if (self.ETag, self.LastModified) != kept:
+            self._save_validators()
+        if r.status_code == 206:
+            total = r.headers.get('content-range', '').rpartition('/')[2]
+            if total.isdigit():
+                self.Size = int(total)
+        elif 'content-length' in r.headers and 'content-encoding' not in r.headers:
+            self.Size = offset + int(r.headers['content-length'])
+
+    def write(self,chunk):
+        self._file.write(chunk)
+        self._offset += len(chunk)
+        self.BytesWritten += len(chunk)
+        if self.progress:
+            self.progress(self._offset,self.Size)
+
+    def allocate(self,size):
+        """Extend the target to `size` bytes, for parts of the file to get
+        written into place with :meth:`write_at`."""
+        self._file.truncate(size)
+
+    def write_at(self,pos,chunk):
+        """Write a chunk at position `pos` in the target; safe to call from
+        several threads at once."""
+        with self._lock:
+            self._file.seek(pos)
+            self._file.write(chunk)
+            self.BytesWritten += len(chunk)
+            if self.progress:
+                self.progress(self._begun_at + self.BytesWritten,self.Size)
+
+    def resumed(self):
+        """Count a transfer picked back up after breaking off."""
+        with self._lock:
+            self.Resumes += 1
+
+    def finish(self):
+        """Note the download complete, dropping the validators kept for
+        resuming it."""
+        path = self._sidecar()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def end(self):
+        """Flush the target, and close it if this download opened it."""
+        if self._file is not None:
+            if self._owned:
+                self._file.close()
+            else:
+                self._file.flush()
+            self._file = None
+
+
+class D2LLazyList(collections.abc.Sequence):
+    """Read-only sequence over a raw JSON array passed back from the API,
+    building the typed structure for an element only when you access it.
+
+    The sequence supports `len()`, indexing, slicing (which produces another
+    lazy list over the same raw elements) and iteration. It never copies the
+    raw elements, and doesn't hold on to the structures it builds: accessing
+    the same element twice builds two structures around the same raw data.
+
+    :param raw_list: Decoded JSON array.
+    :param factory:
+        Callable taking a raw element (dict) and producing its structure;
+        typically a D2LStructure inheritor.
+    """
+    def __init__(self,raw_list,factory):
+        self._raw = raw_list
+        self._factory = factory
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __getitem__(self,i):
+        if isinstance(i, slice):
+            return D2LLazyList(self._raw[i],self._factory)
+        return self._factory(self._raw[i])
+
+    def __iter__(self):
+        factory = self._factory
+        for item in self._raw:
+            yield factory(item)
+
+    def __repr__(self):
+        return 'D2LLazyList({0} items)'.format(len(self._raw))
+
+    @property
+    def raw(self):
+        """Retrieve the underlying raw JSON array (a reference, not a copy)."""
+        return self._raw
+
+    def as_list(self):
+        """Build every element's structure, returning them in a new list."""
+        return [self._factory(item) for item in self._raw]
+
+class D2LRecord(object):
+    """Compact, read-only record of a D2L data structure's property values.
+
+    A record keeps each property's value in a slot of its own, with no
+    instance dict and no reference to the JSON data it came from, so it costs
+    a fraction of the memory of the structure it stands in for; use records
+    when holding very many structures (say, every enrollment in an org) at
+    once. Don't build record types directly: fetch them with
+    :func:`compact_type`.
+
+    A property the source data can't provide (because the JSON field is
+    missing or null where the structure expects a value) stays unset, and
+    reading it raises AttributeError.
+
+    :param props_dict:
+        Dictionary holding the JSON data for the structure the record stands
+        in for.
+    """
+    __slots__ = ()
+    _structure = None
+    _fields = ()
+    _getters = ()
+
+    def __init__(self,props_dict):
+        holder = _D2LAdopted(props_dict)
+        for name, fget in self._getters:
+            try:
+                object.__setattr__(self,name,fget(holder))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+    def __setattr__(self,name,value):
+        raise AttributeError('{0} is read-only'.format(type(self).__name__))
+
+    def __delattr__(self,name):
+        raise AttributeError('{0} is read-only'.format(type(self).__name__))
+
+    def __eq__(self,other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __ne__(self,other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__,
+                                 ', '.join('{0}={1!r}'.format(k, v) for k, v in self.as_dict().items()))
+
+    def __reduce__(self):
+        return (_rebuild_record, (self._structure, self.as_dict()))
+
+    def as_dict(self):
+        """Retrieve a new dict of this record's property values, keyed by
+        property name."""
+        result = {}
+        for name in self._fields:
+            try:
+                result[name] = object.__getattribute__(self,name)
+            except AttributeError:
+                pass
+        return result
+
+_compact_types = {}
+
+def compact_type(cls):
+    """Retrieve the compact record type for a D2LStructure inheritor.
+
+    The record type (a :class:`D2LRecord` inheritor named after `cls`, with a
+    `Record` suffix) has a slot for each property `cls` defines, holding the
+    value the property would produce. Build a record from a structure with
+    :meth:`D2LStructure.compact`, or straight from decoded JSON data by
+    calling the record type with the data dict::
+
+        UserDataRecord = compact_type(UserData)
+        users = [UserDataRecord(d) for d in raw_list]
+    """
+    rt = _compact_types.get(cls)
+    if rt is None:
+        getters = {}
+        for klass in reversed(cls.__mro__):
+            for name, attr in vars(klass).items():
+                if isinstance(attr, property) and attr.fget:
+                    getters[name] = attr.fget
+                elif name in getters:
+                    del getters[name]
+        fields = tuple(getters)
+        rt = type(cls.__name__ + 'Record', (D2LRecord,),
+                  {'__slots__': fields,
+                   '__module__': cls.__module__,
+                   '__doc__': 'Compact, read-only record of a {0}.'.format(cls.__name__),
+                   '_structure': cls,
+                   '_fields': fields,
+                   '_getters': tuple(getters.items())})
+        rt = _compact_types.setdefault(cls, rt)
+    return rt
+
+def _rebuild_record(cls,values):
+    rt = compact_type(cls)
+    r = rt.__new__(rt)
+    for name, v in values.items():
+        object.__setattr__(r,name,v)
+    return r
+
 class PagedResultSet(D2LStructure):
     """Structure used to wrap paged result sets sent back from the API.
 
@@ -164,8 +540,12 @@ class D2LFile(D2LStructure):
             amounts to a `Description` and a `Name` property for example.
 
         `Stream` contains a standard Python `io.BufferedIOBase` byte stream
-            implementation that can provide the raw bytes for the file data to
-            upload.
+            implementation (or an `mmap.mmap`) that can provide the raw bytes
+            for the file data to upload.
+
+    Instead of a `Stream`, the structure can carry a `Path` naming a file on
+    disk: the upload routes then open the file only while sending it, and send
+    it from a memory map of its pages rather than reading it into memory.
 
     The structure also contains the `Name` and `ContentType` (mime content-type)
     top-level properties that will get used to form the HTTP header and
@@ -180,11 +560,19 @@ class D2LFile(D2LStructure):
 
     @Stream.setter
     def Stream(self,f):
-        if not isinstance(f, io.BufferedIOBase ):
-            raise TypeError('File must implement io.BufferedIOBase')
+        if not isinstance(f, (io.BufferedIOBase, mmap.mmap)):
+            raise TypeError('File must implement io.BufferedIOBase or mmap.mmap')
         else:
             self.props['Stream']=f
 
+    @property
+    def Path(self):
+        return self.props['Path']
+
+    @Path.setter
+    def Path(self,p):
+        self.props['Path']=os.fspath(p)
+
     @property
     def DescriptorDict(self):
         return self.props['DescriptorDict']
@@ -928,6 +1316,46 @@ class OrgUnitInfo(D2LStructure):
        # return OrgUnitTypeInfo(self.props['Type'])
        return self.props['Type']
 
+class OrgUnitUser(D2LStructure):
+   def __init__(self,json_dict):
+       D2LStructure.__init__(self,json_dict)
+
+   @property
+   def User(self):
+       return self.props['User']
+
+   @property
+   def UserId(self):
+       return int(self.props['User']['Identifier'])
+
+   @property
+   def Role(self):
+       return self.props['Role']
+
+   @property
+   def RoleId(self):
+       return int(self.props['Role']['Id'])
+
+class UserOrgUnit(D2LStructure):
+   def __init__(self,json_dict):
+       D2LStructure.__init__(self,json_dict)
+
+   @property
+   def OrgUnit(self):
+       return self.props['OrgUnit']
+
+   @property
+   def OrgUnitId(self):
+       return int(self.props['OrgUnit']['Id'])
+
+   @property
+   def Role(self):
+       return self.props['Role']
+
+   @property
+   def RoleId(self):
+       return int(self.props['Role']['Id'])
+
 ## Group and Group Category classes
 class GroupCategoryDataFetch(D2LStructure):
     def __init__(self,json_dict):
@@ -2223,3 +2651,14 @@ class CreateLTILinkData(D2LStructure):
         return self.props['CustomParameters']
 
     ## Need to add custom parms setters here
+
+
+## Compact record types for the high-volume read-only structures
+UserDataRecord = compact_type(UserData)
+OrgUnitRecord = compact_type(OrgUnit)
+OrgUnitUserRecord = compact_type(OrgUnitUser)
+UserOrgUnitRecord = compact_type(UserOrgUnit)
+ClasslistUserRecord = compact_type(ClasslistUser)
+EnrollmentDataRecord = compact_type(EnrollmentData)
+GradeValueRecord = compact_type(GradeValue)
+GradeValueComputableRecord = compact_type(GradeValueComputable)
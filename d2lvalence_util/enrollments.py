@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, enrollments module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.enrollments
+:synopsis: Provides bulk enrolling and unenrolling of users in org units.
+"""
+import os
+import threading
+
+import d2lvalence_util.bulk as d2lbulk
+import d2lvalence_util.data as d2ldata
+import d2lvalence_util.service as d2lservice
+
+
+class EnrollmentIndex(object):
+    """Local, thread-safe index of who is enrolled in which org units, with
+    which role.
+
+    An org unit's enrollments get loaded (with
+    `service.iter_enrolled_users_for_orgunit`) the first time they're needed,
+    or up front, many org units in parallel, with :meth:`load`; `errors`
+    holds, by org unit id, the error that kept an org unit from loading.
+
+    :param uc: User context to make the calls with.
+    :param max_workers: Number of org units to load at once.
+    :param kwargs: Keyword arguments passed down into every service call.
+    """
+    def __init__(self,uc,max_workers=8,ver='1.0',**kwargs):
+        self.uc = uc
+        self.max_workers = max_workers
+        self.ver = ver
+        self.kwargs = kwargs
+        self._orgs = {}     # org unit id -> {user id: role id}
+        self.errors = {}    # org unit id -> exception its last load raised
+        self._lock = threading.Lock()
+
+    def _fetch(self,uc,org_unit_id,**kw):
+        return {e.UserId: e.RoleId
+                for e in d2lservice.iter_enrolled_users_for_orgunit(uc,org_unit_id,read_ahead=True,ver=self.ver,**kw)}
+
+    def loaded(self,org_unit_id):
+        return int(org_unit_id) in self._orgs
+
+    def load(self,org_unit_ids,reload=False):
+        """Load the enrollments of many org units, in parallel; return the
+        index. An org unit whose load fails stays unloaded, with the error
+        noted in `errors`."""
+        ids = set(int(ou) for ou in org_unit_ids)
+        if not reload:
+            ids = [ou for ou in ids if ou not in self._orgs]
+        if not ids:
+            return self
+        kw, own = d2lbulk.pooled_kwargs(self.uc,self.kwargs,self.max_workers)
+        try:
+            for res in d2lbulk.run_bulk(self._fetch,self.uc,sorted(ids),max_workers=self.max_workers,**kw):
+                ou = int(res.Args[0])
+                with self._lock:
+                    if res.ok:
+                        self._orgs[ou] = res.Value
+                        self.errors.pop(ou, None)
+                    else:
+                        self.errors[ou] = res.Error
+        finally:
+            if own:
+                own.close()
+        return self
+
+    def _users(self,org_unit_id):
+        ou = int(org_unit_id)
+        users = self._orgs.get(ou)
+        if users is None:
+            self.load([ou])
+            users = self._orgs.get(ou)
+            if users is None:
+                raise self.errors[ou]
+        return users
+
+    def role(self,org_unit_id,user_id):
+        """Retrieve the id of a user's role in an org unit, or None if the
+        user isn't enrolled there."""
+        return self._users(org_unit_id).get(int(user_id))
+
+    def users(self,org_unit_id):
+        """Retrieve a dict of the users enrolled in an org unit, and the id of
+        each one's role."""
+        return dict(self._users(org_unit_id))
+
+    def record(self,org_unit_id,user_id,role_id=None):
+        """Note an enrollment made (or, with `role_id` None, dropped), in an
+        org unit whose enrollments are loaded."""
+        with self._lock:
+            users = self._orgs.get(int(org_unit_id))
+            if users is None:
+                return
+            if role_id is None:
+                users.pop(int(user_id), None)
+            else:
+                users[int(user_id)] = int(role_id)
+
+
+class EnrollmentOp(object):
+    """One enrollment change in a :class:`BulkEnroller` run: an add (with a
+    `RoleId`, from a `d2lvalence_util.data.CreateEnrollmentData`) or a drop
+    (`RoleId` None) of a user in an org unit, and its outcome."""
+    def __init__(self,org_unit_id,user_id,role_id=None,data=None):
+        self.OrgUnitId = int(org_unit_id)
+        self.UserId = int(user_id)
+        self.RoleId = role_id
+        self.Data = data
+        self.Error = None
+        self.ok = False
+
+    @staticmethod
+    def fashion_EnrollmentOp(op):
+        """Build an op from a `CreateEnrollmentData` (an add) or an
+        `(org_unit_id, user_id)` pair (a drop)."""
+        if isinstance(op, d2ldata.CreateEnrollmentData):
+            return EnrollmentOp(op.OrgUnitId,op.UserId,int(op.RoleId),op)
+        if isinstance(op, EnrollmentOp):
+            return op
+        ou, u = op
+        return EnrollmentOp(ou,u)
+
+    @property
+    def key(self):
+        return (self.OrgUnitId, self.UserId)
+
+    @property
+    def checkpoint_line(self):
+        if self.RoleId is None:
+            return 'drop {0} {1}\n'.format(self.OrgUnitId,self.UserId)
+        return 'add {0} {1} {2}\n'.format(self.OrgUnitId,self.UserId,self.RoleId)
+
+    def __repr__(self):
+        if self.RoleId is None:
+            what = 'drop user {0} from {1}'.format(self.UserId,self.OrgUnitId)
+        else:
+            what = 'add user {0} to {1} as role {2}'.format(self.UserId,self.OrgUnitId,self.RoleId)
+        if self.Error is not None:
+            return 'EnrollmentOp({0}, error={1!r})'.format(what,self.Error)
+        return 'EnrollmentOp({0})'.format(what)
+
+
+class EnrollmentReport(object):
+    """Outcome of a :class:`BulkEnroller` run.
+
+    `Ops` holds the ops the run sent; `Duplicates` counts ops superseded by a
+    later op for the same user and org unit, `Unneeded` the ops the
+    enrollment index showed to be in effect already, and `Resumed` the ops a
+    checkpoint showed done by an earlier run. `LoadErrors` holds, by org unit
+    id, the errors that kept the index from loading an org unit's
+    enrollments; that org unit's ops got sent unchecked.
+    """
+    def __init__(self):
+        self.Ops = []
+        self.Duplicates = 0
+        self.Unneeded = 0
+        self.Resumed = 0
+        self.LoadErrors = {}
+
+    def __repr__(self):
+        return ('EnrollmentReport({0} sent, {1} failed, {2} duplicate, {3} unneeded, {4} resumed, '
+                '{5} org units unchecked)').format(len(self.Ops),
+                                                  len(self.failed),
+                                                  self.Duplicates,
+                                                  self.Unneeded,
+                                                  self.Resumed,
+                                                  len(self.LoadErrors))
+
+    @property
+    def succeeded(self):
+        return [op for op in self.Ops if op.ok]
+
+    @property
+    def failed(self):
+        return [op for op in self.Ops if not op.ok]
+
+
+class BulkEnroller(object):
+    """Applies a stream of enrollment adds and drops concurrently.
+
+    A run first settles the stream down to one op per user and org unit (the
+    last one given), then sets aside the ops already in effect, as the
+    `index` shows (an add of a user already enrolled with the same role, or
+    a drop of a user not enrolled at all), loading the enrollments of the org
+    units involved in parallel as need be; the ops for an org unit whose
+    enrollments fail to load go out unchecked. The remaining ops go out
+    `max_workers` at a time over a pooled session, through the process's rate
+    limiter and retry policy (if installed); `progress`, if given, gets
+    called with the number of ops finished and the number to send, as each
+    one finishes.
+
+    Given a `checkpoint` file, each op that goes through gets recorded there
+    as it does, and a later run with the same file skips the ops it records,
+    so a run cut short (or with failed ops) can be run again to finish the
+    job without repeating it.
+
+    :param uc: User context to make the calls with.
+    :param max_workers: Number of ops to have running at once.
+    :param index:
+        :class:`EnrollmentIndex` to check ops against (by default, a new one);
+        None skips the checks.
+    :param checkpoint: Path of a file to record finished ops in.
+    :param progress: Callable to report progress to.
+    :param kwargs: Keyword arguments passed down into every service call.
+    """
+    def __init__(self,uc,max_workers=8,index=True,checkpoint=None,progress=None,ver='1.0',**kwargs):
+        if index is True:
+            index = EnrollmentIndex(uc,max_workers=max_workers,ver=ver,**kwargs)
+        self.uc = uc
+        self.max_workers = max_workers
+        self.index = index
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.ver = ver
+        self.kwargs = kwargs
+
+    def _done_lines(self):
+        # the ops a checkpoint file records; a torn last line doesn't count
+        done = set()
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint, 'r') as f:
+                for line in f:
+                    if line.endswith('\n'):
+                        done.add(line)
+        return done
+
+    def _send(self,uc,op,**kw):
+        if op.RoleId is None:
+            return d2lservice.delete_user_enrollment_in_orgunit(uc,op.OrgUnitId,op.UserId,ver=self.ver,**kw)
+        return d2lservice.create_enrollment_for_user(uc,op.Data,ver=self.ver,**kw)
+
+    def run(self,ops):
+        """Apply enrollment changes.
+
+        :param ops:
+            Iterable of ops: `d2lvalence_util.data.CreateEnrollmentData`
+            structures to add, and `(org_unit_id, user_id)` pairs to drop.
+
+        :returns: :class:`EnrollmentReport` of the run.
+        """
+        report = EnrollmentReport()
+        latest = {}
+        for op in ops:
+            op = EnrollmentOp.fashion_EnrollmentOp(op)
+            if op.key in latest:
+                report.Duplicates += 1
+                del latest[op.key]
+            latest[op.key] = op
+        pending = list(latest.values())
+        latest = None
+
+        done = self._done_lines()
+        if done:
+            n = len(pending)
+            pending = [op for op in pending if op.checkpoint_line not in done]
+            report.Resumed = n - len(pending)
+
+        if self.index is not None:
+            orgs = set(op.OrgUnitId for op in pending)
+            self.index.load(orgs)
+            report.LoadErrors = {ou: self.index.errors[ou] for ou in orgs if not self.index.loaded(ou)}
+            n = len(pending)
+            pending = [op for op in pending
+                       if not self.index.loaded(op.OrgUnitId) or self.index.role(op.OrgUnitId,op.UserId) != op.RoleId]
+            report.Unneeded = n - len(pending)
+
+        report.Ops = pending
+        log = None
+        if self.checkpoint:
+            log = open(self.checkpoint, 'a')
+        kw, own = d2lbulk.pooled_kwargs(self.uc,self.kwargs,self.max_workers)
+        try:
+            finished = 0
+            for res in d2lbulk.run_bulk(self._send,
+                                        self.uc,
+                                        [(op,) for op in pending],
+                                        max_workers=self.max_workers,
+                                        **kw):
+                op = res.Args[0]
+                op.Error = res.Error
+                op.ok = res.ok
+                finished += 1
+                if res.ok:
+                    if self.index is not None:
+                        self.index.record(op.OrgUnitId,op.UserId,op.RoleId)
+                    if log:
+                        log.write(op.checkpoint_line)
+                        log.flush()
+                if self.progress:
+                    self.progress(finished,len(pending))
+        finally:
+            if own:
+                own.close()
+            if log:
+                log.close()
+        return report
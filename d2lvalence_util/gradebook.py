@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, gradebook module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.gradebook
+:synopsis: Provides a columnar, array-backed view of an org unit's grade values.
+
+This module depends on the `numpy` package.
+"""
+import numpy        # for the array-backed gradebook matrix
+
+import d2lvalence_util.bulk as d2lbulk
+import d2lvalence_util.service as d2lservice
+
+# the numeric grade value properties the matrix keeps, one array apiece
+VALUE_FIELDS = ('PointsNumerator', 'PointsDenominator', 'WeightedNumerator', 'WeightedDenominator')
+
+
+class GradebookMatrix(object):
+    """Dense users by grade objects matrix of an org unit's grade values.
+
+    `UserIds` and `GradeObjectIds` are int64 index arrays labelling the rows
+    and columns; `PointsNumerator`, `PointsDenominator`, `WeightedNumerator`
+    and `WeightedDenominator` are float64 arrays of shape
+    `(len(UserIds), len(GradeObjectIds))` holding NaN where a user has no
+    (computable) value for a grade object.
+
+    `Errors` maps the id of each user whose grade values couldn't be fetched
+    to the exception the fetch raised; such users' rows hold NaN throughout.
+    """
+    def __init__(self,user_ids,grade_object_ids,values=None,errors=None):
+        self.UserIds = numpy.asarray(user_ids,dtype=numpy.int64)
+        self.GradeObjectIds = numpy.asarray(grade_object_ids,dtype=numpy.int64)
+        shape = (len(self.UserIds), len(self.GradeObjectIds))
+        values = values or {}
+        for f in VALUE_FIELDS:
+            if f in values:
+                a = numpy.asarray(values[f],dtype=numpy.float64)
+                if a.shape != shape:
+                    raise ValueError('{0} array has shape {1}, expected {2}.'.format(f,a.shape,shape))
+            else:
+                a = numpy.full(shape,numpy.nan)
+            setattr(self,f,a)
+        self.Errors = errors or {}
+        self._user_pos = {int(u): i for i, u in enumerate(self.UserIds)}
+        self._object_pos = {int(g): j for j, g in enumerate(self.GradeObjectIds)}
+
+    def __repr__(self):
+        return 'GradebookMatrix({0} users x {1} grade objects)'.format(len(self.UserIds),
+                                                                      len(self.GradeObjectIds))
+
+    @staticmethod
+    def fashion_GradebookMatrix(grade_values,grade_object_ids=None,errors=None):
+        """Build a matrix from already-fetched grade values.
+
+        :param grade_values:
+            Iterable of `(user_id, values)` pairs, where `values` is a list of
+            `d2lvalence_util.data.GradeValue` structures (as returned by
+            `service.get_all_grade_values_for_user_in_org`) or of the raw
+            dicts they wrap.
+        :param grade_object_ids:
+            Grade objects to give columns to, in column order; by default,
+            every grade object any user has a value for, in ascending id
+            order. Values for other grade objects get dropped.
+        """
+        grade_values = list(grade_values)
+        user_ids = [int(u) for u, vals in grade_values]
+        rows = []
+        seen = set()
+        for u, vals in grade_values:
+            row = []
+            for v in vals or ():
+                if hasattr(v, 'props'):
+                    v = v.props
+                g = int(v['GradeObjectIdentifier'])
+                seen.add(g)
+                row.append((g, v))
+            rows.append(row)
+        if grade_object_ids is None:
+            grade_object_ids = sorted(seen)
+        m = GradebookMatrix(user_ids,grade_object_ids,errors=errors)
+        cols = m._object_pos
+        arrays = [(f, getattr(m, f)) for f in VALUE_FIELDS]
+        for i, row in enumerate(rows):
+            for g, v in row:
+                j = cols.get(g)
+                if j is None:
+                    continue
+                for f, a in arrays:
+                    x = v.get(f)
+                    if x is not None:
+                        a[i, j] = x
+        return m
+
+    def user_index(self,user_id):
+        """Retrieve the row number for a user id (KeyError if there's none)."""
+        return self._user_pos[int(user_id)]
+
+    def grade_object_index(self,grade_object_id):
+        """Retrieve the column number for a grade object id (KeyError if there's none)."""
+        return self._object_pos[int(grade_object_id)]
+
+    def row(self,user_id,field='PointsNumerator'):
+        """Retrieve one user's values for every grade object, as a view."""
+        return getattr(self,field)[self.user_index(user_id)]
+
+    def column(self,grade_object_id,field='PointsNumerator'):
+        """Retrieve every user's values for one grade object, as a view."""
+        return getattr(self,field)[:, self.grade_object_index(grade_object_id)]
+
+    def percentages(self,weighted=False):
+        """Retrieve a new array of each value as a percentage of its
+        denominator (NaN where either is missing, or the denominator is 0)."""
+        if weighted:
+            num, den = self.WeightedNumerator, self.WeightedDenominator
+        else:
+            num, den = self.PointsNumerator, self.PointsDenominator
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            result = 100.0 * num / den
+        result[den == 0] = numpy.nan
+        return result
+
+
+def fetch_gradebook_matrix(uc,org_unit_id,user_ids=None,grade_object_ids=None,max_workers=8,ver='1.0',**kwargs):
+    """Fetch the grade values of many users in an org unit into a
+    :class:`GradebookMatrix`.
+
+    :param uc: User context to make the calls with.
+    :param org_unit_id: Org unit to fetch grade values for.
+    :param user_ids:
+        Users to give rows to, in row order; by default, everyone on the org
+        unit's classlist.
+    :param grade_object_ids:
+        Grade objects to give columns to, in column order; by default, every
+        grade object any of the users has a value for, in ascending id order.
+    :param max_workers: Number of per-user fetches to have running at once.
+    :param kwargs:
+        Keyword arguments passed down into every service call (as with
+        :func:`d2lvalence_util.bulk.run_bulk`).
+    """
+    if user_ids is None:
+        user_ids = [int(u.Identifier) for u in d2lservice.get_classlist(uc,org_unit_id,ver=ver,**kwargs)]
+    user_ids = [int(u) for u in user_ids]
+    values = [None] * len(user_ids)
+    errors = {}
+    for res in d2lbulk.run_bulk(d2lservice.get_all_grade_values_for_user_in_org,
+                                uc,
+                                [(org_unit_id, u) for u in user_ids],
+                                max_workers=max_workers,
+                                ver=ver,
+                                **kwargs):
+        if res.ok:
+            values[res.Index] = res.Value
+        else:
+            errors[user_ids[res.Index]] = res.Error
+    return GradebookMatrix.fashion_GradebookMatrix(zip(user_ids, values),
+                                                   grade_object_ids=grade_object_ids,
+                                                   errors=errors)
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, grades module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.grades
+:synopsis: Provides batched reading and writing of grade values for many users.
+"""
+import time
+import threading
+
+import d2lvalence_util.bulk as d2lbulk
+import d2lvalence_util.data as d2ldata
+import d2lvalence_util.ratelimit as d2lratelimit
+import d2lvalence_util.service as d2lservice
+
+
+def _adopt_grade_value(raw):
+    # a copy, so that callers never share (and mutate) the index's dicts
+    if 'PointsNumerator' in raw:
+        return d2ldata.GradeValueComputable.adopt(dict(raw))
+    return d2ldata.GradeValue.adopt(dict(raw))
+
+
+class _OrgGrades(object):
+    # the grade values index for one org unit
+    def __init__(self):
+        self.rows = {}      # user id -> (fetched at, {grade object id: raw value})
+        self.finals = {}    # user id -> (fetched at, raw final value)
+        # per index: the users looked up one at a time so far, and when the
+        # classlist last got fetched in a sweep
+        self.missed = {'rows': set(), 'finals': set()}
+        self.planned = {}
+
+
+class GradeReader(object):
+    """Reads grade values for many users with as few calls as it can, and
+    keeps them in a per-org unit index for lookups with no further call.
+
+    Rather than fetch one grade value per call, the reader fetches each
+    user's whole row of grade values in an org unit at once (with
+    `service.get_all_grade_values_for_user_in_org`), so every later lookup
+    for that user in that org unit costs no call. Once lookups have missed
+    for `batch_after` different users in the same org unit, the reader
+    takes it that the caller is working through the org unit's users, and
+    fetches the rows of everyone on its classlist in parallel (over
+    `max_workers` threads and a pooled session), ahead of the lookups to
+    come. Call :meth:`prefetch` to do the same up front.
+
+    Final grade values have no org-wide route, so they get fetched one per
+    user, but in parallel for the whole classlist once the same pattern
+    shows, and kept in the index likewise.
+
+    Index entries older than `ttl` seconds (if given) get fetched again;
+    call :meth:`invalidate` after changing grade values to drop stale ones.
+
+    :param uc: User context to make the calls with.
+    :param batch_after:
+        Number of users with missed lookups in an org unit after which to
+        fetch the rest of its classlist's grade values (None never to).
+    :param max_workers: Number of fetches to have running at once.
+    :param ttl: Number of seconds index entries stay fresh (None for no limit).
+    :param kwargs: Keyword arguments passed down into every service call.
+    """
+    def __init__(self,uc,batch_after=3,max_workers=8,ttl=None,ver='1.0',**kwargs):
+        self.uc = uc
+        self.batch_after = batch_after
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.ver = ver
+        self.kwargs = kwargs
+        self.calls = 0
+        self._orgs = {}
+        self._lock = threading.Lock()
+
+    def _org(self,org_unit_id):
+        ou = int(org_unit_id)
+        with self._lock:
+            g = self._orgs.get(ou)
+            if g is None:
+                g = self._orgs[ou] = _OrgGrades()
+            return g
+
+    def _fresh(self,entry):
+        return entry is not None and (self.ttl is None or time.time() - entry[0] < self.ttl)
+
+    def _call_kwargs(self):
+        return d2lbulk.pooled_kwargs(self.uc,self.kwargs,self.max_workers)
+
+    def _fetch_row(self,org_unit_id,user_id,**kw):
+        # one user's grade values, as a dict by grade object id
+        values = d2lservice.get_all_grade_values_for_user_in_org(self.uc,org_unit_id,user_id,ver=self.ver,**kw)
+        return {int(v.GradeObjectIdentifier): v.props for v in values}
+
+    def _fetch_final(self,org_unit_id,user_id,**kw):
+        return d2lservice.get_final_grade_value_for_user_in_org(self.uc,org_unit_id,user_id,ver=self.ver,**kw).props
+
+    def _fill(self,org_unit_id,user_ids,fetch,index):
+        # fetch entries for many users in parallel into an index; users whose
+        # fetch fails stay out of it, to be fetched (and fail) on lookup
+        kw, own = self._call_kwargs()
+        try:
+            for res in d2lbulk.run_bulk(lambda uc,u,**k: fetch(org_unit_id,u,**k),
+                                        self.uc,
+                                        user_ids,
+                                        max_workers=self.max_workers,
+                                        **kw):
+                with self._lock:
+                    self.calls += 1
+                    if res.ok:
+                        index[int(res.Args[0])] = (time.time(), res.Value)
+        finally:
+            if own:
+                own.close()
+
+    def _classlist_ids(self,org_unit_id):
+        with self._lock:
+            self.calls += 1
+        return [int(u.Identifier) for u in d2lservice.get_classlist(self.uc,org_unit_id,**self.kwargs)]
+
+    def prefetch(self,org_unit_id,user_ids=None,finals=False):
+        """Fetch the grade values (and, if `finals`, the final grade values)
+        of many users in an org unit (by default, everyone on its classlist)
+        into the index, in parallel; return the reader."""
+        g = self._org(org_unit_id)
+        if user_ids is None:
+            user_ids = self._classlist_ids(org_unit_id)
+        user_ids = [int(u) for u in user_ids]
+        self._fill(org_unit_id,[u for u in user_ids if not self._fresh(g.rows.get(u))],self._fetch_row,g.rows)
+        if finals:
+            self._fill(org_unit_id,[u for u in user_ids if not self._fresh(g.finals.get(u))],self._fetch_final,g.finals)
+        return self
+
+    def _lookup(self,org_unit_id,user_id,index_name,fetch):
+        g = self._org(org_unit_id)
+        user_id = int(user_id)
+        index = getattr(g, index_name)
+        entry = index.get(user_id)
+        if self._fresh(entry):
+            return entry[1]
+        with self._lock:
+            missed = g.missed[index_name]
+            missed.add(user_id)
+            plan = (self.batch_after is not None
+                    and not self._fresh(g.planned.get(index_name))
+                    and len(missed) >= self.batch_after)
+            if plan:
+                g.planned[index_name] = (time.time(),)
+                missed.clear()
+        if plan:
+            # the caller is working through the org unit: fetch everyone else
+            # on the classlist in one parallel sweep
+            users = [u for u in self._classlist_ids(org_unit_id) if not self._fresh(index.get(u))]
+            self._fill(org_unit_id,users,fetch,index)
+            entry = index.get(user_id)
+            if self._fresh(entry):
+                return entry[1]
+        value = fetch(org_unit_id,user_id,**self.kwargs)
+        with self._lock:
+            self.calls += 1
+            index[user_id] = (time.time(), value)
+        return value
+
+    def grade_value(self,org_unit_id,grade_object_id,user_id):
+        """Retrieve a user's grade value for a grade object in an org unit, as
+        `service.get_grade_value_for_user_in_org` would, or None if the user
+        has no value for it."""
+        raw = self._lookup(org_unit_id,user_id,'rows',self._fetch_row).get(int(grade_object_id))
+        if raw is None:
+            return None
+        return _adopt_grade_value(raw)
+
+    def grade_values(self,org_unit_id,user_id):
+        """Retrieve all of a user's grade values in an org unit, as
+        `service.get_all_grade_values_for_user_in_org` would."""
+        row = self._lookup(org_unit_id,user_id,'rows',self._fetch_row)
+        return [_adopt_grade_value(raw) for raw in row.values()]
+
+    def final_grade_value(self,org_unit_id,user_id):
+        """Retrieve a user's final grade value in an org unit, as
+        `service.get_final_grade_value_for_user_in_org` would."""
+        raw = self._lookup(org_unit_id,user_id,'finals',self._fetch_final)
+        return d2ldata.GradeValueComputable.adopt(dict(raw))
+
+    def invalidate(self,org_unit_id=None,user_id=None):
+        """Drop index entries: for one user in an org unit, for a whole org
+        unit, or (by default) for everything."""
+        with self._lock:
+            if org_unit_id is None:
+                self._orgs.clear()
+                return
+            g = self._orgs.get(int(org_unit_id))
+            if g is None:
+                return
+            if user_id is None:
+                del self._orgs[int(org_unit_id)]
+            else:
+                g.rows.pop(int(user_id), None)
+                g.finals.pop(int(user_id), None)
+
+
+class GradeWrite(object):
+    """One row of a :class:`GradeWriter` run: a grade value to write for a
+    user (`GradeObjectId` None for a final adjusted grade value), and the
+    outcome of writing it.
+
+    `Data` is the value's JSON payload, serialized once, when the row gets
+    made. `ok` is true once the row has gone through; `Error` holds the
+    exception its last attempt raised, if it failed; `Attempts` counts how
+    many times it has been sent.
+    """
+    def __init__(self,index,user_id,grade_object_id,value):
+        if grade_object_id is None:
+            if not isinstance(value, d2ldata.IncomingFinalAdjustedGradeValue):
+                raise TypeError('New grade value must implement d2lvalence.data.IncomingFinalAdjustedGradeValue')
+        elif not isinstance(value, d2ldata.IncomingGradeValue):
+            raise TypeError('New grade value must implement d2lvalence.data.IncomingGradeValue')
+        self.Index = index
+        self.UserId = user_id
+        self.GradeObjectId = grade_object_id
+        self.Value = value
+        self.Data = value.as_json().encode(encoding='utf-8')
+        self.Error = None
+        self.Attempts = 0
+        self.ok = False
+
+    def __repr__(self):
+        if self.ok:
+            outcome = 'ok'
+        elif self.Error is not None:
+            outcome = 'error={0!r}'.format(self.Error)
+        else:
+            outcome = 'pending'
+        return 'GradeWrite({0}, user {1}, grade object {2}, {3})'.format(self.Index,self.UserId,self.GradeObjectId,outcome)
+
+
+class GradeWriteReport(object):
+    """Outcome of a :class:`GradeWriter` run: `Rows` holds a
+    :class:`GradeWrite` per input row, in input order."""
+    def __init__(self,org_unit_id,rows):
+        self.OrgUnitId = org_unit_id
+        self.Rows = rows
+
+    def __repr__(self):
+        return 'GradeWriteReport({0} rows, {1} succeeded, {2} failed)'.format(len(self.Rows),
+                                                                           len(self.succeeded),
+                                                                           len(self.failed))
+
+    @property
+    def succeeded(self):
+        return [w for w in self.Rows if w.ok]
+
+    @property
+    def failed(self):
+        return [w for w in self.Rows if not w.ok]
+
+    @property
+    def ok(self):
+        return all(w.ok for w in self.Rows)
+
+
+class GradeWriter(object):
+    """Writes many grade values in an org unit concurrently.
+
+    Each row's payload gets serialized once, up front; the writes then go
+    out `max_workers` at a time over a pooled session, through the process's
+    rate limiter and retry policy (if installed), and no faster than `rate`
+    writes a second (if given). A row whose write fails doesn't stop the
+    rest: the run ends with a :class:`GradeWriteReport` of every row's
+    outcome, and :meth:`retry` re-sends just the rows that failed::
+
+        w = grades.GradeWriter(uc, org_unit_id)
+        report = w.write((u, grade_object_id, value) for u, value in finals.items())
+        while report.failed and tries_left():
+            w.retry(report)
+
+    :param uc: User context to make the calls with.
+    :param org_unit_id: Org unit to write grade values in.
+    :param max_workers: Number of writes to have running at once.
+    :param rate: Maximum number of writes to start a second (None for no limit).
+    :param reader:
+        A :class:`GradeReader` whose index entries to drop for the users
+        written to.
+    :param kwargs: Keyword arguments passed down into every service call.
+    """
+    def __init__(self,uc,org_unit_id,max_workers=8,rate=None,reader=None,ver='1.0',**kwargs):
+        self.uc = uc
+        self.org_unit_id = org_unit_id
+        self.max_workers = max_workers
+        self.reader = reader
+        self.ver = ver
+        self.kwargs = kwargs
+        self._bucket = None
+        if rate:
+            self._bucket = d2lratelimit.TokenBucket(rate)
+
+    def _send(self,uc,w,**kw):
+        if self._bucket:
+            self._bucket.acquire()
+        kw['data'] = w.Data
+        if w.GradeObjectId is None:
+            return d2lservice.update_final_adjusted_grade_value_for_user_in_org(uc,self.org_unit_id,w.UserId,w.Value,ver=self.ver,**kw)
+        return d2lservice.update_grade_value_for_user_in_org(uc,self.org_unit_id,w.GradeObjectId,w.UserId,w.Value,ver=self.ver,**kw)
+
+    def _run(self,rows):
+        kw, own = d2lbulk.pooled_kwargs(self.uc,self.kwargs,self.max_workers)
+        try:
+            for res in d2lbulk.run_bulk(self._send,
+                                        self.uc,
+                                        [(w,) for w in rows],
+                                        max_workers=self.max_workers,
+                                        **kw):
+                w = res.Args[0]
+                w.Attempts += 1
+                w.Error = res.Error
+                w.ok = res.ok
+                if res.ok and self.reader:
+                    self.reader.invalidate(self.org_unit_id,w.UserId)
+        finally:
+            if own:
+                own.close()
+
+    def write(self,rows):
+        """Write grade values.
+
+        :param rows:
+            Iterable of `(user_id, grade_object_id, value)` tuples, where
+            `value` is a `d2lvalence_util.data.IncomingGradeValue`, or (with
+            `grade_object_id` None) a
+            `d2lvalence_util.data.IncomingFinalAdjustedGradeValue`.
+
+        :returns: :class:`GradeWriteReport` of the run.
+        """
+        report = GradeWriteReport(self.org_unit_id,
+                                  [GradeWrite(i,u,g,v) for i, (u, g, v) in enumerate(rows)])
+        self._run(report.Rows)
+        return report
+
+    def retry(self,report):
+        """Re-send the rows of a report that failed (leaving the rows that
+        went through alone), updating the report in place; return it."""
+        self._run(report.failed)
+        return report
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, multipart module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.multipart
+:synopsis: Provides streaming multipart request bodies for the D2L Valence upload routes.
+"""
+import io
+import os
+import mmap         # for sending files on disk without copying them into Python bytes
+import json         # for packing dicts into JSON parts
+import uuid         # for generating unique boundary tags
+
+# number of bytes read from a file stream at a time while sending it
+CHUNK_SIZE = 64 * 1024
+
+
+class MappedFile(object):
+    """File on disk to send as (part of) a request body.
+
+    The file gets opened only while the body is being sent, and goes out
+    straight from a read-only memory map of its pages, without ever getting
+    copied into Python byte strings.
+
+    :param path: Path of the file.
+    """
+    def __init__(self,path):
+        self.path = os.fspath(path)
+        self.size = os.stat(self.path).st_size
+
+    def __repr__(self):
+        return 'MappedFile({0!r}, {1} bytes)'.format(self.path,self.size)
+
+
+class MultipartBody(object):
+    """Request body assembled from byte strings and files, sent without ever
+    holding a whole file in memory.
+
+    Hand an instance to the requests library as a request's `data`: its
+    length is known up front, so the request goes out with a Content-Length
+    header rather than chunked, and iterating over it yields the byte strings
+    as they are and the files' contents `chunk_size` bytes at a time.
+
+    A file can be a binary file stream, an `mmap.mmap`, or a
+    :class:`MappedFile`. Files on disk (including streams opened on them) go
+    out as memoryview slices of a read-only memory map, so their data reaches
+    the socket without a copy into Python byte strings; other streams get
+    read a chunk at a time.
+
+    Each stream gets sent from its beginning, and rewound again afterwards.
+    The body can be iterated over more than once (for example, to re-send a
+    failed request); a stream that can't seek gets read into memory up front.
+
+    :param pieces:
+        Sequence of byte strings (str gets encoded as UTF-8) and files, in the
+        order they make up the body.
+    :param chunk_size: Number of bytes to send from a file at a time.
+    """
+    def __init__(self,pieces,chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._pieces = []
+        self._length = 0
+        pending = []
+        for piece in pieces:
+            if isinstance(piece, str):
+                piece = piece.encode(encoding='utf-8')
+            if isinstance(piece, (bytes, bytearray, memoryview)):
+                # run consecutive byte strings together, so that the part
+                # headers don't each go out in a tiny write of their own
+                pending.append(bytes(piece))
+                continue
+            if isinstance(piece, mmap.mmap):
+                size = len(piece)
+            elif isinstance(piece, MappedFile):
+                size = piece.size
+            elif _seekable(piece):
+                piece.seek(0, io.SEEK_END)
+                size = piece.tell()
+                piece.seek(0)
+            else:
+                pending.append(piece.read())
+                continue
+            if pending:
+                self._add_bytes(b''.join(pending))
+                pending = []
+            self._pieces.append((piece, size))
+            self._length += size
+        if pending:
+            self._add_bytes(b''.join(pending))
+
+    def _add_bytes(self,b):
+        self._pieces.append((b, None))
+        self._length += len(b)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for piece, size in self._pieces:
+            if size is None:
+                yield piece
+            elif isinstance(piece, mmap.mmap):
+                yield from _map_chunks(piece,size,self.chunk_size)
+            elif isinstance(piece, MappedFile):
+                with open(piece.path, 'rb') as f:
+                    yield from _stream_chunks(f,size,self.chunk_size)
+            else:
+                yield from _stream_chunks(piece,size,self.chunk_size)
+
+    def __bytes__(self):
+        # copy each memoryview slice out before the next one releases it
+        return b''.join(bytes(chunk) for chunk in self)
+
+    def __repr__(self):
+        return 'MultipartBody({0} bytes)'.format(self._length)
+
+
+class MultipartEncoder(object):
+    """Assembles a multipart request body, part by part.
+
+    Add parts in order with :meth:`add_json`, :meth:`add_text`,
+    :meth:`add_file` or :meth:`add_part`, then send :meth:`body` with the
+    :attr:`content_type` header. Adding a part costs the same however many
+    parts precede it, and file parts stream from their files when sent (see
+    :class:`MultipartBody`)::
+
+        e = MultipartEncoder('mixed')
+        e.add_json(news_item_data)
+        for f in attachments:
+            e.add_file(f, name='file')
+
+    :param subtype: Multipart subtype: 'mixed' or 'form-data'.
+    :param boundary: Boundary tag (by default, a fresh random one).
+    :param chunk_size: Number of bytes to read from a stream at a time.
+    """
+    def __init__(self,subtype='mixed',boundary=None,chunk_size=CHUNK_SIZE):
+        self.subtype = subtype
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self._pieces = []
+
+    @property
+    def content_type(self):
+        return 'multipart/{0}; boundary={1}'.format(self.subtype,self.boundary)
+
+    def __len__(self):
+        """Retrieve the number of parts added so far."""
+        return len(self._pieces) // 2
+
+    def add_part(self,headers,content):
+        """Add a part.
+
+        :param headers: Sequence of (name, value) pairs for the part's headers.
+        :param content:
+            Byte string (str gets encoded as UTF-8) or binary file stream
+            holding the part's content.
+        """
+        if self._pieces:
+            delimiter = '\r\n--'
+        else:
+            delimiter = '--'
+        head = [delimiter, self.boundary, '\r\n']
+        for name, value in headers:
+            head.append('{0}: {1}\r\n'.format(name,value))
+        head.append('\r\n')
+        self._pieces.append(''.join(head).encode(encoding='utf-8'))
+        self._pieces.append(content)
+
+    def add_json(self,data,name=None):
+        """Add a JSON part from a D2L data structure, a dict or a JSON string,
+        with a form-data disposition if given a `name`."""
+        if hasattr(data, 'as_json'):
+            data = data.as_json()
+        elif not isinstance(data, str):
+            data = json.dumps(data)
+        headers = []
+        if name is not None:
+            headers.append(('Content-Disposition', 'form-data; name="{0}"'.format(name)))
+        headers.append(('Content-Type', 'application/json'))
+        self.add_part(headers,data)
+
+    def add_text(self,name,text,content_type='text/plain'):
+        """Add a named form-data text part."""
+        self.add_part([('Content-Disposition', 'form-data; name="{0}"'.format(name)),
+                       ('Content-Type', content_type)],
+                      str(text))
+
+    def add_file(self,f,name=''):
+        """Add a named form-data file part from a `d2lvalence_util.data.D2LFile`,
+        whose `Name`, `ContentType` and `Stream` (or `Path`) supply the file's
+        name, content type and data; a file without a `ContentType` goes as
+        `application/octet-stream`."""
+        content_type = f.props.get('ContentType') or 'application/octet-stream'
+        if 'Stream' in f.props:
+            content = f.Stream
+        else:
+            content = MappedFile(f.Path)
+        self.add_part([('Content-Disposition', 'form-data; name="{0}"; filename="{1}"'.format(name,f.Name)),
+                       ('Content-Type', content_type)],
+                      content)
+
+    def add_files(self,files):
+        """Add form-data file parts from a dict (or sequence of pairs) mapping
+        field names to `(filename, fileobj)` or `(filename, fileobj,
+        content_type)` tuples, as the requests library takes in `files`."""
+        if hasattr(files, 'items'):
+            files = files.items()
+        for name, v in files:
+            content_type = 'application/octet-stream'
+            if len(v) > 2 and v[2]:
+                content_type = v[2]
+            self.add_part([('Content-Disposition', 'form-data; name="{0}"; filename="{1}"'.format(name,v[0])),
+                           ('Content-Type', content_type)],
+                          v[1])
+
+    def body(self):
+        """Retrieve the assembled body, ready to send."""
+        return MultipartBody(self._pieces + ['\r\n--{0}--'.format(self.boundary)],
+                             chunk_size=self.chunk_size)
+
+
+def _stream_chunks(f,size,chunk_size):
+    f.seek(0) # check the tape
+    mm = _map_stream(f,size)
+    if mm is not None:
+        try:
+            yield from _map_chunks(mm,size,chunk_size)
+        finally:
+            mm.close()
+    else:
+        remaining = size
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                raise IOError('File stream ended {0} bytes short of its expected length.'.format(remaining))
+            remaining -= len(chunk)
+            yield chunk
+    f.seek(0) # please be kind, rewind
+
+def _map_stream(f,size):
+    # map a stream opened on a file on disk; None for any other stream
+    if size <= 0:
+        return None
+    try:
+        fd = f.fileno()
+        if f.writable():
+            f.flush()
+        return mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def _map_chunks(mm,size,chunk_size):
+    # Slices get released as soon as the consumer asks for the next one, so
+    # that nothing still points into the map when its owner closes it; the
+    # consumer must be done with each slice by then (as a blocking socket
+    # send is).
+    view = memoryview(mm)
+    chunk = None
+    try:
+        for i in range(0, size, chunk_size):
+            chunk = view[i:i + chunk_size]
+            yield chunk
+            chunk.release()
+    finally:
+        if chunk is not None:
+            chunk.release()
+        view.release()
+
+def _seekable(f):
+    if hasattr(f, 'seekable'):
+        try:
+            return f.seekable()
+        except (ValueError, OSError):
+            return False
+    return hasattr(f, 'seek') and hasattr(f, 'tell')
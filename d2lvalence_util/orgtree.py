@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, org tree module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.orgtree
+:synopsis: Provides a locally cached graph of an LMS's org structure.
+"""
+import os
+import json
+import time
+import threading
+
+import d2lvalence_util.bulk as d2lbulk
+import d2lvalence_util.data as d2ldata
+import d2lvalence_util.service as d2lservice
+
+
+# version of the on-disk snapshot layout written by OrgTree.save()
+SNAPSHOT_FORMAT = 2
+
+
+def _unit(raw,types):
+    # the compact form the tree keeps each org unit in, noting its type's
+    # code and name in types
+    t = raw.get('Type') or {}
+    types[t.get('Id')] = (t.get('Code'), t.get('Name'))
+    return (raw.get('Name'), raw.get('Code'), t.get('Id'))
+
+
+class _OrgGraph(object):
+    # One immutable build of the org structure. The parent and type indexes
+    # get derived from the children lists on first use, so that
+    # loading a snapshot costs no more than reading it.
+    def __init__(self,root,units,children,types):
+        self.root = root
+        self.units = units
+        self.children = children
+        self.types = types
+        self._parents = None
+        self._by_type = None
+
+    @property
+    def parents(self):
+        if self._parents is None:
+            # most units have just the one parent, so fill in a parent's
+            # children wholesale and then patch up the few shared with others
+            parents = {}
+            for pid, kids in self.children.items():
+                shared = {cid: parents[cid] for cid in parents.keys() & kids}
+                parents.update(dict.fromkeys(kids, (pid,)))
+                for cid, others in shared.items():
+                    parents[cid] = others + (pid,)
+            self._parents = parents
+        return self._parents
+
+    @property
+    def by_type(self):
+        if self._by_type is None:
+            by_type = {}
+            for ou, u in self.units.items():
+                by_type.setdefault(u[2], []).append(ou)
+            self._by_type = {k: tuple(v) for k, v in by_type.items()}
+        return self._by_type
+
+
+class OrgDiff(object):
+    """Changes an :meth:`OrgTree.sync` found in the org structure.
+
+    `Added` and `Removed` are sets of the ids of org units that appeared and
+    disappeared; `Moved` maps the id of each org unit whose parents changed to
+    a pair of tuples of its old and new parent ids; `Changed` is a set of the
+    ids of org units whose name, code or type changed.
+    """
+    def __init__(self,added=None,removed=None,moved=None,changed=None):
+        self.Added = added or set()
+        self.Removed = removed or set()
+        self.Moved = moved or {}
+        self.Changed = changed or set()
+
+    def __bool__(self):
+        return bool(self.Added or self.Removed or self.Moved or self.Changed)
+
+    def __repr__(self):
+        return 'OrgDiff(added={0}, removed={1}, moved={2}, changed={3})'.format(len(self.Added),
+                                                                               len(self.Removed),
+                                                                               len(self.Moved),
+                                                                               len(self.Changed))
+
+
+class OrgTree(object):
+    """In-memory graph of an LMS's org structure, answering structure queries
+    locally instead of with a service call apiece.
+
+    The tree gets built from one listing of the organization's descendants,
+    which supplies every unit and its type; since that listing carries no
+    parent links, the children lists of the units then get read in one wave
+    (fanned out over `max_workers` threads and a pooled session), skipping
+    the units of the types in `leaf_type_ids` (sections, say) that never have
+    children. It keeps, for
+    every unit, its parents and children, and for every org unit type, the
+    units of that type, so that queries cost time in proportion to the size of
+    their results.
+
+    The org structure is a graph rather than a strict tree: a unit can have
+    more than one parent (a course offering under both its department and its
+    semester, say). Queries that walk the graph report each unit once.
+
+    The tree builds itself on first use, and brings itself up to date with
+    :meth:`sync` on first use after `ttl` seconds (if given) have passed; call
+    :meth:`sync` or :meth:`refresh` to do so on demand. Queries made while an
+    update is underway see the tree as it was before.
+
+    Given a `snapshot` path, the tree saves itself there after every build
+    or sync, and starts out from the snapshot (if one exists for the same
+    host) instead of from the service, so that a cold start costs only the
+    time to read a file.
+
+    Query methods take org unit ids as ints or strings, and return lists of
+    `d2lvalence_util.data.OrgUnit` structures (or of int ids, with
+    `ids=True`); those taking an `org_unit_type_id` return only units of that
+    type.
+
+    :param uc: User context to make the calls with.
+    :param ttl: Number of seconds a build stays fresh (None for no limit).
+    :param leaf_type_ids: Org unit types to assume have no children.
+    :param max_workers: Number of adjacency calls to have running at once.
+    :param snapshot: Path of a file to keep a snapshot of the tree in.
+    :param kwargs: Keyword arguments passed down into every service call.
+    """
+    def __init__(self,uc,ttl=None,leaf_type_ids=(),max_workers=8,snapshot=None,ver='1.0',**kwargs):
+        self.uc = uc
+        self.ttl = ttl
+        self.snapshot = snapshot
+        self.leaf_type_ids = frozenset(int(x) for x in leaf_type_ids)
+        self.max_workers = max_workers
+        self.ver = ver
+        self.kwargs = kwargs
+        self.loaded_at = None
+        self._graph = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        g = self._graph
+        if g is None:
+            return 'OrgTree(not loaded)'
+        return 'OrgTree({0} org units under {1})'.format(len(g.units),g.root)
+
+    @property
+    def stale(self):
+        """True if the tree needs building or syncing before it can answer queries."""
+        if self._graph is None:
+            return True
+        return self.ttl is not None and time.time() - self.loaded_at >= self.ttl
+
+    def _current(self):
+        if self.stale:
+            with self._lock:
+                if self._graph is None and self.snapshot:
+                    self._load(self.snapshot)
+                if self.stale:
+                    self._sync(None)
+        return self._graph
+
+    def _install(self,graph,loaded_at=None):
+        self._graph = graph
+        self.loaded_at = loaded_at or time.time()
+        if self.snapshot and loaded_at is None:
+            self._save(graph,self.snapshot)
+
+    def _call_kwargs(self):
+        return d2lbulk.pooled_kwargs(self.uc,self.kwargs,self.max_workers)
+
+    def _fetch_children(self,ids,kw):
+        # yield (parent id, raw JSON list of its children) for each id
+        for res in d2lbulk.run_bulk(d2lservice.get_orgunit_children,
+                                    self.uc,
+                                    ids,
+                                    max_workers=self.max_workers,
+                                    ordered=True,
+                                    ver=self.ver,
+                                    lazy=True,
+                                    **kw):
+            if not res.ok:
+                raise res.Error
+            yield int(res.Args[0]), res.Value.raw
+
+    def _build(self):
+        kw, own = self._call_kwargs()
+        try:
+            org = d2lservice.get_organization_info(self.uc,ver=self.ver,**kw)
+            root = int(org.Identifier)
+            types = {}
+            units = {root: _unit(d2lservice.get_orgunit_properties(self.uc,root,**kw).props,types)}
+            for c in d2lservice.get_orgunit_descendants(self.uc,root,ver=self.ver,lazy=True,**kw).raw:
+                units[int(c['Identifier'])] = _unit(c,types)
+            # the listing says what units there are, but not where they sit:
+            # read the children lists of all the units that can have any
+            children = {}
+            asks = [ou for ou, u in units.items() if ou == root or u[2] not in self.leaf_type_ids]
+            for pid, raw in self._fetch_children(asks,kw):
+                kids = tuple(int(c['Identifier']) for c in raw)
+                if kids:
+                    children[pid] = kids
+        finally:
+            if own:
+                own.close()
+        return _OrgGraph(root,units,children,types)
+
+    def refresh(self):
+        """Rebuild the tree from the service now, from scratch."""
+        with self._lock:
+            self._install(self._build())
+        return self
+
+    def sync(self,org_unit_ids=None):
+        """Bring the tree up to date with the service, reporting what changed.
+
+        Reads the properties of the given org units (by default, the root)
+        and the children lists of the units in their subtrees that can have
+        children (a level at a time, fanned out as in a build), and puts the
+        lists in place of the ones the tree holds, so that units added, moved
+        between parents or renamed anywhere in those subtrees show up; no
+        descendants listing gets read. Units that entered or left a subtree
+        get their parents read, to patch the children lists of any parents
+        outside the given subtrees; the rest of the tree stays as it was.
+        Units gone from the org structure get dropped, along with anything
+        left out of reach of the root. With no tree to start from, builds one
+        (and reports every unit as added).
+
+        :param org_unit_ids:
+            Org units whose subtrees to compare (by default, the whole tree).
+
+        :returns: :class:`OrgDiff` of the changes found.
+        """
+        with self._lock:
+            if self._graph is None and self.snapshot:
+                self._load(self.snapshot)
+            return self._sync(org_unit_ids)
+
+    def _fetch_parents(self,ids,kw):
+        # yield (id, tuple of parent ids) for each id; a unit the service no
+        # longer knows has no parents
+        for res in d2lbulk.run_bulk(d2lservice.get_orgunit_parents,
+                                    self.uc,
+                                    ids,
+                                    max_workers=self.max_workers,
+                                    ver=self.ver,
+                                    lazy=True,
+                                    **kw):
+            if res.ok:
+                yield int(res.Args[0]), tuple(int(p['Identifier']) for p in res.Value.raw)
+            elif getattr(getattr(res.Error, 'response', None), 'status_code', None) == 404:
+                yield int(res.Args[0]), ()
+            else:
+                raise res.Error
+
+    def _sync(self,org_unit_ids):
+        old = self._graph
+        if old is None:
+            self._install(self._build())
+            return OrgDiff(added=set(self._graph.units))
+        if org_unit_ids is None:
+            scope = [old.root]
+        else:
+            scope = [int(ou) for ou in org_unit_ids]
+        units = dict(old.units)
+        types = dict(old.types)
+        children = dict(old.children)
+        kw, own = self._call_kwargs()
+        try:
+            for res in d2lbulk.run_bulk(d2lservice.get_orgunit_properties,
+                                        self.uc,
+                                        scope,
+                                        max_workers=self.max_workers,
+                                        **kw):
+                if not res.ok:
+                    raise res.Error
+                units[int(res.Args[0])] = _unit(res.Value.props,types)
+
+            # read the children lists under the scope units afresh, a level at
+            # a time, skipping the units that can't have any
+            read = set()
+            seen = set(scope)
+            level = list(scope)
+            while level:
+                asks = [ou for ou in level if ou in scope or units[ou][2] not in self.leaf_type_ids]
+                read.update(asks)
+                level = []
+                for pid, raw in self._fetch_children(asks,kw):
+                    kids = []
+                    for c in raw:
+                        cid = int(c['Identifier'])
+                        units[cid] = _unit(c,types)
+                        kids.append(cid)
+                        if cid not in seen:
+                            seen.add(cid)
+                            level.append(cid)
+                    if kids:
+                        children[pid] = tuple(kids)
+                    else:
+                        children.pop(pid, None)
+
+            # units that entered or left a subtree can still hang off units
+            # outside the scope: read their parents, to patch those units'
+            # children lists (under the root, a unit that left is gone)
+            had = set(scope)
+            for ou in scope:
+                had.update(self._walk(old,ou,old.children))
+            moved = (had ^ seen) & old.units.keys()
+            parents = {}
+            if old.root not in scope:
+                parents = dict(self._fetch_parents(sorted(moved),kw))
+        finally:
+            if own:
+                own.close()
+
+        old_parents = old.parents
+        for ou in moved:
+            ps = parents.get(ou, ())
+            for p in old_parents.get(ou, ()):
+                if p not in ps and p not in read and p in children:
+                    kids = tuple(k for k in children[p] if k != ou)
+                    if kids:
+                        children[p] = kids
+                    else:
+                        del children[p]
+            for p in ps:
+                if p not in read and ou not in children.get(p, ()):
+                    children[p] = children.get(p, ()) + (ou,)
+
+        # drop whatever the changes left out of reach of the root
+        reach = {old.root}
+        level = [old.root]
+        while level:
+            nxt = []
+            for ou in level:
+                for cid in children.get(ou, ()):
+                    if cid not in reach:
+                        reach.add(cid)
+                        nxt.append(cid)
+            level = nxt
+        units = {ou: u for ou, u in units.items() if ou in reach}
+        children = {ou: kids for ou, kids in children.items() if ou in reach}
+        new = _OrgGraph(old.root,units,children,types)
+
+        diff = OrgDiff(added=units.keys() - old.units.keys(),
+                       removed=old.units.keys() - units.keys())
+        for ou, u in units.items():
+            was = old.units.get(ou)
+            if was is not None and was != u:
+                diff.Changed.add(ou)
+        if children != old.children:
+            old_parents, new_parents = old.parents, new.parents
+            for ou in units:
+                if ou in old.units:
+                    was = old_parents.get(ou, ())
+                    now = new_parents.get(ou, ())
+                    if set(was) != set(now):
+                        diff.Moved[ou] = (was, now)
+        self._install(new)
+        return diff
+
+    def save(self,path):
+        """Write a snapshot of the tree to a file (replacing it atomically)."""
+        self._save(self._current(),path)
+
+    def _save(self,g,path):
+        # The snapshot is a JSON object of flat columns (unit ids, names,
+        # codes and type ids; parent ids and their lists of child ids), under
+        # a format version, so that any Python can read it back, and loading
+        # one takes little more than the JSON decode and a few zips.
+        names, codes, type_ids = zip(*g.units.values())
+        snap = {'format': SNAPSHOT_FORMAT,
+                'host': self.uc.host,
+                'root': g.root,
+                'loaded_at': self.loaded_at,
+                'types': [(t, c, n) for t, (c, n) in g.types.items()],
+                'ids': list(g.units),
+                'names': names,
+                'codes': codes,
+                'type_ids': type_ids,
+                'parent_ids': list(g.children),
+                'children': list(g.children.values())}
+        tmp = '{0}.{1}.tmp'.format(path,os.getpid())
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snap, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def _load(self,path):
+        # Install the snapshot at path, if there's a readable one of this
+        # format for this host; return whether there was.
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(snap, dict) or (snap.get('format'), snap.get('host')) != (SNAPSHOT_FORMAT, self.uc.host):
+            return False
+        self._install(_OrgGraph(snap['root'],
+                                dict(zip(snap['ids'], zip(snap['names'], snap['codes'], snap['type_ids']))),
+                                dict(zip(snap['parent_ids'], map(tuple, snap['children']))),
+                                {t: (c, n) for t, c, n in snap['types']}),
+                      loaded_at=snap['loaded_at'])
+        return True
+
+    def load(self,path=None):
+        """Replace the tree with the snapshot in a file (by default, the
+        `snapshot` file); return whether there was a usable snapshot there."""
+        with self._lock:
+            return self._load(path or self.snapshot)
+
+    def _unit_of(self,g,ou):
+        u = g.units[ou]
+        c, n = g.types.get(u[2], (None, None))
+        return d2ldata.OrgUnit.adopt({'Identifier': str(ou),
+                                      'Name': u[0],
+                                      'Code': u[1],
+                                      'Type': {'Id': u[2], 'Code': c, 'Name': n}})
+
+    def _result(self,g,found,org_unit_type_id,ids):
+        if org_unit_type_id is not None:
+            t = int(org_unit_type_id)
+            found = [ou for ou in found if g.units[ou][2] == t]
+        if ids:
+            return list(found)
+        return [self._unit_of(g,ou) for ou in found]
+
+    def _walk(self,g,ou,links):
+        found = []
+        seen = set()
+        stack = list(reversed(links.get(ou, ())))
+        while stack:
+            x = stack.pop()
+            if x in seen:
+                continue
+            seen.add(x)
+            found.append(x)
+            stack.extend(reversed(links.get(x, ())))
+        return found
+
+    @property
+    def root(self):
+        """Id of the organization's root org unit."""
+        return self._current().root
+
+    def __len__(self):
+        return len(self._current().units)
+
+    def __contains__(self,ou):
+        return int(ou) in self._current().units
+
+    def get(self,ou):
+        """Retrieve an org unit (KeyError if the tree has no such unit)."""
+        g = self._current()
+        return self._unit_of(g,int(ou))
+
+    def children(self,ou,org_unit_type_id=None,ids=False):
+        g = self._current()
+        ou = int(ou)
+        g.units[ou]
+        return self._result(g,g.children.get(ou, ()),org_unit_type_id,ids)
+
+    def parents(self,ou,org_unit_type_id=None,ids=False):
+        g = self._current()
+        ou = int(ou)
+        g.units[ou]
+        return self._result(g,g.parents.get(ou, ()),org_unit_type_id,ids)
+
+    def descendants(self,ou,org_unit_type_id=None,ids=False):
+        """Retrieve every unit below an org unit, in depth-first order."""
+        g = self._current()
+        ou = int(ou)
+        g.units[ou]
+        return self._result(g,self._walk(g,ou,g.children),org_unit_type_id,ids)
+
+    def ancestors(self,ou,org_unit_type_id=None,ids=False):
+        """Retrieve every unit above an org unit, nearest first along each
+        line of parents."""
+        g = self._current()
+        ou = int(ou)
+        g.units[ou]
+        return self._result(g,self._walk(g,ou,g.parents),org_unit_type_id,ids)
+
+    def path(self,ou,ids=False):
+        """Retrieve the units on a shortest path from the root down to an org
+        unit, inclusive (an empty list if the unit isn't under the root); of
+        equally short paths, the one through the lowest parent ids."""
+        g = self._current()
+        ou = int(ou)
+        g.units[ou]
+        # breadth-first up the parent links, until the root turns up
+        below = {ou: None}
+        level = [ou]
+        while level and g.root not in below:
+            nxt = []
+            for x in level:
+                for p in sorted(g.parents.get(x, ())):
+                    if p not in below:
+                        below[p] = x
+                        nxt.append(p)
+            level = nxt
+        if g.root not in below:
+            return []
+        found = []
+        x = g.root
+        while x is not None:
+            found.append(x)
+            x = below[x]
+        return self._result(g,found,None,ids)
+
+    def of_type(self,org_unit_type_id,ids=False):
+        """Retrieve every unit of an org unit type."""
+        g = self._current()
+        return self._result(g,g.by_type.get(int(org_unit_type_id), ()),None,ids)
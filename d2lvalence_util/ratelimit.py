@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, rate limiting module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.ratelimit
+:synopsis: Provides client-side rate limiting and adaptive concurrency control for D2L Valence calls.
+"""
+import re
+import time
+import asyncio     # for waiting out limits without blocking an event loop
+import threading
+import email.utils  # for parsing HTTP-date Retry-After values
+
+# status codes the LMS uses to tell us to slow down
+THROTTLE_STATUS_CODES = (429, 503)
+
+_family_re = re.compile(r'^/d2l/api/([^/]+)/')
+
+def route_family(route):
+    """Retrieve the product component ('lp', 'le', 'lr', 'eP', ...) an API
+    route belongs to, or None if the route doesn't look like an API route."""
+    m = _family_re.match(route)
+    if m:
+        return m.group(1)
+    return None
+
+def retry_after_seconds(r):
+    """Retrieve the delay a response's `Retry-After` header asks for, in
+    seconds, or None if the response carries no usable header."""
+    if r is None or 'retry-after' not in r.headers:
+        return None
+    v = r.headers['retry-after'].strip()
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(v).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _wake(fut):
+    # wake a coroutine waiting on fut, from its own event loop's thread
+    if not fut.done():
+        fut.set_result(None)
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket allowing `rate` acquisitions a second on
+    average, with bursts of up to `burst`."""
+    def __init__(self,rate,burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        # take a token, returning 0; or return how long until one is due
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0
+            return (1.0 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class AdaptiveConcurrency(object):
+    """Thread-safe limit on the number of calls in flight, adjusted from the
+    outcome of each call.
+
+    A throttled call (429/503) halves the limit; a call that completes within
+    `latency_tolerance` times the best latency seen lately raises the limit by
+    about one for every `limit` such calls, up to `maximum`.
+    """
+    def __init__(self,initial=4,minimum=1,maximum=64,latency_tolerance=2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self._baseline = None
+        self._cond = threading.Condition()
+        self._waiters = []  # (loop, future) pairs of coroutines waiting their turn
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                fut = loop.create_future()
+                self._waiters.append((loop, fut))
+            try:
+                await fut
+            finally:
+                with self._cond:
+                    if (loop, fut) in self._waiters:
+                        self._waiters.remove((loop, fut))
+
+    def release(self,latency=None,throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(float(self.minimum), self.limit / 2)
+            elif latency is not None:
+                if self._baseline is None or latency < self._baseline:
+                    self._baseline = latency
+                else:
+                    # let the baseline drift up slowly, so one lucky fast call
+                    # doesn't pin it forever
+                    self._baseline = self._baseline * 0.99 + latency * 0.01
+                if latency <= self._baseline * self.latency_tolerance:
+                    self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, fut)
+            except RuntimeError:
+                pass    # the loop has closed
+
+
+class _Lane(object):
+    # the limiter state for one (host, route family) pair
+    def __init__(self,rate=None,burst=None,max_concurrency=None,initial_concurrency=None,
+                 min_concurrency=1,adaptive=True,latency_tolerance=2.0):
+        self.bucket = None
+        if rate:
+            self.bucket = TokenBucket(rate,burst)
+        self.concurrency = None
+        if max_concurrency:
+            if not adaptive:
+                initial_concurrency = max_concurrency
+            self.concurrency = AdaptiveConcurrency(initial=initial_concurrency or max_concurrency,
+                                                   minimum=min_concurrency,
+                                                   maximum=max_concurrency,
+                                                   latency_tolerance=latency_tolerance)
+        self.adaptive = adaptive
+        self.not_before = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self,seconds):
+        with self.lock:
+            self.not_before = max(self.not_before, time.monotonic() + seconds)
+
+    def _paused_for(self):
+        with self.lock:
+            return self.not_before - time.monotonic()
+
+    def acquire(self):
+        while True:
+            wait = self._paused_for()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        if self.bucket:
+            self.bucket.acquire()
+        if self.concurrency:
+            self.concurrency.acquire()
+
+    async def acquire_async(self):
+        while True:
+            wait = self._paused_for()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        if self.bucket:
+            await self.bucket.acquire_async()
+        if self.concurrency:
+            await self.concurrency.acquire_async()
+
+    def release(self,latency,throttled):
+        if self.concurrency:
+            if self.adaptive:
+                self.concurrency.release(latency=latency,throttled=throttled)
+            else:
+                self.concurrency.release()
+
+class _Slot(object):
+    def __init__(self,lane,started):
+        self.lane = lane
+        self.started = started
+
+
+class RateLimiter(object):
+    """Process-wide client-side limiter for Valence calls.
+
+    Each (host, route family) pair gets its own lane, with an optional token
+    bucket (`rate` calls a second, bursts of `burst`) and an optional limit on
+    calls in flight (`max_concurrency`) that adapts to the server's responses
+    unless `adaptive` is false. A lane's settings come from the most specific
+    :meth:`configure` call matching it, falling back to the constructor's.
+
+    A throttled response (429/503) pauses its lane for as long as the
+    response's `Retry-After` header asks, and (if adaptive) halves the lane's
+    concurrency limit; quick responses ramp the limit back up.
+
+    Install a limiter for all service calls with
+    :func:`d2lvalence_util.service.set_rate_limiter`.
+    """
+    def __init__(self,rate=None,burst=None,max_concurrency=None,initial_concurrency=None,
+                 min_concurrency=1,adaptive=True,latency_tolerance=2.0):
+        self._defaults = {'rate': rate,
+                          'burst': burst,
+                          'max_concurrency': max_concurrency,
+                          'initial_concurrency': initial_concurrency,
+                          'min_concurrency': min_concurrency,
+                          'adaptive': adaptive,
+                          'latency_tolerance': latency_tolerance}
+        self._config = {}
+        self._lanes = {}
+        self._lock = threading.Lock()
+
+    def configure(self,host=None,family=None,**settings):
+        """Override lane settings for a host, a route family ('lp', 'le', 'lr',
+        'eP', ...), or a host and route family together. Takes the same
+        keyword settings as the constructor; resets any lanes it affects."""
+        for k in settings:
+            if k not in self._defaults:
+                raise TypeError('Unknown rate limiter setting: {0}'.format(k))
+        with self._lock:
+            self._config.setdefault((host, family), {}).update(settings)
+            for key in list(self._lanes):
+                if host in (None, key[0]) and family in (None, key[1]):
+                    del self._lanes[key]
+
+    def _settings(self,host,family):
+        s = dict(self._defaults)
+        for key in ((None, None), (None, family), (host, None), (host, family)):
+            if key in self._config:
+                s.update(self._config[key])
+        return s
+
+    def _lane(self,host,family):
+        key = (host, family)
+        lane = self._lanes.get(key)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.get(key)
+                if lane is None:
+                    lane = self._lanes[key] = _Lane(**self._settings(host,family))
+        return lane
+
+    def acquire(self,host,route):
+        """Wait until a call to `route` on `host` may go out; returns a slot to
+        hand back to :meth:`release` once the call completes."""
+        lane = self._lane(host,route_family(route))
+        lane.acquire()
+        return _Slot(lane,time.monotonic())
+
+    async def acquire_async(self,host,route):
+        """Coroutine counterpart of :meth:`acquire`, for the `aioservice`
+        transport: waits its turn without blocking the event loop."""
+        lane = self._lane(host,route_family(route))
+        await lane.acquire_async()
+        return _Slot(lane,time.monotonic())
+
+    def release(self,slot,r=None):
+        """Return a slot, recording the call's response (or None if the call
+        failed without one)."""
+        throttled = r is not None and r.status_code in THROTTLE_STATUS_CODES
+        if throttled:
+            delay = retry_after_seconds(r)
+            if delay:
+                slot.lane.pause(delay)
+        latency = None
+        if r is not None:
+            latency = time.monotonic() - slot.started
+        slot.lane.release(latency,throttled)
+
+    def stats(self):
+        """Retrieve a dict, keyed by (host, family), of each lane's current
+        concurrency limit and calls in flight."""
+        result = {}
+        for key, lane in list(self._lanes.items()):
+            if lane.concurrency:
+                result[key] = {'limit': int(lane.concurrency.limit),
+                               'in_flight': lane.concurrency.in_flight}
+            else:
+                result[key] = {'limit': None, 'in_flight': None}
+        return result
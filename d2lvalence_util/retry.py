@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, retry module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.retry
+:synopsis: Provides retry policies for transient failures in D2L Valence calls.
+"""
+import re
+import random
+import threading
+import requests
+
+import d2lvalence_util.ratelimit as d2lratelimit
+
+# methods that leave the server in the same state however many times we send them
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# POST routes that are safe to send more than once
+SAFE_POST_ROUTES = (r'^/d2l/api/versions/check$',
+                    r'/profile/(?:myProfile|user/[^/]+|[^/]+)/image$',
+                    r'/grades/final/calculated/[^/]+$',
+                    r'/news/[^/]+/dismiss$',
+                    r'/news/[^/]+/restore$',
+                    r'^/d2l/api/lr/[^/]+/objects/[^/]+/(?:[^/]+/)?properties/$')
+
+# status codes worth another try
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy(object):
+    """Decides whether, and after how long, to re-send a failed Valence call.
+
+    A call gets re-sent when it fails with a connection error or timeout, or
+    with one of `retry_status_codes`, for up to `max_attempts` attempts in all.
+    Only calls that are safe to repeat get re-sent: GET, HEAD, PUT and DELETE
+    calls, and POST calls to routes matching one of `safe_post_routes` (or
+    declared later with :meth:`declare_safe_post`). A POST to any other route
+    gets re-sent only if it never reached the server (a connect timeout).
+
+    The delay before attempt `n` is a random fraction of
+    `min(max_backoff, backoff * 2**n)`, or the response's `Retry-After`
+    (capped at `max_retry_after`) when that's longer.
+
+    The retry budget bounds how much extra load retries can add when the
+    server is struggling: each first attempt earns `budget_ratio` of a retry,
+    on top of a standing allowance of `budget_reserve` retries, and each
+    retry spends one. The budget never holds more than the reserve plus what
+    `budget_window` first attempts earn, so a long quiet spell can't bank a
+    burst of retries for the next outage.
+
+    Install a policy for every service call in the process with
+    :func:`d2lvalence_util.service.set_retry_policy`.
+    """
+    def __init__(self,max_attempts=4,backoff=0.5,max_backoff=30.0,max_retry_after=300.0,
+                 retry_status_codes=RETRY_STATUS_CODES,safe_post_routes=SAFE_POST_ROUTES,
+                 budget_ratio=0.2,budget_reserve=10,budget_window=100):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.retry_status_codes = tuple(retry_status_codes)
+        self.safe_post_routes = [re.compile(x) for x in safe_post_routes]
+        self.budget_ratio = budget_ratio
+        self.budget_reserve = budget_reserve
+        self.budget_window = budget_window
+        self._budget = float(budget_reserve)
+        self._lock = threading.Lock()
+
+    def declare_safe_post(self,pattern):
+        """Mark POST routes matching the regular expression `pattern` as safe
+        to re-send."""
+        self.safe_post_routes.append(re.compile(pattern))
+
+    def is_repeatable(self,method,route):
+        if method.upper() in IDEMPOTENT_METHODS:
+            return True
+        if method.upper() == 'POST':
+            for p in self.safe_post_routes:
+                if p.search(route):
+                    return True
+        return False
+
+    def begin(self):
+        """Record a first attempt, earning retry budget."""
+        with self._lock:
+            self._budget = min(self._budget + self.budget_ratio,
+                               self.budget_reserve + self.budget_ratio * self.budget_window)
+
+    def _spend(self):
+        with self._lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            return True
+
+    def next_delay(self,method,route,attempt,r=None,exc=None):
+        """Retrieve the delay, in seconds, before re-sending a call whose
+        `attempt` (counting from zero) ended in response `r` or exception
+        `exc`; or None if the call shouldn't get re-sent."""
+        if attempt + 1 >= self.max_attempts:
+            return None
+        if exc is not None:
+            if isinstance(exc, requests.exceptions.ConnectTimeout):
+                pass
+            elif not isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+                return None
+            elif not self.is_repeatable(method,route):
+                return None
+        elif r is None or r.status_code not in self.retry_status_codes:
+            return None
+        elif not self.is_repeatable(method,route):
+            return None
+        if not self._spend():
+            return None
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+        retry_after = d2lratelimit.retry_after_seconds(r)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_retry_after))
+        return delay
+
+
+def mark_streams(kwargs):
+    """Note the current position of every seekable stream in a call's `data`
+    and `files`, so that :func:`rewind_streams` can replay the upload."""
+    streams = []
+    data = kwargs.get('data')
+    if hasattr(data, 'seek') and hasattr(data, 'tell'):
+        streams.append(data)
+    files = kwargs.get('files')
+    if files:
+        if hasattr(files, 'values'):
+            files = files.values()
+        for f in files:
+            if isinstance(f, (tuple, list)):
+                # (name, fileobj, ...) tuple or a (field, (name, fileobj)) pair
+                f = f[1]
+                if isinstance(f, (tuple, list)):
+                    f = f[1]
+            if hasattr(f, 'seek') and hasattr(f, 'tell'):
+                streams.append(f)
+    return [(f, f.tell()) for f in streams]
+
+def rewind_streams(marks):
+    for f, pos in marks:
+        f.seek(pos)
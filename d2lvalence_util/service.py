@@ -20,12 +20,51 @@
 :synopsis: Provides a suite of convenience functions for making D2L Valence calls.
 """
 import sys          # for exception throwing
+import time         # for waiting out retry backoff delays
+import threading    # for coalescing identical GET calls in flight at once
 import json         # for packing and unpacking dicts into JSON structures
 import requests     # for making HTTP requests of the back-end service
-import uuid         # for generating unique boundary tags in multi-part POST/PUT requests
+import concurrent.futures   # for reading ahead the next page of a paged result set
 
 import d2lvalence.auth as d2lauth
 import d2lvalence_util.data as d2ldata
+import d2lvalence_util.multipart as d2lmultipart
+import d2lvalence_util.session as d2lsession
+import d2lvalence_util.ratelimit as d2lratelimit
+import d2lvalence_util.retry as d2lretry
+import d2lvalence_util.cache as d2lcache
+
+# decode JSON response bodies with the fastest decoder installed, picked once
+# here rather than on every call; all of them decode straight from bytes
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+        _json_loads = ujson.loads
+    except ImportError:
+        try:
+            import simdjson
+            _json_loads = simdjson.loads
+        except ImportError:
+            _json_loads = json.loads
+
+# session used for calls made without an explicit `d2lsession` keyword arg;
+# None means each call goes out over its own throwaway connection
+_default_session = None
+
+# rate limiter, retry policy and response cache shared by all calls made in
+# this process, if any
+_rate_limiter = None
+_retry_policy = None
+_response_cache = None
+
+# whether identical GET calls in flight at the same time share one request,
+# and the requests in flight so shared, by key
+_coalesce_gets = True
+_flights = {}
+_flights_lock = threading.Lock()
 
 # internal utility functions
 def _str_to_num(s):
@@ -37,26 +76,489 @@ def _str_to_num(s):
         r = float(s)
     return r
 
-def _fetch_content(r,debug=None):
+def _debug_response(r,debug=None):
     if debug and not isinstance(debug, d2ldata.D2LDebugInfo):
         raise TypeError('If not None, debug info object must implement d2lvalence.data.D2LDebugInfo')
     elif debug:
-        # DebugInfo object passed down: add the response object to it
+        # DebugInfo object passed down: add the request and response objects to it
+        debug.add_request(r.request)
         debug.add_response(r)
+
+def _fetch_content(r,debug=None):
+    _debug_response(r,debug=debug)
     r.raise_for_status()
     ct = ''
     if 'content-type' in r.headers:
         ct = r.headers['content-type']
     if 'application/json' in ct:
-        if requests.__version__[0] is '0':
-            return r.json
-        else:
-            return r.json()
+        return _json_loads(r.content)
     elif 'text/plain' in ct:
         return r.text
     else:
         return r.content
 
+def _cached_content(e):
+    # decode a cached response body as _fetch_content decoded the original
+    if 'application/json' in e.ContentType:
+        return _json_loads(e.Body)
+    elif 'text/plain' in e.ContentType:
+        return str(e.Body, e.Encoding or 'utf-8', errors='replace')
+    else:
+        return e.Body
+
+def _pop_session(kwargs):
+    s = _default_session
+    if 'd2lsession' in kwargs:
+        s = kwargs['d2lsession']
+        del kwargs['d2lsession']
+    if s and not isinstance(s, d2lsession.D2LSession):
+        raise TypeError('If not None, session object must implement d2lvalence_util.session.D2LSession')
+    return s
+
+def _pop_cache(kwargs):
+    c = _response_cache
+    if 'd2lcache' in kwargs:
+        c = kwargs['d2lcache']
+        del kwargs['d2lcache']
+    if c and not isinstance(c, d2lcache.ResponseCache):
+        raise TypeError('If not None, cache object must implement d2lvalence_util.cache.ResponseCache')
+    return c
+
+class _Flight(object):
+    # one GET call in flight, for identical calls made meanwhile to wait on
+    def __init__(self):
+        self.done = threading.Event()
+        self.r = None
+        self.exc = None
+
+def _flight_key(uc,method,route,s,kwargs):
+    # the key under which a call can share another's request, or None if it
+    # can't: it must be a plain GET going out over the network
+    if not _coalesce_gets or method != 'GET' or (s and not s.transmits):
+        return None
+    if kwargs.get('stream') or kwargs.get('data') or kwargs.get('files'):
+        return None
+    headers = tuple(sorted((kwargs.get('headers') or {}).items()))
+    return (d2lcache.cache_key(uc,route,kwargs.get('params')), headers)
+
+def _coalesced(key,call):
+    # Make the call, unless an identical one is already in flight: then wait
+    # for that one's response instead. The response body gets read before
+    # it's shared, and each caller decodes its own copy of it, so callers
+    # never share (and mutate) the same structures.
+    if key is None:
+        return call()
+    with _flights_lock:
+        f = _flights.get(key)
+        leader = f is None
+        if leader:
+            f = _flights[key] = _Flight()
+    if not leader:
+        f.done.wait()
+        if f.exc is not None:
+            raise f.exc
+        return f.r
+    try:
+        f.r = call()
+        f.r.content
+        return f.r
+    except Exception as e:
+        f.exc = e
+        raise
+    except BaseException as e:
+        # the leader got interrupted (KeyboardInterrupt, a cancelled task):
+        # the followers have no response either, so they fail too
+        f.exc = RuntimeError('The identical call this one was waiting on got interrupted.')
+        f.exc.__cause__ = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        f.done.set()
+
+def _dispatch(uc,method,route,s,call,marks=None):
+    # apply the process-wide call policies around actually sending a request;
+    # the aioservice transport applies them itself, to the request it captures
+    if s and not s.transmits:
+        return call()
+    if _retry_policy:
+        _retry_policy.begin()
+    attempt = 0
+    while True:
+        r = exc = None
+        slot = None
+        if _rate_limiter:
+            slot = _rate_limiter.acquire(uc.host,route)
+        try:
+            r = call()
+        except requests.exceptions.RequestException as e:
+            exc = e
+        finally:
+            if slot:
+                _rate_limiter.release(slot,r)
+        delay = None
+        if _retry_policy:
+            delay = _retry_policy.next_delay(method,route,attempt,r=r,exc=exc)
+        if delay is None:
+            if exc is not None:
+                raise exc
+            return r
+        if r is not None:
+            r.close()
+        time.sleep(delay)
+        if marks:
+            d2lretry.rewind_streams(marks)
+        attempt += 1
+
+def _send(method,route,uc,**kwargs):
+    d = None
+    if 'd2ldebug' in kwargs:
+        d = kwargs['d2ldebug']
+        del kwargs['d2ldebug']
+    dl = None
+    if 'd2ldownload' in kwargs:
+        dl = kwargs['d2ldownload']
+        del kwargs['d2ldownload']
+    s = _pop_session(kwargs)
+    c = _pop_cache(kwargs)
+    url = uc.scheme + '://' + uc.host + route
+    if s and s.check_host(uc):
+        send = s.request
+    else:
+        send = requests.request
+    if dl and c and c.offline:
+        if method != 'GET':
+            raise d2lcache.CacheMiss('Offline cache cannot send {0} {1}.'.format(method,route))
+        return _replay_download(uc,route,kwargs,c,dl)
+    if dl:
+        return _download(uc,method,route,url,s,send,kwargs,dl,debug=d)
+    if c and method == 'GET':
+        ttl = c.ttl_for(route)
+        if ttl is not None or c.offline:
+            return _cached_get(uc,route,url,s,send,kwargs,c,ttl,debug=d)
+    if c and c.offline:
+        raise d2lcache.CacheMiss('Offline cache cannot send {0} {1}.'.format(method,route))
+    marks = d2lretry.mark_streams(kwargs)
+    r = _coalesced(_flight_key(uc,method,route,s,kwargs),
+                   lambda: _dispatch(uc,method,route,s,lambda: send(method, url, **kwargs),marks))
+    return _fetch_content(r,debug=d)
+
+def _cached_get(uc,route,url,s,send,kwargs,c,ttl,debug=None):
+    key = d2lcache.cache_key(uc,route,kwargs.get('params'))
+    # a session replaying a response already fetched has had its lookup counted
+    e = c.lookup(key,count=not getattr(s, 'replays', False))
+    if e is not None and (e.fresh or c.offline):
+        return _cached_content(e)
+    if c.offline:
+        raise d2lcache.CacheMiss('Offline cache holds no response for GET {0}.'.format(key))
+    kw = kwargs
+    if e is not None:
+        # a stale response with validators: ask for the body only if changed
+        kw = dict(kwargs)
+        kw['headers'] = dict(kwargs.get('headers') or {})
+        kw['headers'].update(e.conditional_headers())
+    r = _coalesced(_flight_key(uc,'GET',route,s,kw),
+                   lambda: _dispatch(uc,'GET',route,s,lambda: send('GET', url, **kw)))
+    if e is not None and r.status_code == 304:
+        _debug_response(r,debug=debug)
+        r.close()
+        c.revalidated(key,e,ttl,r)
+        return _cached_content(e)
+    result = _fetch_content(r,debug=debug)
+    ct = r.headers.get('content-type', '')
+    encoding = None
+    if 'text/plain' in ct:
+        encoding = r.encoding or r.apparent_encoding
+    c.store(key,d2lcache.CachedResponse(r.content,ct,encoding,
+                                        etag=r.headers.get('etag'),
+                                        last_modified=r.headers.get('last-modified')),
+            ttl)
+    return result
+
+def _replay_download(uc,route,kwargs,c,dl):
+    # an offline cache can fill a download only from a response it holds
+    if not isinstance(dl, d2ldata.D2LDownload):
+        raise TypeError('If not None, download object must implement d2lvalence.data.D2LDownload')
+    key = d2lcache.cache_key(uc,route,kwargs.get('params'))
+    e = c.lookup(key)
+    if e is None:
+        raise d2lcache.CacheMiss('Offline cache holds no response for GET {0}.'.format(key))
+    dl.begin()
+    try:
+        dl.seek(0)
+        dl.ContentType = e.ContentType
+        dl.ETag = e.ETag
+        dl.LastModified = e.LastModified
+        dl.Size = len(e.Body)
+        for i in range(0, len(e.Body), dl.chunk_size):
+            dl.write(e.Body[i:i+dl.chunk_size])
+        dl.finish()
+    finally:
+        dl.end()
+    return dl
+
+def _download(uc,method,route,url,s,send,kwargs,dl,debug=None):
+    if not isinstance(dl, d2ldata.D2LDownload):
+        raise TypeError('If not None, download object must implement d2lvalence.data.D2LDownload')
+    kwargs['stream'] = True
+    # byte offsets (for resuming and ranges) only line up with the file if the
+    # server sends it as is, rather than compressed on the fly
+    kwargs['headers'] = dict(kwargs.get('headers') or {})
+    kwargs['headers'].setdefault('Accept-Encoding', 'identity')
+    offset = dl.begin()
+    try:
+        # ranged parallel fetches need a real connection pool to run over
+        if dl.connections > 1 and method == 'GET' and (not s or s.transmits):
+            own = not s
+            if own:
+                s = d2lsession.D2LSession.fashion_D2LSession(uc,pool_maxsize=dl.connections)
+                send = s.request
+            try:
+                _download_parts(uc,route,url,s,send,kwargs,dl,offset,debug=debug)
+            finally:
+                if own:
+                    s.close()
+        else:
+            _download_stream(uc,method,route,url,s,send,kwargs,dl,offset,debug=debug)
+        dl.finish()
+    finally:
+        dl.end()
+    return dl
+
+def _ranged_kwargs(kwargs,dl,start,end=''):
+    kw = dict(kwargs)
+    kw['headers'] = dict(kwargs.get('headers') or {})
+    kw['headers']['Range'] = 'bytes={0}-{1}'.format(start,end)
+    if dl.ETag or dl.LastModified:
+        kw['headers']['If-Range'] = dl.ETag or dl.LastModified
+    return kw
+
+def _range_start(r):
+    # 'bytes 100-199/200' -> 100
+    return int(r.headers['content-range'].split()[1].split('-')[0])
+
+def _encoded(r):
+    return r.headers.get('content-encoding', 'identity').lower() != 'identity'
+
+def _range_complete(r,offset):
+    # a 416 to a request for the rest of a file we already have all of
+    return r.status_code == 416 and r.headers.get('content-range', '').rpartition('/')[2] == str(offset)
+
+def _download_stream(uc,method,route,url,s,send,kwargs,dl,offset,debug=None):
+    # stream the response body into the download's target, picking the
+    # transfer back up with a Range request if it breaks off part way
+    while True:
+        kw = kwargs
+        if offset:
+            kw = _ranged_kwargs(kwargs,dl,offset)
+        r = _dispatch(uc,method,route,s,lambda: send(method, url, **kw))
+        _debug_response(r,debug=debug)
+        try:
+            if offset and _range_complete(r,offset):
+                dl.Size = offset
+                return
+            r.raise_for_status()
+            if r.status_code == 206 and _encoded(r):
+                raise IOError('Server sent an encoded range of the file, which cannot be written into place.')
+            if r.status_code == 206:
+                offset = _range_start(r)
+            else:
+                offset = 0
+            dl.seek(offset)
+            dl.accept(r,offset)
+            for chunk in r.iter_content(dl.chunk_size):
+                dl.write(chunk)
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+            # what we have of an encoded body doesn't map onto a byte range
+            if dl.Resumes >= dl.max_resumes or _encoded(r):
+                raise
+        else:
+            if dl.Size is None or dl.Offset >= dl.Size:
+                return
+            if dl.Resumes >= dl.max_resumes:
+                raise IOError('Download ended after {0} of {1} bytes.'.format(dl.Offset,dl.Size))
+        finally:
+            r.close()
+        dl.resumed()
+        offset = dl.Offset
+
+def _download_parts(uc,route,url,s,send,kwargs,dl,offset,debug=None):
+    # fetch the first part, learning the file's size, then the rest of the
+    # parts in parallel, each written straight into place
+    kw = _ranged_kwargs(kwargs,dl,offset,offset + dl.part_size - 1)
+    r = _dispatch(uc,'GET',route,s,lambda: send('GET', url, **kw))
+    _debug_response(r,debug=debug)
+    if offset and _range_complete(r,offset):
+        r.close()
+        dl.Size = offset
+        return
+    if r.status_code != 206 or _encoded(r):
+        # the server ignores Range requests (or encodes the ranges it sends):
+        # fall back to a single stream
+        r.close()
+        r.raise_for_status()
+        _download_stream(uc,'GET',route,url,s,send,kwargs,dl,0,debug=debug)
+        return
+    start = _range_start(r)
+    dl.seek(start)
+    dl.accept(r,start)
+    if dl.Size is None:
+        r.close()
+        _download_stream(uc,'GET',route,url,s,send,kwargs,dl,start,debug=debug)
+        return
+    dl.allocate(dl.Size)
+    parts = [[start, min(start + dl.part_size, dl.Size) - 1, start]]
+    for p in range(parts[0][1] + 1, dl.Size, dl.part_size):
+        parts.append([p, min(p + dl.part_size, dl.Size) - 1, p])
+
+    def fetch(part,r=None):
+        # part is [first byte, last byte, next byte to write]
+        resumes = 0
+        while part[2] <= part[1]:
+            if r is None:
+                kw = _ranged_kwargs(kwargs,dl,part[2],part[1])
+                r = _dispatch(uc,'GET',route,s,lambda: send('GET', url, **kw))
+            try:
+                r.raise_for_status()
+                if r.status_code != 206 or _range_start(r) != part[2]:
+                    raise IOError('Server stopped honouring Range requests part way through the download (has the file changed?).')
+                for chunk in r.iter_content(dl.chunk_size):
+                    dl.write_at(part[2],chunk)
+                    part[2] += len(chunk)
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+                if resumes >= dl.max_resumes:
+                    raise
+                resumes += 1
+                dl.resumed()
+            finally:
+                r.close()
+                r = None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=dl.connections) as pool:
+        futures = [pool.submit(fetch,parts[0],r)]
+        futures += [pool.submit(fetch,p) for p in parts[1:]]
+        done, pending = concurrent.futures.wait(futures,return_when=concurrent.futures.FIRST_EXCEPTION)
+        for f in pending:
+            f.cancel()
+    for f in futures:
+        if f.done() and not f.cancelled() and f.exception():
+            # keep only the unbroken run of file data from the start, so the
+            # download can get resumed later
+            end = start
+            for p in parts:
+                end = p[2]
+                if p[2] <= p[1]:
+                    break
+            dl.seek(end)
+            raise f.exception()
+    dl.seek(dl.Size)
+
+def _multipart_kwargs(encoder,kwargs):
+    # files passed down from higher calling layers join the encoded parts
+    if kwargs.get('files'):
+        encoder.add_files(kwargs.pop('files'))
+    kwargs.setdefault('data',encoder.body())
+    kwargs['headers'] = dict(kwargs.get('headers') or {})
+    kwargs['headers'].update({'Content-Type':encoder.content_type})
+    return kwargs
+
+def _multipart_post(route,uc,encoder,**kwargs):
+    return _post(route,uc,**_multipart_kwargs(encoder,kwargs))
+
+def _multipart_put(route,uc,encoder,**kwargs):
+    return _put(route,uc,**_multipart_kwargs(encoder,kwargs))
+
+def set_default_session(s=None):
+    """Install a `session.D2LSession` for all service calls made without an
+    explicit `d2lsession` keyword argument; pass None to go back to making
+    each call over its own throwaway connection."""
+    global _default_session
+    if s and not isinstance(s, d2lsession.D2LSession):
+        raise TypeError('If not None, session object must implement d2lvalence_util.session.D2LSession')
+    _default_session = s
+
+def get_default_session():
+    return _default_session
+
+def set_rate_limiter(limiter=None):
+    """Install a `ratelimit.RateLimiter` that all service calls in this process
+    go through; pass None to remove it."""
+    global _rate_limiter
+    if limiter and not isinstance(limiter, d2lratelimit.RateLimiter):
+        raise TypeError('If not None, rate limiter must implement d2lvalence_util.ratelimit.RateLimiter')
+    _rate_limiter = limiter
+
+def get_rate_limiter():
+    return _rate_limiter
+
+def set_retry_policy(policy=None):
+    """Install a `retry.RetryPolicy` governing the re-sending of every service
+    call in this process that fails transiently; pass None to remove it."""
+    global _retry_policy
+    if policy and not isinstance(policy, d2lretry.RetryPolicy):
+        raise TypeError('If not None, retry policy must implement d2lvalence_util.retry.RetryPolicy')
+    _retry_policy = policy
+
+def get_retry_policy():
+    return _retry_policy
+
+def set_request_coalescing(enabled=True):
+    """Turn on or off the sharing of one request among identical GET calls
+    (same host, user context, route, query parameters and headers) in flight
+    at the same time in this process; it's on by default."""
+    global _coalesce_gets
+    _coalesce_gets = bool(enabled)
+
+def get_request_coalescing():
+    return _coalesce_gets
+
+def set_response_cache(cache=None):
+    """Install a `cache.ResponseCache` that all service GET calls in this
+    process consult; pass None to remove it."""
+    global _response_cache
+    if cache and not isinstance(cache, d2lcache.ResponseCache):
+        raise TypeError('If not None, cache object must implement d2lvalence_util.cache.ResponseCache')
+    _response_cache = cache
+
+def get_response_cache():
+    return _response_cache
+
+def _paged_kwargs(kwargs):
+    # each page fetch gets its own kwargs, since the service functions update
+    # the params dict in place with the page bookmark
+    kw = dict(kwargs)
+    if kw.get('params'):
+        kw['params'] = dict(kw['params'])
+    return kw
+
+def _iter_paged(fetch,wrap,read_ahead=False):
+    """Walk the bookmark chain of a paged result set, yielding each item passed
+    through `wrap`. If `read_ahead` is true, fetch the next page on a worker
+    thread while the caller consumes the current one."""
+    executor = None
+    if read_ahead:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    try:
+        page = fetch(None)
+        while page:
+            nxt = None
+            more = page.HasMoreItems and page.Bookmark
+            if more and executor:
+                nxt = executor.submit(fetch, page.Bookmark)
+            items = page.Items
+            page = None
+            for i in range(len(items)):
+                yield wrap(items[i])
+            if not more:
+                break
+            elif nxt:
+                page = nxt.result()
+            else:
+                page = fetch(more)
+    finally:
+        if executor:
+            executor.shutdown(wait=False)
+
 def _delete(route,uc,**kwargs):
     if uc.anonymous:
         raise ValueError('User context cannot be anonymous.').with_traceback(sys.exc_info()[2])
@@ -64,12 +566,7 @@ def _delete(route,uc,**kwargs):
     kwargs.setdefault('data', None)
     kwargs.setdefault('headers', None)
     kwargs.setdefault('auth', uc)
-    d = None
-    if 'd2ldebug' in kwargs:
-        d = kwargs['d2ldebug']
-        del kwargs['d2ldebug']
-    r = requests.delete(uc.scheme + '://' + uc.host + route, **kwargs)
-    return _fetch_content(r,debug=d)
+    return _send('DELETE',route,uc,**kwargs)
 
 def _get(route,uc,**kwargs):
     if uc.anonymous:
@@ -78,12 +575,7 @@ def _get(route,uc,**kwargs):
     kwargs.setdefault('data', None)
     kwargs.setdefault('headers', None)
     kwargs.setdefault('auth', uc)
-    d = None
-    if 'd2ldebug' in kwargs:
-        d = kwargs['d2ldebug']
-        del kwargs['d2ldebug']
-    r = requests.get(uc.scheme + '://' + uc.host + route, **kwargs)
-    return _fetch_content(r,debug=d)
+    return _send('GET',route,uc,**kwargs)
 
 def _post(route,uc,**kwargs):
     if uc.anonymous:
@@ -93,12 +585,7 @@ def _post(route,uc,**kwargs):
     kwargs.setdefault('headers', None)
     kwargs.setdefault('files', None)
     kwargs.setdefault('auth', uc)
-    d = None
-    if 'd2ldebug' in kwargs:
-        d = kwargs['d2ldebug']
-        del kwargs['d2ldebug']
-    r = requests.post(uc.scheme + '://' + uc.host + route, **kwargs)
-    return _fetch_content(r,debug=d)
+    return _send('POST',route,uc,**kwargs)
 
 def _put(route,uc,**kwargs):
     if uc.anonymous:
@@ -108,24 +595,14 @@ def _put(route,uc,**kwargs):
     kwargs.setdefault('headers', None)
     kwargs.setdefault('files', None)
     kwargs.setdefault('auth', uc)
-    d = None
-    if 'd2ldebug' in kwargs:
-        d = kwargs['d2ldebug']
-        del kwargs['d2ldebug']
-    r = requests.put(uc.scheme + '://' + uc.host + route, **kwargs)
-    return _fetch_content(r,debug=d)
+    return _send('PUT',route,uc,**kwargs)
 
 def _get_anon(route,uc,**kwargs):
     kwargs.setdefault('params', None)
     kwargs.setdefault('data', None)
     kwargs.setdefault('headers', None)
     kwargs.setdefault('auth', uc)
-    d = None
-    if 'd2ldebug' in kwargs:
-        d = kwargs['d2ldebug']
-        del kwargs['d2ldebug']
-    r = requests.get(uc.scheme + '://' + uc.host + route, **kwargs)
-    return _fetch_content(r,debug=d)
+    return _send('GET',route,uc,**kwargs)
 
 def _post_anon(route,uc,**kwargs):
     kwargs.setdefault('params', None)
@@ -133,65 +610,16 @@ def _post_anon(route,uc,**kwargs):
     kwargs.setdefault('headers', None)
     kwargs.setdefault('files', None)
     kwargs.setdefault('auth', uc)
-    d = None
-    if 'd2ldebug' in kwargs:
-        d = kwargs['d2ldebug']
-        del kwargs['d2ldebug']
-    r = requests.post(uc.scheme + '://' + uc.host + route, **kwargs)
-    return _fetch_content(r,debug=d)
+    return _send('POST',route,uc,**kwargs)
 
 def _simple_upload(route,uc,f,**kwargs):
     if not isinstance(f, d2ldata.D2LFile):
         raise TypeError('File must implement d2lvalence.data.D2LFile').with_traceback(sys.exc_info()[2])
 
-    boundary = uuid.uuid4().hex
-    f.Stream.seek(0) # check the tape
-    fdata = f.Stream.read()
-    f.Stream.seek(0) # please be kind, rewind
-
-    pdescr = '--{0}\r\nContent-Type: application/json\r\n\r\n{1}\r\n'.format(boundary,json.dumps(f.DescriptorDict)).encode(encoding='utf-8')
-    ptopbound = '--{0}\r\nContent-Disposition: form-data; name=""; filename="{1}"\r\nContent-Type: {2}\r\n\r\n'.format(boundary,f.Name,f.ContentType).encode(encoding='utf-8')
-    pbotbound = '\r\n--{0}--'.format(boundary).encode(encoding='utf-8')
-
-    payload = pdescr + ptopbound + fdata + pbotbound
-
-    ctype_header = {'Content-Type':'multipart/mixed;boundary='+boundary}
-
-    # populate the default state of the passed in kwargs that we care about
-    kwargs.setdefault('auth',uc)
-    kwargs.setdefault('data',payload)
-    kwargs.setdefault('files',None)
-    kwargs.setdefault('params',None)
-    kwargs.setdefault('headers',None)
-    kwargs.setdefault('verify',True)
-    d = None
-    if 'd2ldebug' in kwargs:
-        d = kwargs['d2ldebug']
-        del kwargs['d2ldebug']
-
-    s = requests.Session()
-    # set the session default values
-    s.auth = kwargs['auth']
-    s.verify = kwargs['verify']
-    if kwargs['headers']:
-        s.headers.update(kwargs['headers'])
-    if kwargs['params']:
-        s.params.update(kwargs['params'])
-
-    # Build PreppedRequest
-    p = requests.Request('POST',
-                         uc.scheme + '://' + uc.host + route,
-                         data = kwargs['data'],
-                         auth = s.auth,
-                         headers = s.headers,
-                         params = s.params).prepare()
-
-    # overlay the multipart content type header
-    p.headers.update(ctype_header)
-    if d:
-        d.add_request(p)
-    r = s.send(p)
-    return _fetch_content(r,debug=d)
+    e = d2lmultipart.MultipartEncoder('mixed')
+    e.add_json(f.DescriptorDict)
+    e.add_file(f)
+    return _multipart_post(route,uc,e,**kwargs)
 
 
 ## API Properties functions
@@ -199,11 +627,11 @@ def _simple_upload(route,uc,f,**kwargs):
 
 def get_versions_for_product_component(uc,pc,**kwargs):
     route = '/d2l/api/{0}/versions/'.format(pc)
-    return d2ldata.ProductVersions(_get_anon(route,uc,**kwargs))
+    return d2ldata.ProductVersions.adopt(_get_anon(route,uc,**kwargs))
 
 def get_version_for_product_component(uc,pc,ver,**kwargs):
     route = '/d2l/api/{0}/versions/{1}'.format(pc,ver)
-    return d2ldata.SupportedVersion(_get_anon(route,uc,**kwargs))
+    return d2ldata.SupportedVersion.adopt(_get_anon(route,uc,**kwargs))
 
 def get_all_versions(uc,**kwargs):
     route = '/d2l/api/versions/'
@@ -224,7 +652,7 @@ def check_versions(uc,supported_version_request_array,**kwargs):
     kwargs.setdefault('data',json.dumps(reqs))
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
-    return d2ldata.BulkSupportedVersionResponse(_post_anon(route,uc,**kwargs))
+    return d2ldata.BulkSupportedVersionResponse.adopt(_post_anon(route,uc,**kwargs))
 
 
 ## User functions
@@ -250,21 +678,26 @@ def get_users(uc,org_defined_id=None,user_name=None,bookmark=None,ver='1.0',**kw
             pass
         else:
             for i in range(len(r)):
-                result.append(d2ldata.UserData(r[i]))
+                result.append(d2ldata.UserData.adopt(r[i]))
     elif user_name:
-        result = d2ldata.UserData(r)
+        result = d2ldata.UserData.adopt(r)
     else:
-        result = d2ldata.PagedResultSet(r)
+        result = d2ldata.PagedResultSet.adopt(r)
 
     return result
 
+def iter_users(uc,read_ahead=False,ver='1.0',**kwargs):
+    def fetch(bookmark):
+        return get_users(uc,bookmark=bookmark,ver=ver,**_paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.UserData.adopt,read_ahead=read_ahead)
+
 def get_user(uc,user_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/users/{1}'.format(ver,user_id)
-    return d2ldata.UserData(_get(route,uc,**kwargs))
+    return d2ldata.UserData.adopt(_get(route,uc,**kwargs))
 
 def get_whoami(uc,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/users/whoami'.format(ver)
-    return d2ldata.WhoAmIUser(_get(route,uc,**kwargs))
+    return d2ldata.WhoAmIUser.adopt(_get(route,uc,**kwargs))
 
 def create_user(uc,create_user_data,ver='1.0',**kwargs):
     if not isinstance(create_user_data, d2ldata.CreateUserData):
@@ -273,7 +706,7 @@ def create_user(uc,create_user_data,ver='1.0',**kwargs):
     kwargs.setdefault('data',create_user_data.as_json())
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
-    return d2ldata.UserData(_post(route,uc,**kwargs))
+    return d2ldata.UserData.adopt(_post(route,uc,**kwargs))
 
 def update_user(uc,user_id,update_user_data,ver='1.0',**kwargs):
     if not isinstance(update_user_data, d2ldata.UpdateUserData):
@@ -282,12 +715,12 @@ def update_user(uc,user_id,update_user_data,ver='1.0',**kwargs):
     kwargs.setdefault('data',update_user_data.as_json())
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
-    return d2ldata.UserData(_put(route,uc,**kwargs))
+    return d2ldata.UserData.adopt(_put(route,uc,**kwargs))
 
 # Activation
 def get_user_activation(uc,user_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/users/{1}/activation'.format(ver,user_id)
-    return d2ldata.UserActivationData(_get(route,uc,**kwargs))
+    return d2ldata.UserActivationData.adopt(_get(route,uc,**kwargs))
 
 def update_user_activation(uc,user_id,activation_data,ver='1.0',**kwargs):
     if not isinstance(activation_data, d2ldata.UserActivationData):
@@ -313,7 +746,7 @@ def delete_profile_image_by_user_id(uc,user_id,ver='1.0',**kwargs):
 
 def get_profile_by_profile_id(uc,profile_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/profile/{1}'.format(ver,profile_id)
-    return d2ldata.UserProfile(_get(route,uc,**kwargs))
+    return d2ldata.UserProfile.adopt(_get(route,uc,**kwargs))
 
 def get_profile_image_by_profile_id(uc,profile_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/profile/{1}/image'.format(ver,profile_id)
@@ -321,7 +754,7 @@ def get_profile_image_by_profile_id(uc,profile_id,ver='1.0',**kwargs):
 
 def get_profile_by_user_id(uc,user_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/profile/user/{1}'.format(ver,user_id)
-    return d2ldata.UserProfile(_get(route,uc,**kwargs))
+    return d2ldata.UserProfile.adopt(_get(route,uc,**kwargs))
 
 def get_profile_image_by_user_id(uc,user_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/profile/user/{1}/image'.format(ver,user_id)
@@ -329,7 +762,7 @@ def get_profile_image_by_user_id(uc,user_id,ver='1.0',**kwargs):
 
 def get_my_profile(uc,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/profile/myProfile'.format(ver)
-    return d2ldata.UserProfile(_get(route,uc,**kwargs))
+    return d2ldata.UserProfile.adopt(_get(route,uc,**kwargs))
 
 def get_my_profile_image(uc,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/profile/myProfile/image'.format(ver)
@@ -342,31 +775,31 @@ def update_my_profile(uc,updated_profile_data,ver='1.0',**kwargs):
     kwargs.setdefault('data', updated_profile_data.as_json())
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
-    return d2ldata.UserProfile(_put(route,uc,**kwargs))
+    return d2ldata.UserProfile.adopt(_put(route,uc,**kwargs))
 
 def update_profile_image_by_user_id(uc,user_id,d2l_file,ver='1.0',**kwargs):
     if not isinstance(d2l_file, d2ldata.D2LFile):
         raise TypeError('Image must implement d2lvalence.data.D2LFile').with_traceback(sys.exc_info()[2])
     route = '/d2l/api/lp/{0}/profile/user/{1}/image'.format(ver,user_id)
-    kwargs.setdefault('files',{})
-    kwargs['files'].update({'profileImage': (d2l_file.Name, d2l_file.Stream)})
-    return _post(route,uc,**kwargs)
+    e = d2lmultipart.MultipartEncoder('form-data')
+    e.add_file(d2l_file,name='profileImage')
+    return _multipart_post(route,uc,e,**kwargs)
 
 def update_profile_image_by_profile_id(uc,profile_id,d2l_file,ver='1.0',**kwargs):
     if not isinstance(d2l_file, d2ldata.D2LFile):
         raise TypeError('Image must implement d2lvalence.data.D2LFile').with_traceback(sys.exc_info()[2])
     route = '/d2l/api/lp/{0}/profile/{1}/image'.format(ver,profile_id)
-    kwargs.setdefault('files',{})
-    kwargs['files'].update({'profileImage': (d2l_file.Name, d2l_file.Stream)})
-    return _post(route,uc,**kwargs)
+    e = d2lmultipart.MultipartEncoder('form-data')
+    e.add_file(d2l_file,name='profileImage')
+    return _multipart_post(route,uc,e,**kwargs)
 
 def update_my_profile_image(uc,d2l_file,ver='1.0',**kwargs):
     if not isinstance(d2l_file, d2ldata.D2LFile):
         raise TypeError('Image must implement d2lvalence.data.D2LFile').with_traceback(sys.exc_info()[2])
     route = '/d2l/api/lp/{0}/profile/myProfile/image'.format(ver)
-    kwargs.setdefault('files',{})
-    kwargs['files'].update({'profileImage': (d2l_file.Name, d2l_file.Stream)})
-    return _post(route,uc,**kwargs)
+    e = d2lmultipart.MultipartEncoder('form-data')
+    e.add_file(d2l_file,name='profileImage')
+    return _multipart_post(route,uc,e,**kwargs)
 
 
 # Passwords
@@ -399,56 +832,62 @@ def get_all_roles(uc,ver='1.0',**kwargs):
         pass
     else:
         for i in range(len(r)):
-            result.append(d2ldata.Role(r[i]))
+            result.append(d2ldata.Role.adopt(r[i]))
     return result
 
 def get_role(uc,role_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/roles/{1}'.format(ver,role_id)
-    return d2ldata.Role(_get(route,uc,**kwargs))
+    return d2ldata.Role.adopt(_get(route,uc,**kwargs))
 
 
 ## Org structure
 def get_organization_info(uc,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/organization/info'.format(ver)
-    return d2ldata.Organization(_get(route,uc,**kwargs))
+    return d2ldata.Organization.adopt(_get(route,uc,**kwargs))
 
-def get_orgunit_children(uc,org_unit_id,org_unit_type_id=None,ver='1.0',**kwargs):
+def get_orgunit_children(uc,org_unit_id,org_unit_type_id=None,ver='1.0',lazy=False,**kwargs):
     route = '/d2l/api/lp/{0}/orgstructure/{1}/children/'.format(ver,org_unit_id)
     kwargs.setdefault('params', {})
     if org_unit_type_id:
        kwargs['params'].update({'ouTypeId':org_unit_type_id})
     r = _get(route,uc,**kwargs)
+    if lazy:
+        return d2ldata.D2LLazyList(r,d2ldata.OrgUnit.adopt)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.OrgUnit(r[i]))
+        result.append(d2ldata.OrgUnit.adopt(r[i]))
     return result
 
-def get_orgunit_descendants(uc,org_unit_id,org_unit_type_id=None,ver='1.0',**kwargs):
+def get_orgunit_descendants(uc,org_unit_id,org_unit_type_id=None,ver='1.0',lazy=False,**kwargs):
     route = '/d2l/api/lp/{0}/orgstructure/{1}/descendants/'.format(ver,org_unit_id)
     kwargs.setdefault('params', {})
     if org_unit_type_id:
         kwargs['params'].update({'ouTypeId':org_unit_type_id})
     r = _get(route,uc,**kwargs)
+    if lazy:
+        return d2ldata.D2LLazyList(r,d2ldata.OrgUnit.adopt)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.OrgUnit(r[i]))
+        result.append(d2ldata.OrgUnit.adopt(r[i]))
     return result
 
-def get_orgunit_parents(uc,org_unit_id,org_unit_type_id=None,ver='1.0',**kwargs):
+def get_orgunit_parents(uc,org_unit_id,org_unit_type_id=None,ver='1.0',lazy=False,**kwargs):
     route = '/d2l/api/lp/{0}/orgstructure/{1}/parents/'.format(ver,org_unit_id)
     kwargs.setdefault('params', {})
     if org_unit_type_id:
         kwargs['params'].update({'ouTypeId':org_unit_type_id})
     r = _get(route,uc,**kwargs)
+    if lazy:
+        return d2ldata.D2LLazyList(r,d2ldata.OrgUnit.adopt)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.OrgUnit(r[i]))
+        result.append(d2ldata.OrgUnit.adopt(r[i]))
     return result
 
 def get_orgunit_properties(uc,org_unit_id,ver='1.3',**kwargs):
     route = '/d2l/api/lp/{0}/orgstructure/{1}'.format(ver,org_unit_id)
     r = _get(route,uc,**kwargs)
-    return d2ldata.OrgUnit(r)
+    return d2ldata.OrgUnit.adopt(r)
 
 def create_custom_orgunit(uc,org_unit_create_data=None,ver='1.3',**kwargs):
     if not isinstance(org_unit_create_data, d2ldata.OrgUnitCreateData):
@@ -457,7 +896,7 @@ def create_custom_orgunit(uc,org_unit_create_data=None,ver='1.3',**kwargs):
     kwargs.setdefault('data',org_unit_create_data.as_json())
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
-    return d2ldata.OrgUnit(_post(route,uc,**kwargs))
+    return d2ldata.OrgUnit.adopt(_post(route,uc,**kwargs))
 
 def update_custom_orgunit(uc,org_unit_id,org_unit_properties=None,ver='1.4',**kwargs):
     if not isinstance(org_unit_properties, d2ldata.OrgUnitProperties):
@@ -466,7 +905,7 @@ def update_custom_orgunit(uc,org_unit_id,org_unit_properties=None,ver='1.4',**kw
     kwargs.setdefault('data',org_unit_properties.as_json())
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
-    return d2ldata.OrgUnitProperties(_put(route,uc,**kwargs))
+    return d2ldata.OrgUnitProperties.adopt(_put(route,uc,**kwargs))
 
 # Org unit types
 def get_all_outypes(uc,ver='1.0',**kwargs):
@@ -477,21 +916,23 @@ def get_all_outypes(uc,ver='1.0',**kwargs):
         pass
     else:
         for i in range(len(r)):
-            result.append(d2ldata.OrgUnitType(r[i]))
+            result.append(d2ldata.OrgUnitType.adopt(r[i]))
     return result
 
 def get_outype(uc,outype_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/outypes/{1}'.format(ver,outype_id)
-    return d2ldata.OrgUnitType(_get(route,uc,**kwargs))
+    return d2ldata.OrgUnitType.adopt(_get(route,uc,**kwargs))
 
 
 ## Enrollments
-def get_classlist(uc,org_unit_id,ver='1.0',**kwargs):
+def get_classlist(uc,org_unit_id,ver='1.0',lazy=False,**kwargs):
     route = '/d2l/api/le/{0}/{1}/classlist/'.format(ver,org_unit_id)
     r = _get(route,uc,**kwargs)
+    if lazy:
+        return d2ldata.D2LLazyList(r,d2ldata.ClasslistUser.adopt)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.ClasslistUser(r[i]))
+        result.append(d2ldata.ClasslistUser.adopt(r[i]))
     return result
 
 def delete_user_enrollment_in_orgunit(uc,org_unit_id,user_id,org_first=True,ver='1.0',**kwargs):
@@ -509,7 +950,12 @@ def get_my_enrollments(uc,org_unit_type_id=None,bookmark=None,ver='1.0',**kwargs
     if org_unit_type_id:
         kwargs['params'].update({'orgUnitTypeId':org_unit_type_id})
     r = _get(route,uc,**kwargs)
-    return d2ldata.PagedResultSet(r)
+    return d2ldata.PagedResultSet.adopt(r)
+
+def iter_my_enrollments(uc,org_unit_type_id=None,read_ahead=False,ver='1.0',**kwargs):
+    def fetch(bookmark):
+        return get_my_enrollments(uc,org_unit_type_id=org_unit_type_id,bookmark=bookmark,ver=ver,**_paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.MyOrgUnitInfo.adopt,read_ahead=read_ahead)
 
 def get_enrolled_users_for_orgunit(uc,org_unit_id,role_id=None,bookmark=None,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/enrollments/orgUnits/{1}/users/'.format(ver,org_unit_id)
@@ -519,14 +965,19 @@ def get_enrolled_users_for_orgunit(uc,org_unit_id,role_id=None,bookmark=None,ver
     if role_id:
         kwargs['params'].update({'roleId':role_id})
     r = _get(route,uc,**kwargs)
-    return d2ldata.PagedResultSet(r)
+    return d2ldata.PagedResultSet.adopt(r)
+
+def iter_enrolled_users_for_orgunit(uc,org_unit_id,role_id=None,read_ahead=False,ver='1.0',**kwargs):
+    def fetch(bookmark):
+        return get_enrolled_users_for_orgunit(uc,org_unit_id,role_id=role_id,bookmark=bookmark,ver=ver,**_paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.OrgUnitUser.adopt,read_ahead=read_ahead)
 
 def get_enrolled_user_in_orgunit(uc,org_unit_id,user_id,org_first=True,ver='1.0',**kwargs):
     if org_first:
         route = '/d2l/api/lp/{0}/enrollments/orgUnits/{1}/users/{2}'.format(ver,org_unit_id,user_id)
     else:
         route = '/d2l/api/lp/{0}/enrollments/users/{1}/orgUnits/{2}'.format(ver,user_id,org_unit_id)
-    return d2ldata.EnrollmentData(_get(route,uc,**kwargs))
+    return d2ldata.EnrollmentData.adopt(_get(route,uc,**kwargs))
 
 def get_all_enrollments_for_user(uc,user_id,org_unit_type_id=None,role_id=None,bookmark=None,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/enrollments/users/{1}/orgUnits/'.format(ver,user_id)
@@ -538,7 +989,12 @@ def get_all_enrollments_for_user(uc,user_id,org_unit_type_id=None,role_id=None,b
     if role_id:
         kwargs['params'].update({'roleId':role_id})
     r = _get(route,uc,**kwargs)
-    return d2ldata.PagedResultSet(r)
+    return d2ldata.PagedResultSet.adopt(r)
+
+def iter_all_enrollments_for_user(uc,user_id,org_unit_type_id=None,role_id=None,read_ahead=False,ver='1.0',**kwargs):
+    def fetch(bookmark):
+        return get_all_enrollments_for_user(uc,user_id,org_unit_type_id=org_unit_type_id,role_id=role_id,bookmark=bookmark,ver=ver,**_paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.UserOrgUnit.adopt,read_ahead=read_ahead)
 
 def create_enrollment_for_user(uc,new_enrollment,ver='1.0',**kwargs):
     if not isinstance(new_enrollment, d2ldata.CreateEnrollmentData):
@@ -546,7 +1002,7 @@ def create_enrollment_for_user(uc,new_enrollment,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/enrollments/'.format(ver)
     kwargs.setdefault('data',new_enrollment.as_json())
     r = _post(route,uc,**kwargs)
-    return d2ldata.EnrollmentData(r)
+    return d2ldata.EnrollmentData.adopt(r)
 
 # Groups
 def delete_group_category_from_orgunit(uc,org_unit_id,group_category_id,ver='1.0',**kwargs):
@@ -566,7 +1022,7 @@ def get_group_categories_for_orgunit(uc,org_unit_id,ver='1.0',**kwargs):
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append( d2ldata.GroupCategoryDataFetch(r[i]))
+        result.append( d2ldata.GroupCategoryDataFetch.adopt(r[i]))
     return result
 
 ## Course offerings
@@ -579,12 +1035,12 @@ def get_course_schemas(uc,ver='1.0',**kwargs):
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append( d2ldata.CourseSchemaElement(r[i]))
+        result.append( d2ldata.CourseSchemaElement.adopt(r[i]))
     return result
 
 def get_course_offering(uc,org_unit_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/courses/{1}'.format(ver,org_unit_id)
-    return d2ldata.CourseOffering(_get(route,uc,**kwargs))
+    return d2ldata.CourseOffering.adopt(_get(route,uc,**kwargs))
 
 def create_course_offering(uc,new_course_offering,ver='1.0',**kwargs):
     if not isinstance(new_course_offering, d2ldata.CreateCourseOffering):
@@ -592,7 +1048,7 @@ def create_course_offering(uc,new_course_offering,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/courses/'.format(ver)
     kwargs.setdefault('data',new_course_offering.as_json())
     r = _post(route,uc,**kwargs)
-    return d2ldata.CourseOffering(r)
+    return d2ldata.CourseOffering.adopt(r)
 
 def update_course_offering(uc,org_unit_id,course_offering_update,ver='1.0',**kwargs):
     if not isinstance(course_offering_update, d2ldata.CourseOfferingInfo):
@@ -600,7 +1056,7 @@ def update_course_offering(uc,org_unit_id,course_offering_update,ver='1.0',**kwa
     route = '/d2l/api/lp/{0}/courses/{1}'.format(ver,org_unit_id)
     kwargs.setdefault('data',course_offering_update.as_json())
     r = _put(route,uc,**kwargs)
-    return d2ldata.CourseOffering(r)
+    return d2ldata.CourseOffering.adopt(r)
 
 # Course templates
 def delete_course_template(uc,org_unit_id,ver='1.0',**kwargs):
@@ -609,14 +1065,14 @@ def delete_course_template(uc,org_unit_id,ver='1.0',**kwargs):
 
 def get_course_template(uc,org_unit_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/coursetemplates/{1}'.format(ver,org_unit_id)
-    return d2ldata.CourseTemplate(_get(route,uc,**kwargs))
+    return d2ldata.CourseTemplate.adopt(_get(route,uc,**kwargs))
 
 def get_course_templates_schema(uc,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/coursetemplates/schema'.format(ver)
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append( d2ldata.CourseSchemaElement(r[i]))
+        result.append( d2ldata.CourseSchemaElement.adopt(r[i]))
     return result
 
 def create_course_template(uc,new_course_template,ver='1.0',**kwargs):
@@ -627,7 +1083,7 @@ def create_course_template(uc,new_course_template,ver='1.0',**kwargs):
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _post(route,uc,**kwargs)
-    return d2ldata.CourseTemplate(r)
+    return d2ldata.CourseTemplate.adopt(r)
 
 def update_course_template(uc,org_unit_id,course_template_update,ver='1.0',**kwargs):
     if not isinstance(course_template_update, d2ldata.CourseTemplateInfo):
@@ -643,40 +1099,32 @@ def delete_grade_object_for_org(uc,org_unit_id,grade_object_id,ver='1.0',**kwarg
     route = '/d2l/api/le/{0}/{1}/grades/{2}'.format(ver,org_unit_id,grade_object_id)
     return _delete(route,uc,**kwargs)
 
-def get_all_grade_objects_for_org(uc,org_unit_id,ver='1.0',**kwargs):
+def _grade_object(r):
+    t = r['GradeType']
+    if t == 'Numeric':
+        return d2ldata.GradeObjectNumeric.adopt(r)
+    elif t == 'PassFail':
+        return d2ldata.GradeObjectPassFail.adopt(r)
+    elif t == 'SelectBox':
+        return d2ldata.GradeObjectSelectBox.adopt(r)
+    elif t == 'Text':
+        return d2ldata.GradeObjectText.adopt(r)
+    else:
+        return d2ldata.GradeObject.adopt(r)
+
+def get_all_grade_objects_for_org(uc,org_unit_id,ver='1.0',lazy=False,**kwargs):
     route = '/d2l/api/le/{0}/{1}/grades/'.format(ver,org_unit_id)
     r = _get(route,uc,**kwargs)
+    if lazy:
+        return d2ldata.D2LLazyList(r,_grade_object)
     result = []
     for i in range(len(r)):
-        t = r[i]['GradeType']
-        if t == 'Numeric':
-            result.append( d2ldata.GradeObjectNumeric(r[i]))
-        elif t == 'PassFail':
-            result.append( d2ldata.GradeObjectPassFail(r[i]))
-        elif t == 'SelectBox':
-            result.append( d2ldata.GradeObjectSelectBox(r[i]))
-        elif t == 'Text':
-            result.append( d2ldata.GradeObjectText(r[i]))
-        else:
-            result.append( d2ldata.GradeObject(r[i]))
+        result.append(_grade_object(r[i]))
     return result
 
 def get_grade_object_for_org(uc,org_unit_id,grade_object_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/grades/{2}'.format(ver,org_unit_id,grade_object_id)
-    r = _get(route,uc,**kwargs)
-    t = r['GradeType']
-    result = None
-    if t == 'Numeric':
-        result = d2ldata.GradeObjectNumeric(r)
-    elif t == 'PassFail':
-        result = d2ldata.GradeObjectPassFail(r)
-    elif t == 'SelectBox':
-        result = d2ldata.GradeObjectSelectBox(r)
-    elif t == 'Text':
-        result = d2ldata.GradeObjectText(r)
-    else:
-        result = d2ldata.GradeObject(r)
-    return result
+    return _grade_object(_get(route,uc,**kwargs))
 
 def create_grade_object_for_org(uc,org_unit_id,new_grade_object,ver='1.0',**kwargs):
     if not isinstance(new_grade_object, d2ldata.GradeObjectCreateData):
@@ -686,7 +1134,7 @@ def create_grade_object_for_org(uc,org_unit_id,new_grade_object,ver='1.0',**kwar
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _post(route,uc,**kwargs)
-    return d2ldata.GradeObject(r)
+    return d2ldata.GradeObject.adopt(r)
 
 def update_grade_object_for_org(uc,org_unit_id,grade_object_id,new_grade_object,ver='1.0',**kwargs):
     if not isinstance(new_grade_object, d2ldata.GradeObjectCreateData):
@@ -696,7 +1144,7 @@ def update_grade_object_for_org(uc,org_unit_id,grade_object_id,new_grade_object,
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _put(route,uc,**kwargs)
-    return d2ldata.GradeObject(r)
+    return d2ldata.GradeObject.adopt(r)
 
 # Grade categories
 def delete_grade_category_for_orgunit(uc,org_unit_id,category_id,ver='1.0',**kwargs):
@@ -708,12 +1156,12 @@ def get_all_grade_categories_for_orgunit(uc,org_unit_id,ver='1.0',**kwargs):
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.GradeObjectCategory(r[i]))
+        result.append(d2ldata.GradeObjectCategory.adopt(r[i]))
     return result
 
 def get_grade_category_for_orgunit(uc,org_unit_id,category_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/grades/categories/{2}'.format(ver,org_unit_id,category_id)
-    return d2ldata.GradeObjectCategory(_get(route,uc,**kwargs))
+    return d2ldata.GradeObjectCategory.adopt(_get(route,uc,**kwargs))
 
 def create_grade_category_for_orgunit(uc,org_unit_id,new_grade_category_data,ver='1.0',**kwargs):
     if not isinstance(new_grade_category_data, d2ldata.GradeObjectCategoryData):
@@ -723,7 +1171,7 @@ def create_grade_category_for_orgunit(uc,org_unit_id,new_grade_category_data,ver
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _post(route,uc,**kwargs)
-    return d2ldata.GradeObjectCategory(r)
+    return d2ldata.GradeObjectCategory.adopt(r)
 
 # Grade schemes
 def get_all_grade_schemes_for_orgunit(uc,org_unit_id,ver='1.0',**kwargs):
@@ -731,31 +1179,31 @@ def get_all_grade_schemes_for_orgunit(uc,org_unit_id,ver='1.0',**kwargs):
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.GradeScheme(r[i]))
+        result.append(d2ldata.GradeScheme.adopt(r[i]))
     return result
 
 def get_grade_scheme_for_orgunit(uc,org_unit_id,scheme_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/grades/schemes/{2}'.format(ver,org_unit_id,scheme_id)
-    return (d2ldata.GradeScheme(_get(route,uc,**kwargs)))
+    return (d2ldata.GradeScheme.adopt(_get(route,uc,**kwargs)))
 
 
 # Grade values
 def get_my_final_grade_value_for_org(uc,org_unit_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/grades/final/values/myGradeValue'.format(ver,org_unit_id)
-    return d2ldata.GradeValueComputable(_get(route,uc,**kwargs))
+    return d2ldata.GradeValueComputable.adopt(_get(route,uc,**kwargs))
 
 def get_final_grade_value_for_user_in_org(uc,org_unit_id,user_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/grades/final/values/{2}'.format(ver,org_unit_id,user_id)
-    return d2ldata.GradeValueComputable(_get(route,uc,**kwargs))
+    return d2ldata.GradeValueComputable.adopt(_get(route,uc,**kwargs))
 
 def get_grade_value_for_user_in_org(uc,org_unit_id,grade_object_id,user_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/grades/{2}/values/{3}'.format(ver,org_unit_id,grade_object_id,user_id)
     r = _get(route,uc,**kwargs)
     result = None
     if 'PointsNumerator' in r:
-        result = d2ldata.GradeValueComputable(r)
+        result = d2ldata.GradeValueComputable.adopt(r)
     else:
-        result = d2ldata.GradeValue(r)
+        result = d2ldata.GradeValue.adopt(r)
     return result
 
 def get_my_grade_value_for_org(uc,org_unit_id,grade_object_id,ver='1.0',**kwargs):
@@ -763,9 +1211,9 @@ def get_my_grade_value_for_org(uc,org_unit_id,grade_object_id,ver='1.0',**kwargs
     r = _get(route,uc,**kwargs)
     result = None
     if 'PointsNumerator' in r:
-        result = d2ldata.GradeValueComputable(r)
+        result = d2ldata.GradeValueComputable.adopt(r)
     else:
-        result = d2ldata.GradeValue(r)
+        result = d2ldata.GradeValue.adopt(r)
     return result
 
 def get_all_my_grade_values_for_org(uc,org_unit_id,ver='1.0',**kwargs):
@@ -774,9 +1222,9 @@ def get_all_my_grade_values_for_org(uc,org_unit_id,ver='1.0',**kwargs):
     result = []
     for i in range(len(r)):
         if 'PointsNumerator' in r[i]:
-            result.append(d2ldata.GradeValueComputable(r[i]))
+            result.append(d2ldata.GradeValueComputable.adopt(r[i]))
         else:
-            result.append(d2ldata.GradeValue(r[i]))
+            result.append(d2ldata.GradeValue.adopt(r[i]))
     return result
 
 def get_all_grade_values_for_user_in_org(uc,org_unit_id,user_id,ver='1.0',**kwargs):
@@ -785,9 +1233,9 @@ def get_all_grade_values_for_user_in_org(uc,org_unit_id,user_id,ver='1.0',**kwar
     result = []
     for i in range(len(r)):
         if 'PointsNumerator' in r[i]:
-            result.append(d2ldata.GradeValueComputable(r[i]))
+            result.append(d2ldata.GradeValueComputable.adopt(r[i]))
         else:
-            result.append(d2ldata.GradeValue(r[i]))
+            result.append(d2ldata.GradeValue.adopt(r[i]))
     return result
 
 def recalculate_final_grade_value_for_user_in_org(uc,org_unit_id,user_id,ver='1.0',**kwargs):
@@ -808,7 +1256,8 @@ def update_final_adjusted_grade_value_for_user_in_org(uc,org_unit_id,user_id,upd
     if not isinstance(updated_final_adjusted_grade, d2ldata.IncomingFinalAdjustedGradeValue):
         raise TypeError('New grade value must implement d2lvalence.data.IncomingFinalAdjustedGradeValue').with_traceback(sys.exc_info()[2])
     route = '/d2l/api/le/{0}/{1}/grades/final/values/{2}'.format(ver,org_unit_id,user_id)
-    kwargs.setdefault('data',updated_final_adjusted_grade.as_json())
+    if 'data' not in kwargs:
+        kwargs['data'] = updated_final_adjusted_grade.as_json()
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     return _put(route,uc,**kwargs)
@@ -817,7 +1266,8 @@ def update_grade_value_for_user_in_org(uc,org_unit_id,grade_object_id,user_id,up
     if not isinstance(updated_grade_value, d2ldata.IncomingGradeValue):
         raise TypeError('New grade value must implement d2lvalence.data.IncomingGradeValue').with_traceback(sys.exc_info()[2])
     route = '/d2l/api/le/{0}/{1}/grades/{2}/values/{3}'.format(ver,org_unit_id,grade_object_id,user_id)
-    kwargs.setdefault('data',updated_grade_value.as_json())
+    if 'data' not in kwargs:
+        kwargs['data'] = updated_grade_value.as_json()
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     return _put(route,uc,**kwargs)
@@ -839,7 +1289,12 @@ def get_all_course_completions_for_org(uc,org_unit_id,user_id=None,start_expiry=
     if bookmark:
         kwargs['params'].update({'bookmark': bookmark})
     r = _get(route,uc,**kwargs)
-    return d2ldata.PagedResultSet(r)
+    return d2ldata.PagedResultSet.adopt(r)
+
+def iter_all_course_completions_for_org(uc,org_unit_id,user_id=None,start_expiry=None,end_expiry=None,read_ahead=False,ver='1.1',**kwargs):
+    def fetch(bookmark):
+        return get_all_course_completions_for_org(uc,org_unit_id,user_id=user_id,start_expiry=start_expiry,end_expiry=end_expiry,bookmark=bookmark,ver=ver,**_paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.CourseCompletion.adopt,read_ahead=read_ahead)
 
 def get_all_course_completions_for_user(uc,user_id,start_expiry=None,end_expiry=None,bookmark=None,ver='1.1',**kwargs):
     route = '/d2l/api/le/{0}/grades/courseCompletion/{1}/'.format(ver,user_id)
@@ -851,7 +1306,12 @@ def get_all_course_completions_for_user(uc,user_id,start_expiry=None,end_expiry=
     if bookmark:
         kwargs['params'].update({'bookmark': bookmark})
     r = _get(route,uc,**kwargs)
-    return d2ldata.PagedResultSet(r)
+    return d2ldata.PagedResultSet.adopt(r)
+
+def iter_all_course_completions_for_user(uc,user_id,start_expiry=None,end_expiry=None,read_ahead=False,ver='1.1',**kwargs):
+    def fetch(bookmark):
+        return get_all_course_completions_for_user(uc,user_id,start_expiry=start_expiry,end_expiry=end_expiry,bookmark=bookmark,ver=ver,**_paged_kwargs(kwargs))
+    return _iter_paged(fetch,d2ldata.CourseCompletion.adopt,read_ahead=read_ahead)
 
 def create_course_completion_for_org(uc,org_unit_id,new_course_completion,ver='1.1',**kwargs):
     if not isinstance(new_course_completion, d2ldata.CourseCompletionCreateData):
@@ -861,7 +1321,7 @@ def create_course_completion_for_org(uc,org_unit_id,new_course_completion,ver='1
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _post(route,uc,**kwargs)
-    return d2ldata.CourseCompletion(r)
+    return d2ldata.CourseCompletion.adopt(r)
 
 def update_course_completion_for_org(uc,org_unit_id,course_completion_id,updated_course_completion,ver='1.1',**kwargs):
     if not isinstance(updated_course_completion, d2ldata.CourseCompletionUpdateData):
@@ -871,7 +1331,7 @@ def update_course_completion_for_org(uc,org_unit_id,course_completion_id,updated
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _post(route,uc,**kwargs)
-    return d2ldata.CourseCompletion(r)
+    return d2ldata.CourseCompletion.adopt(r)
 
 
 ## Dropbox
@@ -902,7 +1362,7 @@ def _get_locker_item(uc,route,**kwargs):
     if '/' in route[-1:]:
         result = []
         for i in range(len(r)):
-            result.append(d2ldata.LockerItem(r[i]))
+            result.append(d2ldata.LockerItem.adopt(r[i]))
     else:
         result = r
     return result
@@ -983,7 +1443,7 @@ def delete_group_locker_item(uc,org_unit_id,group_id,path='/',ver='1.0',**kwargs
 
 def get_group_locker_category(uc,org_unit_id,group_cat_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/{1}/groupcategories/{2}/locker'.format(ver,org_unit_id,group_cat_id)
-    return d2ldata.GroupLocker(_get(route,uc,**kwargs))
+    return d2ldata.GroupLocker.adopt(_get(route,uc,**kwargs))
 
 def get_group_locker_item(uc,org_unit_id,group_id,path='/',ver='1.0',**kwargs):
     if _check_path(path):
@@ -992,7 +1452,7 @@ def get_group_locker_item(uc,org_unit_id,group_id,path='/',ver='1.0',**kwargs):
 
 def setup_group_locker_category(uc,org_unit_id,group_cat_id,ver='1.0',**kwargs):
     route = '/d2l/api/lp/{0}/{1}/groupcategories/{2}/locker'.format(ver,org_unit_id,group_cat_id)
-    return d2ldata.GroupLocker(_post(route,uc,**kwargs))
+    return d2ldata.GroupLocker.adopt(_post(route,uc,**kwargs))
 
 def create_group_locker_folder(uc,org_unit_id,group_id,folder_name,path='/',ver='1.0',**kwargs):
     if _check_path(path):
@@ -1025,12 +1485,12 @@ def get_discussion_forums(uc,org_unit_id,ver='1.0',**kwargs):
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.Forum(r[i]))
+        result.append(d2ldata.Forum.adopt(r[i]))
     return result
 
 def get_discussion_forum(uc,org_unit_id,forum_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/discussions/forums/{2}'.format(ver,org_unit_id,forum_id)
-    return d2ldata.Forum(_get(route,uc,**kwargs))
+    return d2ldata.Forum.adopt(_get(route,uc,**kwargs))
 
 def create_discussion_forum(uc,org_unit_id,new_forum_data,ver='1.0',**kwargs):
     if not isinstance(new_forum_data, d2ldata.ForumData):
@@ -1040,7 +1500,7 @@ def create_discussion_forum(uc,org_unit_id,new_forum_data,ver='1.0',**kwargs):
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _post(route,uc,**kwargs)
-    return d2ldata.Forum(r)
+    return d2ldata.Forum.adopt(r)
 
 def update_discussion_forum(uc,org_unit_id,forum_id,updated_forum_data,ver='1.0',**kwargs):
     if not isinstance(updated_forum_data, d2ldata.ForumUpdateData):
@@ -1050,7 +1510,7 @@ def update_discussion_forum(uc,org_unit_id,forum_id,updated_forum_data,ver='1.0'
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _put(route,uc,**kwargs)
-    return d2ldata.Forum(r)
+    return d2ldata.Forum.adopt(r)
 
 # Discussion topics
 def delete_discussion_topic(uc,org_unit_id,forum_id,topic_id,ver='1.0',**kwargs):
@@ -1071,19 +1531,19 @@ def get_discussion_topics(uc,org_unit_id,forum_id,ver='1.0',**kwargs):
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.Topic(r[i]))
+        result.append(d2ldata.Topic.adopt(r[i]))
     return result
 
 def get_discussion_topic(uc,org_unit_id,forum_id,topic_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/discussions/forums/{2}/topics/{3}'.format(ver,org_unit_id,forum_id,topic_id,ver='1.0')
-    return d2ldata.Topic(_get(route,uc,**kwargs))
+    return d2ldata.Topic.adopt(_get(route,uc,**kwargs))
 
 def get_discussion_topics_group_restrictions(uc,org_unit_id,forum_id,topic_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/discussions/forums/{2}/topics/{3}/groupRestrictions/'.format(ver,org_unit_id,forum_id,topic_id)
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.GroupRestriction(r[i]))
+        result.append(d2ldata.GroupRestriction.adopt(r[i]))
     return result
 
 def create_discussion_topic(uc,org_unit_id,forum_id,new_topic_data,ver='1.0',**kwargs):
@@ -1094,7 +1554,7 @@ def create_discussion_topic(uc,org_unit_id,forum_id,new_topic_data,ver='1.0',**k
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _post(route,uc,**kwargs)
-    return d2ldata.Topic(r)
+    return d2ldata.Topic.adopt(r)
 
 def update_discussion_topic(uc,org_unit_id,forum_id,topic_id,new_topic_data,ver='1.0',**kwargs):
     if not isinstance(new_topic_data,d2ldata.CreateTopicData):
@@ -1104,7 +1564,7 @@ def update_discussion_topic(uc,org_unit_id,forum_id,topic_id,new_topic_data,ver=
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _put(route,uc,**kwargs)
-    return d2ldata.Topic(r)
+    return d2ldata.Topic.adopt(r)
 
 def update_group_restrictions_list(uc,org_unit_id,forum_id,topic_id,group_restriction,ver='1.0',**kwargs):
     if not isinstance(group_restriction,d2ldata.GroupRestriction):
@@ -1129,32 +1589,32 @@ def get_discussion_posts(uc,org_unit_id,forum_id,topic_id,ver='1.0',**kwargs):
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.Post(r[1]))
+        result.append(d2ldata.Post.adopt(r[1]))
     return result
 
 def get_discussion_post(uc,org_unit_id,forum_id,topic_id,post_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/discussions/forums/{2}/topics/{3}/posts/{4}'.format(ver,org_unit_id,forum_id,topic_id,post_id)
-    return d2ldata.Post(_get(route,uc,**kwargs))
+    return d2ldata.Post.adopt(_get(route,uc,**kwargs))
 
 def get_discussion_post_approval_status(uc,org_unit_id,forum_id,topic_id,post_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/discussions/forums/{2}/topics/{3}/posts/{4}/Approval'.format(ver,org_unit_id,forum_id,topic_id,post_id)
-    return d2ldata.ApprovalData(_get(route,uc,**kwargs))
+    return d2ldata.ApprovalData.adopt(_get(route,uc,**kwargs))
 
 def get_discussion_post_flag_status(uc,org_unit_id,forum_id,topic_id,post_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/discussions/forums/{2}/topics/{3}/posts/{4}/Flag'.format(ver,org_unit_id,forum_id,topic_id,post_id)
-    return d2ldata.FlagData(_get(route,uc,**kwargs))
+    return d2ldata.FlagData.adopt(_get(route,uc,**kwargs))
 
 def get_discussion_post_rating(uc,org_unit_id,forum_id,topic_id,post_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/discussions/forums/{2}/topics/{3}/posts/{4}/Rating'.format(ver,org_unit_id,forum_id,topic_id,post_id)
-    return d2ldata.RatingData(_get(route,uc,**kwargs))
+    return d2ldata.RatingData.adopt(_get(route,uc,**kwargs))
 
 def get_discussion_my_post_rating(uc,org_unit_id,forum_id,topic_id,post_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/discussions/forums/{2}/topics/{3}/posts/{4}/Rating/MyRating'.format(ver,org_unit_id,forum_id,topic_id,post_id)
-    return d2ldata.UserRatingData(_get(route,uc,**kwargs))
+    return d2ldata.UserRatingData.adopt(_get(route,uc,**kwargs))
 
 def get_discussion_post_read_status(uc,org_unit_id,forum_id,topic_id,post_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/discussions/forums/{2}/topics/{3}/posts/{4}/ReadStatus'.format(ver,org_unit_id,forum_id,topic_id,post_id)
-    return d2ldata.ReadStatusData(_get(route,uc,**kwargs))
+    return d2ldata.ReadStatusData.adopt(_get(route,uc,**kwargs))
 
 def create_discussion_post(uc,org_unit_id,forum_id,topic_id,new_post,d2l_file_list=None,ver='1.0',**kwargs):
     if not isinstance(new_post, d2ldata.CreatePostData):
@@ -1168,59 +1628,15 @@ def create_discussion_post(uc,org_unit_id,forum_id,topic_id,new_post,d2l_file_li
         ret = _post(route,uc,**kwargs)
 
     else:
-        boundary = uuid.uuid4().hex
-        pdescr = '--{0}\r\nContent-Type: application/json\r\n\r\n{1}\r\n'.format(boundary,new_post.as_json()).encode(encoding='utf-8')
-        pbotbound = '\r\n--{0}--'.format(boundary).encode(encoding='utf-8')
-        pfileparts = b''
+        e = d2lmultipart.MultipartEncoder('mixed')
+        e.add_json(new_post)
         for i in range(len(d2l_file_list)):
             f = d2l_file_list[i]
             if isinstance(f, d2ldata.D2LFile):
-                f.Stream.seek(0)
-                fdata = f.Stream.read()
-                f.Stream.seek(0)
-                pfileparts = pfileparts + '\r\n--{0}\r\nContent-Disposition: form-data; name="{1}"; filename="{2}"\r\nContent-Type: {3}\r\n\r\n'.format(boundary,'file '+str(i),f.Name,f.ContentType).encode(encoding='utf-8') + fdata
-
-        payload = pdescr + pfileparts + pbotbound
-
-        ctype_header = {'Content-Type': 'multipart/mixed;boundary='+boundary}
-
-        #populate the default state of the passed in kwargs that we care about
-        kwargs.setdefault('auth',uc)
-        kwargs.setdefault('data',payload)
-        kwargs.setdefault('files',None)
-        kwargs.setdefault('params',None)
-        kwargs.setdefault('headers',None)
-        kwargs.setdefault('verify',True)
-        d = None
-        if 'd2ldebug' in kwargs:
-            d = kwargs['d2ldebug']
-            del kwargs['d2ldebug']
-
-        s = requests.Session()
-        # set the default session values
-        s.auth = kwargs['auth']
-        s.verify = kwargs['verify']
-        if kwargs['headers']:
-            s.headers.update(kwargs['headers'])
-            if kwargs['params']:
-                s.params.update(kwargs['params'])
-
-        # Build PreppedRequest
-        p = requests.Request('POST',
-                             uc.scheme + '://' + uc.host + route,
-                             data = kwargs['data'],
-                             auth = s.auth,
-                             headers = s.headers,
-                             params = s.params).prepare()
-
-        # overlay the multipart content type header
-        p.headers.update(ctype_header)
-        if d:
-            d.add_request(p)
-        r = s.send(p)
-        ret = _fetch_content(r,debug=d)
-
-    return d2ldata.Post(ret)
+                e.add_file(f,name='file '+str(i))
+        ret = _multipart_post(route,uc,e,**kwargs)
+
+    return d2ldata.Post.adopt(ret)
 
 def update_discussion_post(uc,org_unit_id,forum_id,topic_id,post_id,updated_post,ver='1.0'):
     if not isinstance(updated_post, d2ldata.UpdatePostData):
@@ -1230,7 +1646,7 @@ def update_discussion_post(uc,org_unit_id,forum_id,topic_id,post_id,updated_post
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _put(route,uc,**kwargs)
-    return d2ldata.Post(r)
+    return d2ldata.Post.adopt(r)
 
 def set_discussion_post_approval_status(uc,org_unit_id,forum_id,topic_id,post_id,approval_status,ver='1.0',**kwargs):
     if not isinstance(approval_status, d2ldata.ApprovalData):
@@ -1240,7 +1656,7 @@ def set_discussion_post_approval_status(uc,org_unit_id,forum_id,topic_id,post_id
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _put(route,uc,**kwargs)
-    return d2ldata.ApprovalData(r)
+    return d2ldata.ApprovalData.adopt(r)
 
 def set_discussion_post_flag_status(uc,org_unit_id,forum_id,topic_id,post_id,flag_status,ver='1.0',**kwargs):
     if not isinstance(flag_status, d2ldata.FlagData):
@@ -1250,7 +1666,7 @@ def set_discussion_post_flag_status(uc,org_unit_id,forum_id,topic_id,post_id,fla
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _put(route,uc,**kwargs)
-    return d2ldata.FlagData(r)
+    return d2ldata.FlagData.adopt(r)
 
 def set_discussion_post_my_rating(uc,org_unit_id,forum_id,topic_id,post_id,my_rating,ver='1.0',**kwargs):
     if not isinstance(my_rating, d2ldata.UserRatingData):
@@ -1260,7 +1676,7 @@ def set_discussion_post_my_rating(uc,org_unit_id,forum_id,topic_id,post_id,my_ra
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _put(route,uc,**kwargs)
-    return d2ldata.UserRatingData(r)
+    return d2ldata.UserRatingData.adopt(r)
 
 def set_discussion_post_read_status(uc,org_unit_id,forum_id,topic_id,post_id,read_status,ver='1.0',**kwargs):
     if not isinstance(read_status,d2ldata.ReadStatusData):
@@ -1270,7 +1686,7 @@ def set_discussion_post_read_status(uc,org_unit_id,forum_id,topic_id,post_id,rea
     kwargs.setdefault('headers',{})
     kwargs['headers'].update({'Content-Type':'application/json'})
     r = _put(route,uc,**kwargs)
-    return d2ldata.ReadStatusData(r)
+    return d2ldata.ReadStatusData.adopt(r)
 
 
 ## News routes
@@ -1300,7 +1716,7 @@ def get_news_for_orgunit(uc,org_unit_id,since=None,ver='1.0',**kwargs):
 
 def get_news_item_for_orgunit(uc,org_unit_id,news_item_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/news/{2}'.format(ver,org_unit_id,news_item_id)
-    return d2ldata.NewsItem(_get(route,uc,**kwargs))
+    return d2ldata.NewsItem.adopt(_get(route,uc,**kwargs))
 
 def get_news_item_attachment_for_orgunit(uc,org_unit_id,news_item_id,file_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/news/{2}/attachments/{3}'.format(ver,org_unit_id,news_item_id,file_id)
@@ -1324,113 +1740,23 @@ def create_news_item_for_orgunit(uc,org_unit_id,news_item_data,d2l_file_list=Non
         raise TypeError('New news item must implement d2lvalence.data.NewsItemData').with_traceback(sys.exc_info()[2])
     route = '/d2l/api/le/{0}/{1}/news/'.format(ver,org_unit_id)
 
-    boundary = uuid.uuid4().hex
-    pdescr = '--{0}\r\nContent-Type: application/json\r\n\r\n{1}\r\n'.format(boundary,news_item_data.as_json()).encode(encoding='utf-8')
-    pbotbound = '\r\n--{0}--'.format(boundary).encode(encoding='utf-8')
-    if not d2l_file_list:
-        payload = pdescr + pbotbound
-    else:
-        pfileparts = b''
+    e = d2lmultipart.MultipartEncoder('mixed')
+    e.add_json(news_item_data)
+    if d2l_file_list:
         for i in range(len(d2l_file_list)):
             f = d2l_file_list[i]
             if isinstance(f, d2ldata.D2LFile):
-                f.Stream.seek(0)
-                fdata = f.Stream.read()
-                f.Stream.seek(0)
-                pfileparts = pfileparts + '\r\n--{0}\r\nContent-Disposition: form-data; name="{1}"; filename="{2}"\r\nContent-Type: {3}\r\n\r\n'.format(boundary,'file '+str(i),f.Name,f.ContentType).encode(encoding='utf-8') + fdata
-        payload = pdescr + pfileparts + pbotbound
-
-    ctype_header = {'Content-Type':'multipart/mixed;boundary='+boundary}
-
-    # populate the default state of the passed in kwargs that we care about
-    kwargs.setdefault('auth',uc)
-    kwargs.setdefault('data',payload)
-    kwargs.setdefault('files',None)
-    kwargs.setdefault('params',None)
-    kwargs.setdefault('headers',None)
-    kwargs.setdefault('verify',True)
-    d = None
-    if 'd2ldebug' in kwargs:
-        d = kwargs['d2ldebug']
-        del kwargs['d2ldebug']
-
-    s = requests.Session()
-    # set the session default values
-    s.auth = kwargs['auth']
-    s.verify = kwargs['verify']
-    if kwargs['headers']:
-        s.headers.update(kwargs['headers'])
-    if kwargs['params']:
-        s.params.update(kwargs['params'])
-
-    # Build PreppedRequest
-    p = requests.Request('POST',
-                         uc.scheme + '://' + uc.host + route,
-                         data = kwargs['data'],
-                         auth = s.auth,
-                         headers = s.headers,
-                         params = s.params).prepare()
-
-    # overlay the multipart content type header
-    p.headers.update(ctype_header)
-    if d:
-        d.add_request(p)
-    r = s.send(p)
-    return _fetch_content(r,debug=d)
+                e.add_file(f,name='file '+str(i))
+    return _multipart_post(route,uc,e,**kwargs)
 
 def create_attachment_for_newsitem(uc,org_unit_id,news_item_id,d2l_file,ver='1.0',**kwargs):
     if not isinstance(d2l_file, d2ldata.D2LFile):
         raise TypeError('File must implement d2lvalence.data.D2LFile').with_traceback(sys.exc_info()[2])
     route = '/d2l/api/le/{0}/{1}/news/{2}/attachments/'.format(ver,org_unit_id,news_item_id)
 
-    boundary = uuid.uuid4().hex
-    f = d2l_file
-    f.Stream.seek(0)
-    fdata = f.Stream.read()
-    f.Stream.seek(0)
-
-    pdescr = '--{0}\r\nContent-Disposition: form-data; name="file"; filename="{1}"\r\nContent-Type: {2}\r\n\r\n'.format(boundary,f.Name,f.ContentType).encode(encoding='utf-8')
-    pbotbound = '\r\n--{0}--'.format(boundary).encode(encoding='utf-8')
-
-    payload = pdescr + fdata + pbotbound
-
-    ctype_header = {'Content-Type':'multipart/form-data,boundary='+boundary}
-
-    # populate the default state of the passed in kwargs that we care about
-    kwargs.setdefault('auth',uc)
-    kwargs.setdefault('data',payload)
-    kwargs.setdefault('files',None)
-    kwargs.setdefault('params',None)
-    kwargs.setdefault('headers',None)
-    kwargs.setdefault('verify',True)
-    d = None
-    if 'd2ldebug' in kwargs:
-        d = kwargs['d2ldebug']
-        del kwargs['d2ldebug']
-
-    s = requests.Session()
-    # set the session default values
-    s.auth = kwargs['auth']
-    s.verify = kwargs['verify']
-    if kwargs['headers']:
-        s.headers.update(kwargs['headers'])
-    if kwargs['params']:
-        s.params.update(kwargs['params'])
-
-    # Build PreppedRequest
-    p = requests.Request('POST',
-                         uc.scheme + '://' + uc.host + route,
-                         data = kwargs['data'],
-                         auth = s.auth,
-                         headers = s.headers,
-                         params = s.params).prepare()
-
-    # overlay the multipart content type header
-    p.headers.update(ctype_header)
-    if d:
-        d.add_request(p)
-    r = s.send(p)
-    return _fetch_content(r,debug=d)
+    e = d2lmultipart.MultipartEncoder('form-data')
+    e.add_file(d2l_file,name='file')
+    return _multipart_post(route,uc,e,**kwargs)
 
 
 ## Calendar routes
@@ -1460,22 +1786,24 @@ def delete_content_topic(uc,org_unit_id,topic_id,ver='1.0',**kwargs):
 
 def get_content_module(uc,org_unit_id,module_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/content/modules/{2}'.format(ver,org_unit_id,module_id)
-    return d2ldata.ContentObjectModule(_get(route,uc,**kwargs))
+    return d2ldata.ContentObjectModule.adopt(_get(route,uc,**kwargs))
+
+def _content_object(r):
+    if 'Type' in r:
+        if r['Type'] == 0:
+            return d2ldata.ContentObjectModule.adopt(r)
+        elif r['Type'] == 1:
+            return d2ldata.ContentObjectTopic.adopt(r)
+    return r
 
-def get_content_module_structure(uc,org_unit_id,module_id,ver='1.0',**kwargs):
+def get_content_module_structure(uc,org_unit_id,module_id,ver='1.0',lazy=False,**kwargs):
     route = '/d2l/api/le/{0}/{1}/content/modules/{2}/structure/'.format(ver,org_unit_id,module_id)
     r = _get(route,uc,**kwargs)
+    if lazy:
+        return d2ldata.D2LLazyList(r,_content_object)
     result = []
     for i in range(len(r)):
-        if 'Type' in r[i]:
-            if r[i]['Type'] == 0:
-                result.append(d2ldata.ContentObjectModule(r[i]))
-            elif r[i]['Type'] == 1:
-                result.append(d2ldata.ContentObjectTopic(r[i]))
-            else:
-                result.append(r[i])
-        else:
-            result.append(r[i])
+        result.append(_content_object(r[i]))
     return result
 
 def get_content_root_modules(uc,org_unit_id,ver='1.0',**kwargs):
@@ -1483,12 +1811,12 @@ def get_content_root_modules(uc,org_unit_id,ver='1.0',**kwargs):
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.ContentObjectModule(r[i]))
+        result.append(d2ldata.ContentObjectModule.adopt(r[i]))
     return result
 
 def get_content_topic(uc,org_unit_id,topic_id,ver='1.0',**kwargs):
     route = '/d2l/api/le/{0}/{1}/content/topics/{2}'.format(ver,org_unit_id,topic_id)
-    return d2ldata.ContentObjectTopic(_get(route,uc,**kwargs))
+    return d2ldata.ContentObjectTopic.adopt(_get(route,uc,**kwargs))
 
 def create_content_new_module(uc,org_unit_id,module_id,new_module_data,ver='1.0',**kwargs):
     if not isinstance(new_module_data, d2ldata.ContentObjectModuleData):
@@ -1550,11 +1878,11 @@ def get_learning_objects_by_search(uc,cql_string,offset,count,repo_list,ver='1.0
     r = _get(route,uc,**kwargs)
     result = None
     if ('ExecutionStatus' in r):
-        result = d2ldata.LRWSSearchResultCollection(r)
+        result = d2ldata.LRWSSearchResultCollection.adopt(r)
         if (r['ExecutionStatus'] == 0) and ('Results' in r):
             t = []
             for i in range(len(r['Results'])):
-                           t.append(d2ldata.LRWSSearchResult(r['Results'][i]))
+                           t.append(d2ldata.LRWSSearchResult.adopt(r['Results'][i]))
             result.props['Results']=t
 
     return result
@@ -1565,11 +1893,11 @@ def get_learning_object(uc,object_id,ver='1.0',**kwargs):
 
 def get_learning_object_link(uc,object_id,ver='1.0',**kwargs):
     route = '/d2l/api/lr/{0}/objects/{1}/link/'.format(ver,object_id)
-    return d2ldata.LRWSObjectLink(_get(route,uc,**kwargs))
+    return d2ldata.LRWSObjectLink.adopt(_get(route,uc,**kwargs))
 
 def get_learning_object_properties(uc,object_id,ver='1.0',**kwargs):
     route = '/d2l/api/lr/{0}/objects/{1}/properties/'.format(ver,object_id)
-    return d2ldata.LRWSObjectProperties(_get(route,uc,**kwargs))
+    return d2ldata.LRWSObjectProperties.adopt(_get(route,uc,**kwargs))
 
 def get_learning_object_version(uc,object_id,object_ver,ver='1.0',**kwargs):
     route = '/d2l/api/lr/{0}/objects/{1}/{2}/download/'.format(ver,object_id,object_ver)
@@ -1577,7 +1905,7 @@ def get_learning_object_version(uc,object_id,object_ver,ver='1.0',**kwargs):
 
 def get_learning_object_link_version(uc,object_id,object_ver,ver='1.0',**kwargs):
     route = '/d2l/api/lr/{0}/objects/{1}/{2}/link/'.format(ver,object_id,object_ver)
-    return d2ldata.LRWSObjectLink(_get(route,uc,**kwargs))
+    return d2ldata.LRWSObjectLink.adopt(_get(route,uc,**kwargs))
 
 def get_learning_object_metadata_version(uc,object_id,object_ver,ver='1.0',**kwargs):
     route = '/d2l/api/lr/{0}/objects/{1}/{2}/metadata/'.format(ver,object_id,object_ver)
@@ -1585,7 +1913,7 @@ def get_learning_object_metadata_version(uc,object_id,object_ver,ver='1.0',**kwa
 
 def get_learning_object_properties_version(uc,object_id,object_ver,ver='1.0',**kwargs):
     route = '/d2l/api/lr/{0}/objects/{1}/{2}/properties/'.format(ver,object_id)
-    return d2ldata.LRWSObjectProperties(_get(route,uc,**kwargs))
+    return d2ldata.LRWSObjectProperties.adopt(_get(route,uc,**kwargs))
 
 def delete_learning_object(uc,object_id,ver='1.0',**kwargs):
     route = '/d2l/api/lr/{0}/objects/{1}/delete/'.format(ver,object_id)
@@ -1595,10 +1923,10 @@ def update_learning_object(uc,object_id,d2l_file,ver='1.0',**kwargs):
     if not isinstance(d2l_file, d2ldata.D2LFile):
         raise TypeError('File must implement d2lvalence.data.D2LFile').with_traceback(sys.exc_info()[2])
     route = '/d2l/api/lr/{0}/objects/{1}/'.format(ver,object_id)
-    kwargs.setdefault('files',{})
-    kwargs['files'].update({'Resource': (d2l_file.Name, d2l_file.Stream)})
-    r = _post(route,uc,**kwargs)
-    return d2ldata.LRWSPublishResult(r)
+    e = d2lmultipart.MultipartEncoder('form-data')
+    e.add_file(d2l_file,name='Resource')
+    r = _multipart_post(route,uc,e,**kwargs)
+    return d2ldata.LRWSPublishResult.adopt(r)
 
 def update_learning_object_properties(uc,object_id,new_props,ver='1.0',**kwargs):
     if not isinstance(new_props, d2ldata.LRWSObjectPropertiesInput):
@@ -1618,12 +1946,12 @@ def create_new_learning_object(uc,repo_id,d2l_file,ver='1.0',**kwargs):
     if not isinstance(d2l_file, d2ldata.D2LFile):
         raise TypeError('File must implement d2lvalence.data.D2LFile').with_traceback(sys.exc_info()[2])
     route = '/d2l/api/lr/{0}/objects/'.format(ver)
-    kwargs.setdefault('files',{})
     kwargs.setdefault('params',{})
-    kwargs['files'].update({'Resource': (d2l_file.Name, d2l_file.Stream)})
     kwargs['params'].update({'repositoryId': repo_id})
-    r = _put(route,uc,**kwargs)
-    return d2ldata.LRWSPublishResult(r)
+    e = d2lmultipart.MultipartEncoder('form-data')
+    e.add_file(d2l_file,name='Resource')
+    r = _multipart_put(route,uc,e,**kwargs)
+    return d2ldata.LRWSPublishResult.adopt(r)
 
 ## ePortfolio routes
 
@@ -1642,61 +1970,12 @@ def start_ep_import_task(uc,ep_import_package,user_id_list=None,import_with_deta
     else:
         route = '/d2l/api/eP/{0}/import/new'.format(ver)
 
-    boundary = uuid.uuid4().hex
-    pbotbound = '\r\n--{0}--'.format(boundary).encode(encoding='utf-8')
-
-    puids = b''
+    e = d2lmultipart.MultipartEncoder('form-data')
     if user_id_list:
         for i in range(len(user_id_list)):
-            puids = puids + '\r\n--{0}\r\nContent-Disposition: form-data; name="targetUsers"\r\nContent-Type: text/plain\r\n\r\n{1}'.format(boundary,str(user_id_list[i])).encode(encoding='utf-8')
-
-    f = ep_import_package
-    f.Stream.seek(0)
-    fdata = f.Stream.read()
-    f.Stream.seek(0)
-    ppkg = '\r\n--{0}\r\nContent-Disposition: form-data; name="file"; filename="{1}"\r\nContent-Type: {2}\r\n\r\n'.format(boundary, f.Name, f.ContentType).encode(encoding='utf-8') + fdata
-
-    payload = puids + ppkg + pbotbound
-
-    ctype_header = {'Content-Type':'multipart/form-data; boundary='+boundary}
-
-    kwargs.setdefault('auth',uc)
-    kwargs.setdefault('data',payload)
-    kwargs.setdefault('files',None)
-    kwargs.setdefault('params',None)
-    kwargs.setdefault('headers',None)
-    kwargs.setdefault('verify',True)
-    d = None
-    if 'd2ldebug' in kwargs and not isinstance(kwargs['d2ldebug'], d2ldata.D2LDebugInfo):
-        raise TypeError('If not None, debug info object must implement d2lvalence.data.D2LDebugInfo')
-    elif 'd2ldebug' in kwargs:
-        d = kwargs['d2ldebug']
-        kwargs['d2ldebug'] = None
-        del kwargs['d2ldebug']
-
-    s = requests.Session()
-    # set the default sesion values
-    s.auth = kwargs['auth']
-    s.verify = kwargs['verify']
-    if kwargs['headers']:
-        s.headers.update(kwargs['headers'])
-    if kwargs['params']:
-        s.params.update(kwargs['params'])
-
-    # Build PreppedRequest
-    p = requests.Request('POST',
-                         uc.scheme + '://' + uc.host + route,
-                         data = kwargs['data'],
-                         auth = s.auth,
-                         headers = s.headers,
-                         params = s.params).prepare()
-
-    # overlay the multipart content type header
-    p.headers.update(ctype_header)
-    if d:
-        d.add_request(p)
-    r = s.send(p)
-    return _fetch_content(r,debug=d)
+            e.add_text('targetUsers',user_id_list[i])
+    e.add_file(ep_import_package,name='file')
+    return _multipart_post(route,uc,e,**kwargs)
 
 def start_ep_export_all_task(uc,ver='2.0',**kwargs):
     route = '/d2l/api/eP/{0}/export/new/all'.format(ver)
@@ -1747,10 +2026,10 @@ def get_lti_tool_providers_for_orgunit(uc,org_unit_id,ver='1.3',**kwargs):
     r = _get(route,uc,**kwargs)
     result = []
     for i in range(len(r)):
-        result.append(d2ldata.LTIToolProviderData(r[i]))
+        result.append(d2ldata.LTIToolProviderData.adopt(r[i]))
     return result
 
 
 def get_lti_tool_provider_info(uc,org_unit_id,tool_provider_id,ver='1.3',**kwargs):
     route = '/d2l/api/le/{0}/lti/tp/{1}/{2}'.format(ver,org_unit_id,tool_provider_id)
-    return d2ldata.LTITooProviderData(_get(route,uc,**kwargs))
+    return d2ldata.LTITooProviderData.adopt(_get(route,uc,**kwargs))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, session module.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""
+:module: d2lvalence_util.session
+:synopsis: Provides a pooled, keep-alive HTTP session for making D2L Valence calls.
+"""
+import requests     # for making HTTP requests of the back-end service
+import requests.adapters
+
+
+class D2LSession(requests.Session):
+    """Keep-alive HTTP session for making many Valence calls against one LMS host.
+
+    A `D2LSession` owns a pool of persistent connections, so a run of service
+    calls pays for the TCP and TLS handshakes once instead of once per call.
+    Pass an instance down to any `service` function in the `d2lsession`
+    keyword parameter, or install one as the module-wide default with
+    :func:`d2lvalence_util.service.set_default_session`.
+
+    Instances are safe to share between threads: each thread draws its own
+    connection from the pool, and the pool blocks (if `pool_block` is set) or
+    opens a throwaway connection when all `pool_maxsize` connections are busy.
+    """
+    # false for sessions that stand in for the network rather than using it;
+    # the service layer only applies rate limiting and the like to calls made
+    # through sessions that transmit
+    transmits = True
+
+    def __init__(self,host=None,pool_connections=1,pool_maxsize=10,pool_block=False):
+        """Construct a new pooled session.
+
+        :param host:
+            Host (and optional port) this session serves; if provided, the
+            service layer refuses to send calls for other hosts through it.
+        :param pool_connections:
+            Number of per-host connection pools to keep around.
+        :param pool_maxsize:
+            Maximum number of connections to keep open to any one host.
+        :param pool_block:
+            If true, callers wait for a free connection when the pool is
+            exhausted rather than opening an extra, non-pooled connection.
+        """
+        requests.Session.__init__(self)
+        self.host = host
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                                pool_maxsize=pool_maxsize,
+                                                pool_block=pool_block)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    @staticmethod
+    def fashion_D2LSession(uc,pool_maxsize=10,pool_block=False):
+        """Build a session bound to the host of the provided user context."""
+        return D2LSession(host=uc.host,pool_maxsize=pool_maxsize,pool_block=pool_block)
+
+    def check_host(self,uc):
+        if self.host and self.host != uc.host:
+            raise ValueError('Session serves host {0}, not {1}.'.format(self.host,uc.host))
+        return True
@@ -42,6 +42,11 @@ setup(
         'd2lvalence >= 1.0.0',
         'requests >= 1.2.0',
         ],
+    extras_require={
+        'async': ['aiohttp'],
+        'fastjson': ['orjson'],
+        'numpy': ['numpy'],
+        },
     license=open('LICENSE').read(),
     classifiers=(
         'Development Status :: 3 - Alpha',
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, aioservice module tests.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import asyncio
+import inspect
+import unittest
+
+import d2lvalence_util.service as d2lservice
+
+try:
+    import d2lvalence_util.aioservice as d2laioservice
+except ImportError:
+    d2laioservice = None
+
+
+@unittest.skipIf(d2laioservice is None, 'aiohttp not installed')
+class MirrorTestCase(unittest.TestCase):
+
+    def test_every_route_function_mirrored(self):
+        for name, fn in vars(d2lservice).items():
+            if (inspect.isfunction(fn) and fn.__module__ == d2lservice.__name__
+                    and not name.startswith(('_', 'iter_'))
+                    and list(inspect.signature(fn).parameters)[:1] == ['uc']):
+                mirror = getattr(d2laioservice, name, None)
+                self.assertTrue(inspect.iscoroutinefunction(mirror), name)
+                self.assertIs(mirror.__wrapped__, fn)
+
+    def test_loop_session_shared_and_closed(self):
+        async def sessions():
+            s = await d2laioservice._loop_session()
+            s._get_client()
+            return s, await d2laioservice._loop_session()
+
+        a, b = asyncio.run(sessions())
+        self.assertIs(a, b)
+        self.assertIsNone(a._client)
+        self.assertEqual(len(d2laioservice._loop_sessions), 0)
+        c, _ = asyncio.run(sessions())
+        self.assertIsNot(a, c)
+
+
+if __name__ == '__main__':
+    unittest.main()
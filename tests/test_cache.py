@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, cache module tests.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+import http.server
+
+import d2lvalence.auth as d2lauth
+
+import d2lvalence_util.cache as d2lcache
+import d2lvalence_util.service as d2lservice
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self,*args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = json.dumps({'Identifier': '6606', 'Name': 'Dev',
+                           'TimeZone': 'America/Toronto'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class OfflineReplayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever,daemon=True).start()
+        self.dir = tempfile.mkdtemp()
+        ac = d2lauth.fashion_app_context(app_id='app',app_key='key')
+        self.uc = ac.create_user_context(d2l_user_context_props_dict={
+            'host': '127.0.0.1:{0}'.format(self.server.server_address[1]),
+            'user_id': 'user', 'user_key': 'key', 'scheme': 'http',
+            'encrypt_requests': False, 'server_skew': 0})
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def _cache(self,offline=False):
+        backend = d2lcache.SQLiteBackend(os.path.join(self.dir, 'run.db'))
+        return d2lcache.ResponseCache(routes=d2lcache.ALL_ROUTES,backend=backend,offline=offline)
+
+    def test_record_then_replay(self):
+        c = self._cache()
+        org = d2lservice.get_organization_info(self.uc,d2lcache=c)
+        self.assertEqual(org.Identifier, '6606')
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(c.stats()['entries'], 1)
+        c.backend.close()
+
+        c = self._cache(offline=True)
+        org = d2lservice.get_organization_info(self.uc,d2lcache=c)
+        self.assertEqual(org.Name, 'Dev')
+        self.assertEqual(len(self.server.requests), 1)
+        with self.assertRaises(d2lcache.CacheMiss):
+            d2lservice.get_whoami(self.uc,d2lcache=c)
+        c.backend.close()
+
+    def test_all_routes_stay_fresh(self):
+        c = d2lcache.ResponseCache(routes=d2lcache.ALL_ROUTES)
+        d2lservice.get_organization_info(self.uc,d2lcache=c)
+        d2lservice.get_organization_info(self.uc,d2lcache=c)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(c.stats()['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, data module tests.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+import d2lvalence_util.data as d2ldata
+
+
+class DownloadResumeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'file.zip')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _cut_short(self):
+        # a first run that wrote part of the file, then died
+        dl = d2ldata.D2LDownload(self.path)
+        dl.begin()
+        r = requests.Response()
+        r.status_code = 200
+        r.headers['ETag'] = '"v1"'
+        r.headers['Content-Length'] = '10'
+        dl.accept(r)
+        dl.write(b'01234')
+        dl.end()
+
+    def test_resume_with_kept_validator(self):
+        self._cut_short()
+        dl = d2ldata.D2LDownload(self.path,resume=True)
+        self.assertEqual(dl.begin(), 5)
+        self.assertEqual(dl.ETag, '"v1"')
+        dl.write(b'56789')
+        dl.finish()
+        dl.end()
+        self.assertFalse(os.path.exists(self.path + '.d2lresume'))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+
+    def test_restart_without_validator(self):
+        self._cut_short()
+        os.remove(self.path + '.d2lresume')
+        dl = d2ldata.D2LDownload(self.path,resume=True)
+        self.assertEqual(dl.begin(), 0)
+        self.assertIsNone(dl.ETag)
+        dl.end()
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
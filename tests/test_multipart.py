@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, multipart module tests.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import io
+import os
+import tempfile
+import unittest
+
+import d2lvalence_util.data as d2ldata
+import d2lvalence_util.multipart as d2lmultipart
+
+
+class AddFileTestCase(unittest.TestCase):
+
+    def _body(self,f):
+        enc = d2lmultipart.MultipartEncoder(subtype='form-data',boundary='xxBOUNDARYxx')
+        enc.add_file(f,name='profileImage')
+        return bytes(enc.body())
+
+    def test_content_type(self):
+        f = d2ldata.D2LFile({'Name': 'me.png',
+                             'ContentType': 'image/png',
+                             'Stream': io.BytesIO(b'\x89PNG')})
+        body = self._body(f)
+        self.assertIn(b'filename="me.png"\r\nContent-Type: image/png\r\n\r\n\x89PNG', body)
+
+    def test_no_content_type(self):
+        f = d2ldata.D2LFile({'Name': 'me.png', 'Stream': io.BytesIO(b'\x89PNG')})
+        body = self._body(f)
+        self.assertIn(b'filename="me.png"\r\nContent-Type: application/octet-stream\r\n\r\n\x89PNG', body)
+
+
+class MappedBodyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(bytes(range(256)) * 4)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _body(self,f):
+        enc = d2lmultipart.MultipartEncoder(subtype='form-data',boundary='xxBOUNDARYxx',chunk_size=100)
+        enc.add_file(f,name='file')
+        return enc.body()
+
+    def _check(self,body):
+        whole = bytes(body)
+        self.assertEqual(len(whole), len(body))
+        self.assertIn(bytes(range(256)) * 4 + b'\r\n--xxBOUNDARYxx--', whole)
+        self.assertEqual(b''.join(bytes(chunk) for chunk in body), whole)
+        self.assertEqual(bytes(body), whole)
+
+    def test_path(self):
+        self._check(self._body(d2ldata.D2LFile({'Name': 'data.bin', 'Path': self.path})))
+
+    def test_file_stream(self):
+        with open(self.path, 'rb') as stream:
+            self._check(self._body(d2ldata.D2LFile({'Name': 'data.bin', 'Stream': stream})))
+
+
+if __name__ == '__main__':
+    unittest.main()
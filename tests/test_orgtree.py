@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# D2LValence package, orgtree module tests.
+#
+# Copyright (c) 2013 Desire2Learn Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the license at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import re
+import json
+import threading
+import unittest
+import http.server
+import socketserver
+
+import d2lvalence.auth as d2lauth
+
+import d2lvalence_util.orgtree as d2lorgtree
+
+_TYPES = {1: 'Organization', 2: 'Department', 3: 'Course Offering', 5: 'Section'}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self,*args):
+        pass
+
+    def _unit(self,ou):
+        t, name = self.server.units[ou]
+        return {'Identifier': str(ou), 'Name': name, 'Code': 'c{0}'.format(ou),
+                'Type': {'Id': t, 'Code': _TYPES[t], 'Name': _TYPES[t]}}
+
+    def do_GET(self):
+        srv = self.server
+        path = self.path.split('?')[0]
+        srv.requests.append(path)
+        body = None
+        m = re.match(r'^/d2l/api/lp/[^/]+/orgstructure/(\d+)(/children/|/parents/|/descendants/)?$', path)
+        if path.endswith('/organization/info'):
+            body = {'Identifier': str(srv.root), 'Name': 'Org', 'TimeZone': 'UTC'}
+        elif m and int(m.group(1)) in srv.units:
+            ou = int(m.group(1))
+            if m.group(2) is None:
+                body = self._unit(ou)
+            elif m.group(2) == '/children/':
+                body = [self._unit(c) for c in srv.edges.get(ou, ())]
+            elif m.group(2) == '/parents/':
+                body = [self._unit(p) for p, kids in srv.edges.items() if ou in kids]
+            else:
+                found, stack = [], list(srv.edges.get(ou, ()))
+                while stack:
+                    c = stack.pop()
+                    if c not in found:
+                        found.append(c)
+                        stack.extend(srv.edges.get(c, ()))
+                body = [self._unit(c) for c in found]
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(200 if body is not None else 404)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class SyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.requests = []
+        self.server.root = 6606
+        self.server.units = {6606: (1, 'Org'), 10: (2, 'Dept A'), 11: (2, 'Dept B'),
+                             100: (3, 'Course 100'), 101: (3, 'Course 101'), 1000: (5, 'Section 1000')}
+        self.server.edges = {6606: [10, 11], 10: [100, 101], 100: [1000]}
+        threading.Thread(target=self.server.serve_forever,daemon=True).start()
+        ac = d2lauth.fashion_app_context(app_id='app',app_key='key')
+        self.uc = ac.create_user_context(d2l_user_context_props_dict={
+            'host': '127.0.0.1:{0}'.format(self.server.server_address[1]),
+            'user_id': 'user', 'user_key': 'key', 'scheme': 'http',
+            'encrypt_requests': False, 'server_skew': 0})
+        self.tree = d2lorgtree.OrgTree(self.uc,leaf_type_ids=[5],max_workers=2)
+        self.tree.refresh()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_move_between_siblings(self):
+        self.server.edges[10] = [100]
+        self.server.edges[11] = [101]
+        del self.server.requests[:]
+        diff = self.tree.sync()
+        self.assertEqual(diff.Moved, {101: ((10,), (11,))})
+        self.assertFalse(diff.Added or diff.Removed or diff.Changed)
+        self.assertEqual(self.tree.children(10,ids=True), [100])
+        self.assertEqual(self.tree.children(11,ids=True), [101])
+        self.assertEqual(self.tree.parents(101,ids=True), [11])
+        self.assertFalse([p for p in self.server.requests if p.endswith('/descendants/')])
+
+    def test_move_out_of_scope(self):
+        self.server.edges[10] = [100]
+        self.server.edges[11] = [101]
+        diff = self.tree.sync([10])
+        self.assertEqual(diff.Moved, {101: ((10,), (11,))})
+        self.assertEqual(self.tree.children(11,ids=True), [101])
+
+    def test_removed(self):
+        self.server.edges[100] = []
+        del self.server.units[1000]
+        diff = self.tree.sync()
+        self.assertEqual(diff.Removed, {1000})
+        self.assertNotIn(1000, self.tree)
+
+
+if __name__ == '__main__':
+    unittest.main()